@@ -0,0 +1,98 @@
+"""
+Upper bounds on what any allocation can achieve with a capacity vector, without allocating.
+
+- 1st choices: a subject can give at most min(capacity, students with it as 1st choice) 1st choices, so the bound is
+  the sum of that over the subjects, read from the per-subject 1st choice counters. allocate_1st_choice always reaches it.
+- Students placed: a max flow from the students to the subjects, limited by the capacities. Students with the same set
+  of choices are interchangeable, so they share one node and the graph only depends on the number of distinct sets,
+  which is counted once per import. Everyone can be placed exactly when Hall's condition holds: every group of students
+  has at least as many seats in the subjects they chose as there are students in it.
+  When it fails, the subjects reachable in the residual graph are the ones that are short: the students who chose only
+  among them outnumber their seats, so some of those subjects need more seats before everyone fits.
+
+The heuristic mode only tries to place the students left without a choice after its greedy passes, and every swap that
+succeeds places one of them. Once the students placed reach the bound none of them can succeed, so they are skipped.
+The max flow is not free (about 0.1 s for 100000 students), so the last CHECKED_ENTRIES checks are kept: the desktop app
+and cli.py check the capacities before allocating, and the allocation then reuses that check instead of running it again.
+"""
+
+import numpy as np
+
+from min_cost_flow import MinCostFlow
+
+VIOLATION = 0  # Same as allocation_engine.VIOLATION
+CHECKED_ENTRIES = 32  # Capacity vectors whose check is kept, see check
+
+
+class AllocationBounds(object):
+    def __init__(self, choices, subject_num):
+        # choices: N x k subject ids (AllocationEngine.choice_matrix). subject_num counts VIOLATION.
+        self.students = len(choices)
+        self.subject_num = subject_num
+        self.first_demand = np.bincount(choices[:, 0], minlength=subject_num) if len(choices) else np.zeros(subject_num, int)
+        self.choice_sets = []  # Distinct sets of choices, VIOLATION left out
+        self.set_counts = []  # Students with each of them
+        if len(choices):
+            sets, counts = np.unique(np.sort(choices, axis=1), axis=0, return_counts=True)
+            for row, count in zip(sets.tolist(), counts.tolist()):
+                self.choice_sets.append(sorted(set(row) - {VIOLATION}))
+                self.set_counts.append(count)
+        self.checked = []  # (capacity, check) of the last CHECKED_ENTRIES vectors checked, newest last
+
+    def first_choice_bound(self, capacity):
+        return int(np.minimum(self.first_demand, capacity).sum())
+
+    def placed_bound(self, capacity):
+        # (most students placed, subject ids short of seats). No subjects are short when everyone can be placed.
+        source, sink = 0, 1
+        flow = MinCostFlow(2 + self.subject_num + len(self.choice_sets))
+        for subject in range(1, self.subject_num):
+            flow.add_edge(2 + subject, sink, capacity[subject], 0)
+        for i, (subjects, count) in enumerate(zip(self.choice_sets, self.set_counts)):
+            node = 2 + self.subject_num + i
+            flow.add_edge(source, node, count, 0)
+            for subject in subjects:
+                flow.add_edge(node, 2 + subject, count, 0)
+        placed, _ = flow.solve(source, sink)
+        if placed == self.students:
+            return placed, []
+
+        # Subjects still reachable from the source through edges with capacity left
+        reached = [False] * flow.node_num
+        reached[source] = True
+        stack = [source]
+        while stack:
+            u = stack.pop()
+            for edge in flow.graph[u]:
+                v = flow.to[edge]
+                if flow.cap[edge] > 0 and not reached[v]:
+                    reached[v] = True
+                    stack.append(v)
+        return placed, [subject for subject in range(1, self.subject_num) if reached[2 + subject]]
+
+    def check(self, capacity):
+        # Bounds for capacity (subject id -> seats, as AllocationEngine.capacity), as a plain dict
+        bounds = self.checked_bounds(capacity)
+        if bounds is not None:
+            return bounds
+        placed, short = self.placed_bound(capacity)
+        bounds = {
+            'students': self.students,
+            'subjects': self.subject_num - 1,
+            'seats': int(sum(capacity[1:])),
+            'first_choice': self.first_choice_bound(capacity),
+            'placed': placed,
+            'short_subjects': short
+        }
+        # Replaced in one assignment, so a check on another thread (the desktop app checks while it allocates)
+        # never sees the list half updated
+        self.checked = self.checked[1 - CHECKED_ENTRIES:] + [(tuple(capacity), bounds)]
+        return dict(bounds)
+
+    def checked_bounds(self, capacity):
+        # check(capacity) if it was one of the last CHECKED_ENTRIES checks, else None. Never runs the max flow.
+        capacity = tuple(capacity)
+        for checked, bounds in reversed(self.checked):
+            if checked == capacity:
+                return dict(bounds)
+        return None
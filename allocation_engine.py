@@ -0,0 +1,1214 @@
+"""
+Headless allocation engine.
+
+This holds the whole import -> allocate -> output pipeline that used to live on Ui_MainWindow, without touching Qt.
+The desktop app (main.py) and the command line (cli.py) both drive an AllocationEngine instance.
+"""
+
+import hashlib
+import os
+import sys
+import time
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from allocation_bounds import AllocationBounds
+from allocation_index import AllocationIndex, earliest
+from allocation_stats import AllocationStats
+from cohort_components import find_components, split
+from incremental_allocation import IncrementalAllocation
+from local_search import LocalSearch
+from min_cost_flow import MinCostFlow
+from name_table import NameTable
+from subject_aliases import SubjectAliases, normalize, read_two_columns
+
+ALLOCATION_MODES = ['heuristic', 'optimal']  # heuristic = greedy passes and swap algorithms. optimal = min-cost flow.
+DEFAULT_CHOICE_NUM = 3  # Choices per student before anything is imported. An import takes the number of choice columns.
+SWAP_CHOICES = 3  # The swap algorithms only look at the first 3 choices
+VIOLATION = 0  # Subject id of repeated choices. It always has a capacity of 0.
+UNALLOCATED = -1  # Rank of a student who didn't receive a choice
+DEFAULT_CHUNK_SIZE = 10000  # Rows read from the spreadsheet at a time
+
+
+class AllocationEngine(object):
+    """
+    Overall architecture:
+
+    1. Process data
+    Includes read_spreadsheet_chunks, convert_data_type, check_choice_repetition, process_subjects.
+    These are called from within import_file (or import_df when the dataframe is already loaded).
+    The file is read in chunks. convert_data_type and check_choice_repetition run on every chunk and work on whole columns at once,
+    process_subjects runs once at the end. Every spelling of a subject is mapped to its canonical subject (SubjectAliases)
+    and interned as a small integer id, and every student's choices are stored as k ids (one per choice column) in an N x k
+    matrix, kept row by row in one flat array.
+    Given an ImportCache, import_file skips all of this for a file it has imported before and calls load_import instead.
+
+    2. Allocation
+    Includes the functions under the Allocation label.
+    They are called from within allocate, which takes a dictionary of subject -> capacity and an allocation mode.
+    These are for allocating students by setting their allocated rank (0 = 1st choice, 1 = 2nd, 2 = 3rd, ...).
+    The heuristic mode runs the greedy passes and the 15 swap algorithms over the first 3 choices, then a greedy pass
+    for every further choice, skipping what is left once the students placed reach an upper bound (limit_placement).
+    Given a search budget, local_search then improves the result until the budget runs out.
+    The optimal mode runs optimal_allocate instead, over all k choices.
+
+    The time of every phase, the work done by every optimize round and the successes of every swap algorithm
+    are recorded in an AllocationStats (allocation_stats.py).
+    Given a ResultCache (result_cache.py), allocate restores a capacity vector and mode it has allocated before instead.
+    change_capacity allocates again after a single capacity changed. An optimal allocation is only repaired where needed.
+
+    3. Output
+    Includes summarize_results, allocation_report, form_result_df and output_df. Subject names are only looked up here.
+    """
+
+    def __init__(self, aliases=None):
+        self.aliases = aliases if aliases is not None else SubjectAliases()  # Maps other spellings to one subject
+        self.raw_choices = None  # Only used while importing. N x k array of subject ids of the current chunk.
+        self.spelling_ids = {}  # Only used while importing. Cell text -> (subject id, canonical spelling), so each spelling is only matched once.
+        self.spelling_counts = []  # Only used while importing. Subject id -> {canonical spelling: number of choices written that way}
+        self.name_counts = {}  # Only used while importing. Name as written -> number of students with it so far.
+        self.taken_names = set()  # Only used while importing. Names given to students so far.
+        self.subject_names = []  # Subject id -> subject name. Id 0 is VIOLATION.
+        self.subject_ids = {}  # Subject name -> subject id
+        self.subject_keys = {}  # Normalized subject name -> subject id
+        self.names = NameTable()  # Student position -> student name, in submission order
+        self.choice_num = DEFAULT_CHOICE_NUM  # k, the number of ranked choices of every student
+        self.choices = array('i')  # Choices of student p are choices[k * p] to choices[k * p + k - 1], see choice_matrix
+        self.rank = array('b')  # Student position -> allocated rank, or UNALLOCATED
+        self.capacity = []  # Subject id -> capacity
+        self.allocated = []  # Subject id -> number of already allocated students
+        self.unlucky_students = []  # Positions of students who have not received a choice yet
+        self.index = None  # AllocationIndex over the allocation, built once the greedy passes are done
+        self.incremental = None  # IncrementalAllocation over an optimal allocation, built on its first capacity change
+        self.stats = AllocationStats('heuristic')  # Timings and counters of the last allocation
+        self.from_cache = False  # Whether the last allocation was restored from a ResultCache
+        self.input_fingerprint = None  # Hash of the imported choices, see fingerprint
+        self.bounds = None  # AllocationBounds of the imported choices, see allocation_bounds
+        self.placement_limit = None  # Most students the capacities can place, see limit_placement
+
+    '''
+    Process data
+    '''
+    @staticmethod
+    def is_spreadsheet(filename):
+        return filename[-5:] == '.xlsx' or filename[-4:] == '.csv'
+
+    @staticmethod
+    def read_spreadsheet(filename):
+        # Returns None if the file is not a spreadsheet
+        if filename[-5:] == '.xlsx':
+            return pd.read_excel(filename)
+        elif filename[-4:] == '.csv':
+            return pd.read_csv(filename)
+        return None
+
+    @staticmethod
+    def read_spreadsheet_chunks(filename, chunk_size):
+        # Iterator of dataframes with at most chunk_size rows each, so the whole sheet is never in memory at once
+        if filename[-5:] == '.xlsx':
+            return read_excel_chunks(filename, chunk_size)
+        return pd.read_csv(filename, chunksize=chunk_size)
+
+    def start_import(self):
+        self.subject_keys = {normalize('VIOLATION'): VIOLATION}
+        self.spelling_ids = {}
+        self.spelling_counts = [{'VIOLATION': 0}]
+        self.name_counts = {}
+        self.taken_names = set()
+        self.names = NameTable()
+        self.choices = array('i')
+        self.input_fingerprint = None
+        self.bounds = None
+
+    def convert_data_type(self, df):
+        # Convert one chunk of df into student names and an N x k array of subject ids. Works column by column, never row by row.
+        # Columns: timestamp, name, then the k choices in rank order. Google Forms may add an email address
+        # right after the timestamp or at the end.
+
+        # Trailing columns without a header (trailing commas, a formatted but empty cell) are not choices
+        width = df.shape[1]
+        while width > 0 and is_unnamed(df.columns[width - 1]):
+            width -= 1
+        if width < df.shape[1]:
+            if df.iloc[:, width:].notna().any().any():
+                print(f'ERROR: Column {width + 1} has answers but no header. Please name it or remove it')
+                return False
+            df = df.iloc[:, :width].copy()
+
+        if df.shape[1] > 3 and df.columns[0] == 'Timestamp' and 'Email address' in (df.columns[1], df.columns[-1]):
+            df.drop(['Email address'], axis=1, inplace=True)
+
+        # At least timestamp, name and one choice, and every chunk has the same choices
+        if not (df.shape[1] >= 3 and df.columns[0] == 'Timestamp') or (self.names and df.shape[1] - 2 != self.choice_num):
+            print('ERROR: Spreadsheet format not as expected')
+            return False
+        self.choice_num = df.shape[1] - 2
+
+        # Each distinct spelling is only canonicalized once per import: alias table, then one hash lookup of its normalized name.
+        # Name variations of the same subject therefore share an id from the start.
+        codes, spellings = pd.factorize(df.iloc[:, 2:].to_numpy().ravel())
+        counts = np.bincount(codes[codes >= 0], minlength=len(spellings))
+        ids = []
+        for spelling, count in zip(spellings, counts):
+            if spelling not in self.spelling_ids:
+                subject = self.aliases.canonical(spelling)
+                subject_id = self.subject_keys.setdefault(normalize(subject), len(self.subject_keys))
+                if subject_id == len(self.spelling_counts):
+                    self.spelling_counts.append({})
+                self.spelling_ids[spelling] = (subject_id, subject)
+            subject_id, subject = self.spelling_ids[spelling]
+            written = self.spelling_counts[subject_id]
+            written[subject] = written.get(subject, 0) + int(count)
+            ids.append(subject_id)
+        ids.append(VIOLATION)  # Blank cells get code -1, which picks this last entry: a blank choice can't be allocated
+        self.raw_choices = np.array(ids, dtype=np.intc)[codes].reshape(-1, self.choice_num)
+
+        # Exact same names get _2, _3, ... in submission order, also across chunks
+        names = df.iloc[:, 1].astype(str)
+        occurrence = names.groupby(names).cumcount() + names.map(self.name_counts).fillna(0).astype(int)
+        for name, count in names.value_counts().items():
+            self.name_counts[name] = self.name_counts.get(name, 0) + count
+        names = names.where(occurrence == 0, names + '_' + (occurrence + 1).astype(str)).tolist()
+        if self.taken_names.isdisjoint(names) and len(set(names)) == len(names):
+            self.taken_names.update(names)
+        else:  # Rare: a renamed student clashes with someone already called e.g. Name_2
+            names = [self.unique_name(name) for name in names]
+        self.names.extend(names)
+
+        return True
+
+    def unique_name(self, name):
+        while name in self.taken_names:
+            name += '_2'
+        self.taken_names.add(name)
+        return name
+
+    def check_choice_repetition(self):
+        # A choice that repeats an earlier choice of the same student becomes VIOLATION,
+        # then the chunk is added to the student choices
+        choices = self.raw_choices
+        repeated = np.zeros(choices.shape, dtype=bool)
+        for j in range(1, choices.shape[1]):
+            repeated[:, j] = (choices[:, :j] == choices[:, j:j + 1]).any(axis=1)
+        choices[repeated] = VIOLATION
+        self.choices.frombytes(choices.tobytes())
+        self.raw_choices = None
+
+    def process_subjects(self):
+        # Runs once all chunks are in. Subject ids are in the order subjects first appear in student choices.
+        # Name variations already share an id. Each subject is named after the spelling most students used (the first one on a tie).
+        self.subject_names = []
+        for written in self.spelling_counts:
+            if len(written) > 1:
+                print(f"NOTE: Name variations of the same subject merged ({' AND '.join(written)})")
+            self.subject_names.append(max(written, key=written.get))
+        self.subject_names[VIOLATION] = 'VIOLATION'
+        self.subject_ids = {subject: i for i, subject in enumerate(self.subject_names)}
+        self.capacity = [0] * len(self.subject_names)
+        self.allocated = [0] * len(self.subject_names)
+        self.spelling_ids, self.spelling_counts, self.name_counts, self.taken_names = {}, [], {}, set()
+
+    def subject_id(self, subject):
+        # Id of a subject written any way the students could have written it, or None if no student chose it
+        if subject in self.subject_ids:
+            return self.subject_ids[subject]
+        return self.subject_keys.get(normalize(self.aliases.canonical(subject)))
+
+    def fingerprint(self):
+        # Hash of everything the allocation depends on besides the capacities: the subjects and every student's choices.
+        # Computed once per import.
+        if self.input_fingerprint is None:
+            digest = hashlib.sha256('\n'.join([str(self.choice_num)] + self.subject_names).encode('utf-8'))
+            digest.update(self.choices.tobytes())
+            self.input_fingerprint = digest.hexdigest()
+        return self.input_fingerprint
+
+    def subjects(self):
+        # Subjects that need a capacity, in the order they are displayed
+        return self.subject_names[1:]
+
+    def student_choices(self, position):
+        k = self.choice_num
+        return self.choices[k * position: k * position + k]
+
+    def choice_labels(self):
+        # '1st', '2nd', ... for every choice
+        return rank_labels(self.choice_num)
+
+    def choice_matrix(self):
+        # The choices as an N x k numpy array sharing memory with self.choices
+        return np.frombuffer(self.choices, dtype=np.intc).reshape(-1, self.choice_num)
+
+    def demand_counts(self):
+        # Subject id -> number of students with it as 1st, 2nd, ... choice, as an S x k numpy array
+        choices = self.choice_matrix()
+        return np.stack([np.bincount(choices[:, i], minlength=len(self.subject_names)) for i in range(self.choice_num)], axis=1)
+
+    def allocation_bounds(self):
+        # Built once per import, see allocation_bounds.py
+        if self.bounds is None:
+            self.bounds = AllocationBounds(self.choice_matrix(), len(self.subject_names))
+        return self.bounds
+
+    def import_file(self, filename, chunk_size=DEFAULT_CHUNK_SIZE, progress=None, cache=None):
+        # Returns False if the file is not a spreadsheet or the spreadsheet format is incorrect
+        # The file is read chunk_size rows at a time. progress(rows) is called after every chunk with the rows imported so far.
+        # cache: an ImportCache (import_cache.py). An unchanged file that was imported before is loaded from it without parsing.
+        if not self.is_spreadsheet(filename):
+            print('ERROR: Import format incorrect. Please ensure you are importing a spreadsheet (xlsx or csv)')
+            return False
+        if cache is None:
+            return self.import_chunks(self.read_spreadsheet_chunks(filename, chunk_size), progress)
+
+        key = cache.key(filename, self.aliases)
+        if cache.load(key, self):
+            if progress is not None:
+                progress(len(self.names))
+            return True
+        if not self.import_chunks(self.read_spreadsheet_chunks(filename, chunk_size), progress):
+            return False
+        cache.store(key, self)
+        return True
+
+    def load_import(self, names, choices, subject_names, bounds=None):
+        # Set the state import_chunks leaves behind from already imported data (the import cache)
+        # choices: N x k subject ids. bounds: the AllocationBounds of the same choices in any order, if already built.
+        choices = np.ascontiguousarray(choices, dtype=np.intc)
+        self.names = names if isinstance(names, NameTable) else NameTable(names)
+        self.choice_num = choices.shape[1]
+        self.choices = array('i', choices.tobytes())
+        self.subject_names = list(subject_names)
+        self.subject_ids = {subject: i for i, subject in enumerate(self.subject_names)}
+        # A subject can be named after a spelling the alias table maps elsewhere, so it is keyed by what that spelling maps to
+        self.subject_keys = {normalize(self.aliases.canonical(subject)): i for i, subject in enumerate(self.subject_names)}
+        self.subject_keys[normalize('VIOLATION')] = VIOLATION
+        self.capacity = [0] * len(self.subject_names)
+        self.allocated = [0] * len(self.subject_names)
+        self.rank = array('b', [UNALLOCATED]) * len(self.names)
+        self.input_fingerprint = None
+        self.bounds = bounds
+
+    def reorder_choices(self, choices):
+        # Replace the choices by the same students' choices in another order (fairness.py), in place.
+        # The subjects, their ids and the bounds do not depend on the order, so nothing is interned or built again.
+        # The names keep their order, they are not used to allocate.
+        np.frombuffer(self.choices, dtype=np.intc)[:] = np.ravel(choices)
+        self.input_fingerprint = None
+
+    def import_df(self, df):
+        return self.import_chunks([df])
+
+    def import_chunks(self, chunks, progress=None):
+        self.start_import()
+        for chunk in chunks:
+            if not self.convert_data_type(chunk):
+                return False
+            self.check_choice_repetition()
+            if progress is not None:
+                progress(len(self.names))
+        self.process_subjects()
+        self.rank = array('b', [UNALLOCATED]) * len(self.names)
+        return True
+
+
+    '''
+    Allocation
+    '''
+    def capacity_list(self, capacities):
+        # capacities: Key = subject, any spelling of it. Value = capacity. Subjects left out get a capacity of 0.
+        # Returns subject id -> capacity.
+        capacity = [0] * len(self.subject_names)
+        for subject, cap in capacities.items():
+            subject = self.subject_id(subject)
+            if subject is not None and subject != VIOLATION:
+                capacity[subject] = cap
+        return capacity
+
+    def check_capacities(self, capacities):
+        # Upper bounds on the students placed and the 1st choices any allocation of capacities can reach, without
+        # allocating (allocation_bounds.py). The subjects short of seats are given by name.
+        return self.capacity_bounds(self.capacity_list(capacities))
+
+    def capacity_bounds(self, capacity):
+        # Same as check_capacities for subject id -> capacity
+        return self.name_short_subjects(self.allocation_bounds().check(capacity))
+
+    def checked_bounds(self, capacity):
+        # capacity_bounds if these capacities were checked recently, else None. Never runs the max flow.
+        bounds = self.bounds.checked_bounds(capacity) if self.bounds is not None else None
+        return None if bounds is None else self.name_short_subjects(bounds)
+
+    def name_short_subjects(self, bounds):
+        bounds['short_subjects'] = [self.subject_names[subject] for subject in bounds['short_subjects']]
+        return bounds
+
+    def process_capacity(self, capacities):
+        self.capacity = self.capacity_list(capacities)
+        self.allocated = [0] * len(self.subject_names)
+
+        # To allocate again, only the ranks need resetting because the choices are never modified
+        self.rank = array('b', [UNALLOCATED]) * len(self.names)
+        self.unlucky_students = []
+        self.index = None
+        self.incremental = None
+        self.placement_limit = None
+
+    def allocate_1st_choice(self):
+        choices, rank, capacity, allocated, k = self.choices, self.rank, self.capacity, self.allocated, self.choice_num
+        for position in range(len(rank)):
+            subject = choices[k * position]
+            if allocated[subject] < capacity[subject]:
+                allocated[subject] += 1
+                rank[position] = 0
+
+    def allocate_2nd_choice(self):
+        # Also lists the unlucky students. With a single choice there is no 2nd choice, VIOLATION is never free.
+        choices, rank, capacity, allocated, k = self.choices, self.rank, self.capacity, self.allocated, self.choice_num
+        for position in range(len(rank)):
+            if rank[position] == UNALLOCATED:
+                subject = choices[k * position + 1] if k > 1 else VIOLATION
+                if allocated[subject] < capacity[subject]:  # If capacity of 2nd choice not full
+                    allocated[subject] += 1
+                    rank[position] = 1
+                else:
+                    self.unlucky_students.append(position)
+
+    def free_subjects(self):
+        # Subjects with capacity left
+        return [subject for subject, cap in enumerate(self.capacity) if cap > self.allocated[subject]]
+
+    def first_optimize(self, progress=None):
+        # The index returns the same student the old scan of all students found first, without scanning.
+        # The Algo 2 pivots (subjects where someone who got their 1st choice has an available 2nd choice) are kept up to date
+        # across students: a swap only changes the subjects of the students it moves, or all of them when a subject fills up.
+        allocated, capacity, index = self.allocated, self.capacity, self.index
+        still_unlucky = []
+        free = self.free_subjects()
+        pivots = {subject for subject in range(len(self.subject_names)) if index.first_of(0, 0, subject, 1, free) is not None}
+        for count, unlucky in enumerate(self.unlucky_students):
+            if self.bound_reached(count - len(still_unlucky)):
+                still_unlucky.extend(self.unlucky_students[count:])  # None of them can be placed any more
+                break
+            if progress is not None:
+                progress(f'Swapping 1st and 2nd choices... {count}/{len(self.unlucky_students)} students')
+            lookups = index.lookups
+            unlucky_choices = self.student_choices(unlucky)
+            # Algo 1 candidates: got 1st choice, same 1st choice as the unlucky student, 2nd choice available
+            found = index.first_of(0, 0, unlucky_choices[0], 1, free)
+            # Algo 2 candidates: got 2nd choice, same 2nd choice as the unlucky student,
+            # and someone who got their 1st choice shares their 1st choice and has an available 2nd choice
+            for subject in pivots:
+                found = earliest(found, index.first(1, 0, subject, 1, unlucky_choices[1]))
+            if found is None:
+                self.stats.count_round('first_optimize', index.lookups - lookups, False)
+                still_unlucky.append(unlucky)
+                continue
+
+            choices_1 = self.student_choices(found)
+            if self.rank[found] == 0:
+                # Algo 1 (13 or 10 --> 12)
+                increased_subject = choices_1[1]
+                index.move(found, 1)
+                index.move(unlucky, 0)
+                self.stats.count_algo(1)
+            else:
+                # Algo 2 (123 or 120 --> 122)
+                found_2 = index.first_of(0, 0, choices_1[0], 1, free)
+                increased_subject = self.choices[self.choice_num * found_2 + 1]
+                index.move(found, 0)
+                index.move(found_2, 1)
+                index.move(unlucky, 1)
+                self.stats.count_algo(2)
+            allocated[increased_subject] += 1
+            changed = {choices_1[0], unlucky_choices[0]}
+            if allocated[increased_subject] == capacity[increased_subject]:
+                free.remove(increased_subject)
+                changed |= pivots
+            for subject in changed:
+                if index.first_of(0, 0, subject, 1, free) is not None:
+                    pivots.add(subject)
+                else:
+                    pivots.discard(subject)
+            self.stats.count_round('first_optimize', index.lookups - lookups, True)
+        self.unlucky_students = still_unlucky
+
+    def allocate_choice(self, rank):
+        # Greedy pass giving the unlucky students their choice number rank (2 = 3rd choice, ...)
+        choices, capacity, allocated, k = self.choices, self.capacity, self.allocated, self.choice_num
+        still_unlucky = []
+        for unlucky in self.unlucky_students:
+            subject = choices[k * unlucky + rank]
+            if capacity[subject] > allocated[subject]:
+                allocated[subject] += 1
+                self.index.move(unlucky, rank)
+            else:
+                still_unlucky.append(unlucky)
+        self.unlucky_students = still_unlucky
+
+    def optimization_helper(self, algo, increased_subject, student_1, choice_1_num, student_2, choice_2_num, unlucky, unlucky_num):
+        # algo is the number of the swap algorithm applied, for the stats
+        self.stats.count_algo(algo)
+        self.allocated[increased_subject] += 1
+        self.index.move(student_1, choice_1_num)
+        if student_2 is not None:
+            self.index.move(student_2, choice_2_num)
+        self.index.move(unlucky, unlucky_num)
+        return True
+
+    # Each optimize round collects the earliest candidate of every algorithm in the round from the index,
+    # then applies the algorithm the old scan of all students would have applied to that student.
+    # A student is never paired with themselves because their choices never repeat (check_choice_repetition).
+    def optimize_round_1(self, unlucky, unlucky_choices):
+        index, free = self.index, self.free_subjects()
+        # Algo 11 candidates: 1st choice = unlucky 2nd choice, 2nd choice available
+        found = index.first_of(0, 0, unlucky_choices[1], 1, free)
+        # Algo 3 candidates: 2nd choice available, and someone with the unlucky 1st choice has their 1st choice as 2nd choice
+        for subject in range(len(self.subject_names)):
+            if index.first(0, 0, unlucky_choices[0], 1, subject) is not None:
+                found = earliest(found, index.first_of(0, 0, subject, 1, free))
+        if found is None:
+            return None
+
+        choices_1 = self.student_choices(found)
+        if choices_1[0] == unlucky_choices[1]:
+            # Algo 11 (10 --> 22)
+            return self.optimization_helper(11, choices_1[1], found, 1, None, None, unlucky, 1)
+        else:
+            # Algo 3 (110 --> 122)
+            found_2 = index.first(0, 0, unlucky_choices[0], 1, choices_1[0])
+            return self.optimization_helper(3, choices_1[1], found, 1, found_2, 1, unlucky, 0)
+
+    def optimize_round_2(self, unlucky, unlucky_choices):
+        index, free = self.index, self.free_subjects()
+        # Algo 6 candidates: got 1st choice = unlucky 1st choice, 3rd choice available
+        found = index.first_of(0, 0, unlucky_choices[0], 2, free)
+        # Algo 5 candidates: got 1st choice = unlucky 1st choice, someone who got the same 2nd choice has 3rd choice available
+        for subject in range(len(self.subject_names)):
+            if index.first_of(1, 1, subject, 2, free) is not None:
+                found = earliest(found, index.first(0, 0, unlucky_choices[0], 1, subject))
+        # Algo 7 candidates: got 2nd choice = unlucky 2nd choice, 3rd choice available
+        found = earliest(found, index.first_of(1, 1, unlucky_choices[1], 2, free))
+        if found is None:
+            return None
+
+        choices_1 = self.student_choices(found)
+        if self.rank[found] == 0:
+            if choices_1[2] in free:
+                # Algo 6 (10 --> 13)
+                return self.optimization_helper(6, choices_1[2], found, 2, None, None, unlucky, 0)
+            else:
+                # Algo 5 (120 --> 123)
+                found_2 = index.first_of(1, 1, choices_1[1], 2, free)
+                return self.optimization_helper(5, self.choices[self.choice_num * found_2 + 2], found_2, 2, found, 1, unlucky, 0)
+        else:
+            # Algo 7 (20 --> 23)
+            return self.optimization_helper(7, choices_1[2], found, 2, None, None, unlucky, 1)
+
+    def optimize_round_3(self, unlucky, unlucky_choices):
+        index, free = self.index, self.free_subjects()
+        # Algo 12 candidates: 1st choice = unlucky 2nd choice, 3rd choice available
+        found = index.first_of(0, 0, unlucky_choices[1], 2, free)
+        # Algo 13 candidates: 1st choice = unlucky 3rd choice, 2nd choice available
+        found = earliest(found, index.first_of(0, 0, unlucky_choices[2], 1, free))
+        for subject in range(len(self.subject_names)):
+            # Algo 4 candidates: 1st choice = unlucky 1st choice, 2nd choice = 1st choice of someone whose 3rd choice is available
+            if index.first_of(0, 0, subject, 2, free) is not None:
+                found = earliest(found, index.first(0, 0, unlucky_choices[0], 1, subject))
+            # Algo 8 candidates: 1st choice = unlucky 1st choice, 3rd choice = 1st choice of someone whose 2nd choice is available
+            if index.first_of(0, 0, subject, 1, free) is not None:
+                found = earliest(found, index.first(0, 0, unlucky_choices[0], 2, subject))
+        if found is None:
+            return None
+
+        choices_1 = self.student_choices(found)
+        if choices_1[0] == unlucky_choices[1] and choices_1[2] in free:
+            # Algo 12 (10 --> 23)
+            return self.optimization_helper(12, choices_1[2], found, 2, None, None, unlucky, 1)
+        elif choices_1[0] == unlucky_choices[2] and choices_1[1] in free:
+            # Algo 13 (10 --> 23)
+            return self.optimization_helper(13, choices_1[1], found, 1, None, None, unlucky, 2)
+        else:
+            found_2 = earliest(index.first_of(0, 0, choices_1[1], 2, free), index.first_of(0, 0, choices_1[2], 1, free))
+            choices_2 = self.student_choices(found_2)
+            if choices_1[1] == choices_2[0] and choices_2[2] in free:
+                # Algo 4 (110 --> 123)
+                return self.optimization_helper(4, choices_2[2], found_2, 2, found, 1, unlucky, 0)
+            else:
+                # Algo 8 (110 --> 123)
+                return self.optimization_helper(8, choices_2[1], found_2, 1, found, 2, unlucky, 0)
+
+    def optimize_round_4(self, unlucky, unlucky_choices):
+        index, free = self.index, self.free_subjects()
+        # Algo 15 candidates: got 2nd choice = unlucky 3rd choice, 3rd choice available
+        found = index.first_of(1, 1, unlucky_choices[2], 2, free)
+        # Algo 10 candidates: got 2nd choice, 3rd choice available, someone who got the unlucky 1st choice has it as 3rd choice
+        for subject in range(len(self.subject_names)):
+            if index.first(0, 0, unlucky_choices[0], 2, subject) is not None:
+                found = earliest(found, index.first_of(1, 1, subject, 2, free))
+        if found is None:
+            return None
+
+        choices_1 = self.student_choices(found)
+        if choices_1[1] == unlucky_choices[2]:
+            # Algo 15 (20 --> 33)
+            return self.optimization_helper(15, choices_1[2], found, 2, None, None, unlucky, 2)
+        else:
+            # Algo 10 (120 --> 133)
+            found_2 = index.first(0, 0, unlucky_choices[0], 2, choices_1[1])
+            return self.optimization_helper(10, choices_1[2], found, 2, found_2, 2, unlucky, 0)
+
+    def optimize_round_5(self, unlucky, unlucky_choices):
+        index, free = self.index, self.free_subjects()
+        # Algo 14 candidates: got 1st choice = unlucky 3rd choice, 3rd choice available
+        found = index.first_of(0, 0, unlucky_choices[2], 2, free)
+        # Algo 9 candidates: got 1st choice, 3rd choice available, someone who got the unlucky 1st choice has it as 3rd choice
+        for subject in range(len(self.subject_names)):
+            if index.first(0, 0, unlucky_choices[0], 2, subject) is not None:
+                found = earliest(found, index.first_of(0, 0, subject, 2, free))
+        if found is None:
+            return None
+
+        choices_1 = self.student_choices(found)
+        if choices_1[0] == unlucky_choices[2]:
+            # Algo 14 (10 --> 33)
+            return self.optimization_helper(14, choices_1[2], found, 2, None, None, unlucky, 2)
+        else:
+            # Algo 9 (110 --> 133)
+            found_2 = index.first(0, 0, unlucky_choices[0], 2, choices_1[0])
+            return self.optimization_helper(9, choices_1[2], found, 2, found_2, 2, unlucky, 0)
+
+    def final_help_unlucky(self, progress=None):
+        rounds = [('round_1', self.optimize_round_1), ('round_2', self.optimize_round_2), ('round_3', self.optimize_round_3),
+                  ('round_4', self.optimize_round_4), ('round_5', self.optimize_round_5)]
+        still_unlucky = []
+        for count, unlucky in enumerate(self.unlucky_students):
+            if self.bound_reached(count - len(still_unlucky)):
+                still_unlucky.extend(self.unlucky_students[count:])
+                break
+            if progress is not None:
+                progress(f'Helping unallocated students... {count}/{len(self.unlucky_students)} students')
+            unlucky_choices = self.student_choices(unlucky)
+            # Each round contains several optimizations of the same level of superiority.
+            # The earlier a round occurs, it means it's preferred over other rounds.
+            # Refer to algorithms ranking at the bottom.
+            if not any(self.try_round(name, optimize_round, unlucky, unlucky_choices) for name, optimize_round in rounds):
+                still_unlucky.append(unlucky)
+        self.unlucky_students = still_unlucky
+
+    def try_round(self, name, optimize_round, unlucky, unlucky_choices):
+        lookups = self.index.lookups
+        success = optimize_round(unlucky, unlucky_choices)
+        self.stats.count_round(name, self.index.lookups - lookups, success)
+        return success
+
+    def optimal_allocate(self):
+        # Min-cost flow: source -> student -> subject of every choice -> sink, with subject -> sink limited by capacity.
+        # Places as many students as possible and, among those allocations, minimizes the total rank_costs.
+        # Students with exactly the same choices are interchangeable, so they share one node. This keeps the graph small.
+        capacity, costs = self.capacity, rank_costs(self.choice_num)
+        choice_types = {}  # Key = (1st, 2nd, ... choice). Value = positions of students with these choices, in submission order
+        for position in range(len(self.names)):
+            choice_types.setdefault(tuple(self.student_choices(position)), []).append(position)
+
+        source, sink = 0, 1
+        subject_nodes = {}
+        for subject, cap in enumerate(capacity):
+            if cap > 0:  # VIOLATION and empty subjects get no node
+                subject_nodes[subject] = len(subject_nodes) + 2
+        flow = MinCostFlow(2 + len(subject_nodes) + len(choice_types))
+        for subject, node in subject_nodes.items():
+            flow.add_edge(node, sink, capacity[subject], 0)
+        choice_edges = []
+        for i, (choices, positions) in enumerate(choice_types.items()):
+            node = 2 + len(subject_nodes) + i
+            flow.add_edge(source, node, len(positions), 0)
+            choice_edges.append([(rank, flow.add_edge(node, subject_nodes[subject], len(positions), costs[rank]))
+                                 for rank, subject in enumerate(choices) if subject in subject_nodes])
+        flow.solve(source, sink)
+
+        # Earlier submissions of the same choices get the better ranks
+        for (choices, positions), edges in zip(choice_types.items(), choice_edges):
+            waiting = iter(positions)
+            for rank, edge in edges:
+                for _ in range(flow.flow(edge)):
+                    self.rank[next(waiting)] = rank
+                    self.allocated[choices[rank]] += 1
+            self.unlucky_students.extend(waiting)
+
+    def allocate(self, capacities, mode='heuristic', progress=None, cache=None, search_budget=0):
+        # progress(message) is called at every phase and for every student in the swap searches.
+        # It may raise to stop the allocation, which leaves a partial allocation behind.
+        # Every phase is timed in self.stats, see allocation_report.
+        # cache: a ResultCache (result_cache.py). A capacity vector and mode allocated before is restored from it instead.
+        # search_budget: seconds of local search after the heuristic mode (local_search.py), 0 for none
+        progress = progress if progress is not None else (lambda message: None)
+        stats = self.stats = AllocationStats(mode, search_budget if mode == 'heuristic' else 0)
+        stats.time('process_capacity', self.process_capacity, capacities)
+        self.from_cache = False
+        if cache is None:
+            self.run_allocation(mode, progress)
+            return
+
+        key = cache.key(self.fingerprint(), self.capacity, self.mode_label())
+        cached = cache.get(key)
+        if cached is not None:
+            self.restore_allocation(cached)
+            return
+        self.run_allocation(mode, progress)
+        cache.store(key, self)
+
+    def allocate_components(self, capacities, mode='heuristic', workers=None, progress=None):
+        # Same result as allocate, with the students split into components that share no subject (cohort_components.py).
+        # Every component is allocated on its own engine, on a pool of workers processes (default: one per core),
+        # so the swap searches only ever look at the subjects of one component.
+        # The optimal mode places as many students at the same total cost, the heuristic mode gives the same allocation.
+        progress = progress if progress is not None else (lambda message: None)
+        stats = self.stats = AllocationStats(mode)
+        stats.time('process_capacity', self.process_capacity, capacities)
+        self.from_cache = False
+        student_components, subject_components = stats.time('find_components', find_components, self.choice_matrix(),
+                                                             len(self.subject_names))
+        tasks = stats.time('split_components', self.component_tasks, student_components, subject_components)
+
+        progress(f'Allocating {len(tasks)} components...')
+        workers = workers or os.cpu_count() or 1
+        results = stats.time('allocate_components', run_components, tasks, mode, workers, progress)
+        stats.time('merge_components', self.merge_components, tasks, results)
+
+    def allocate_ordering(self, capacities, order, mode='heuristic'):
+        # Allocate as if the students had submitted in the given order (a permutation of the positions, see fairness.py).
+        # The result stays in submission order.
+        stats = self.stats = AllocationStats(mode)
+        stats.time('process_capacity', self.process_capacity, capacities)
+        self.from_cache = False
+        choices = self.choice_matrix()
+        names = self.names.select(order)
+        result = allocate_component(names, choices[order], self.subject_names, capacities, mode)
+        stats.time('merge_components', self.merge_components, [(order,)], [result])
+
+    def component_tasks(self, student_components, subject_components):
+        # (positions, names, choices, subject names, capacities) of every component, with subject ids local to it
+        choices = self.choice_matrix()
+        tasks = []
+        for component, positions in enumerate(split(student_components, int(student_components.max(initial=-1)) + 1)):
+            subjects = np.flatnonzero(subject_components == component)
+            subjects = subjects[subjects != VIOLATION]
+            local = np.zeros(len(self.subject_names), dtype=np.intc)  # Global id -> local id. VIOLATION stays 0.
+            local[subjects] = np.arange(1, len(subjects) + 1, dtype=np.intc)
+            subject_names = ['VIOLATION'] + [self.subject_names[subject] for subject in subjects]
+            capacities = {self.subject_names[subject]: self.capacity[subject] for subject in subjects}
+            tasks.append((positions, self.names.select(positions), local[choices[positions]],
+                          subject_names, capacities))
+        return tasks
+
+    def merge_components(self, tasks, results):
+        rank = np.frombuffer(self.rank, dtype=np.int8)
+        for (positions, *_), (component_rank, report) in zip(tasks, results):
+            rank[positions] = np.frombuffer(component_rank, dtype=np.int8)
+            self.stats.add_report(report)
+        choices = self.choice_matrix()
+        allocated = np.flatnonzero(rank != UNALLOCATED)
+        self.allocated = np.bincount(choices[allocated, rank[allocated]], minlength=len(self.subject_names)).tolist()
+        self.unlucky_students = np.flatnonzero(rank == UNALLOCATED).tolist()
+
+    def restore_allocation(self, cached):
+        # Put back an allocation of the same input stored in a ResultCache
+        self.capacity = list(cached.capacity)
+        self.rank = cached.rank[:]
+        self.allocated = cached.allocated[:]
+        self.unlucky_students = cached.unlucky_students[:]
+        self.stats = cached.stats
+        self.index = None
+        self.incremental = None
+        self.from_cache = True
+
+    def change_capacity(self, subject, capacity, progress=None, cache=None):
+        # Allocate again after the capacity of one subject (any spelling) changed, keeping the other capacities.
+        # An optimal allocation is repaired in place by moving a few students (incremental_allocation.py).
+        # A heuristic one is allocated again from scratch, because the greedy passes would place everyone differently.
+        subject_id = self.subject_id(subject)
+        if subject_id is None or subject_id == VIOLATION:
+            raise KeyError(f'{subject} is not chosen by any student')
+        mode = self.stats.mode
+        if mode != 'optimal':
+            capacities = dict(zip(self.subject_names, self.capacity))
+            capacities[self.subject_names[subject_id]] = capacity
+            self.allocate(capacities, mode, progress, cache, self.stats.search_budget)
+            return
+
+        key = None
+        if cache is not None:
+            new_capacity = list(self.capacity)
+            new_capacity[subject_id] = capacity
+            key = cache.key(self.fingerprint(), new_capacity, mode)
+            cached = cache.get(key)
+            if cached is not None:
+                self.restore_allocation(cached)
+                return
+        stats = self.stats = AllocationStats(mode)
+        self.from_cache = False
+        if self.incremental is None:
+            self.incremental = stats.time('build_incremental', IncrementalAllocation, self.choices, self.rank,
+                                          self.capacity, self.allocated, rank_costs(self.choice_num))
+        stats.time('incremental_update', self.incremental.set_capacity, subject_id, capacity)
+        self.unlucky_students = self.incremental.unallocated()
+        if key is not None:
+            cache.store(key, self)
+
+    def run_allocation(self, mode, progress):
+        # The phases of allocate after process_capacity
+        stats = self.stats
+        if mode == 'optimal':
+            progress('Solving min-cost flow...')
+            stats.time('optimal_allocate', self.optimal_allocate)
+            return
+        progress('Allocating 1st choices...')
+        stats.time('allocate_1st_choice', self.allocate_1st_choice)
+        progress('Allocating 2nd choices...')
+        stats.time('allocate_2nd_choice', self.allocate_2nd_choice)
+        if len(self.unlucky_students) != 0:
+            progress('Checking the bounds...')
+            stats.time('check_bounds', self.limit_placement)
+        if self.can_place_more():
+            self.help_unlucky(progress)
+        if stats.search_budget > 0:
+            stats.time('local_search', self.local_search, progress)
+
+    def help_unlucky(self, progress):
+        # The phases that place the unlucky students. Every one of them is skipped once the bound is reached.
+        stats = self.stats
+        progress('Indexing the allocation...')
+        self.index = stats.time('build_index', AllocationIndex, self.choices, self.rank, self.choice_num)
+        if self.choice_num > 1:
+            stats.time('first_optimize', self.first_optimize, progress)
+        if self.choice_num >= SWAP_CHOICES and self.can_place_more():
+            progress('Allocating 3rd choices...')
+            stats.time('allocate_3rd_choice', self.allocate_choice, 2)
+            if self.can_place_more():
+                # Series of tricks to ensure that no students receive 3rd choice.
+                stats.time('final_help_unlucky', self.final_help_unlucky, progress)
+        for rank in range(SWAP_CHOICES, self.choice_num):
+            # Further choices only go to the students the swap algorithms could not help
+            if not self.can_place_more():
+                break
+            label = rank_label(rank)
+            progress(f'Allocating {label} choices...')
+            stats.time(f'allocate_{label}_choice', self.allocate_choice, rank)
+
+    def limit_placement(self):
+        # Set placement_limit, the most students any allocation of the capacities can place.
+        # The max flow of allocation_bounds.py is only used when these capacities were checked before, as the desktop app
+        # and cli.py do, and then also goes in the report. Otherwise nothing as costly runs: every student needs a seat
+        # in a subject they chose, so at most the sum over subjects of min(capacity, students who chose it) are placed.
+        bounds = self.stats.bounds = self.checked_bounds(self.capacity)
+        if bounds is not None:
+            self.placement_limit = bounds['placed']
+        else:
+            chosen = self.demand_counts().sum(axis=1)
+            self.placement_limit = min(len(self.names), int(np.minimum(chosen, self.capacity).sum()))
+
+    def can_place_more(self):
+        # False once no unlucky student is left, or the students placed reach placement_limit
+        return len(self.unlucky_students) != 0 and not self.bound_reached()
+
+    def bound_reached(self, newly_placed=0):
+        # Whether the students placed, with newly_placed unlucky students placed since unlucky_students was listed,
+        # reach placement_limit. Any swap for another unlucky student would then fail.
+        placed = len(self.names) - len(self.unlucky_students) + newly_placed
+        return self.placement_limit is not None and placed >= self.placement_limit
+
+    def local_search(self, progress):
+        # Improve the allocation by ejection chains for at most stats.search_budget seconds, building included
+        budget, start = self.stats.search_budget, time.perf_counter()
+        search = LocalSearch(self.choices, self.rank, self.capacity, self.allocated, rank_costs(self.choice_num))
+
+        def report(unallocated, worse, seconds):
+            progress(f'Improving... {unallocated} unallocated, {worse} on a 3rd or later choice '
+                     f'({time.perf_counter() - start:.1f}/{budget:g} s)')
+        optimal = search.improve(budget - (time.perf_counter() - start), report)
+        self.stats.search = search.report(budget, optimal, time.perf_counter() - start)
+        self.unlucky_students = search.unallocated()
+        self.index = None  # Students moved without it, so it no longer matches the ranks
+
+    def mode_label(self):
+        # Mode of the last allocation as cached and shown: a heuristic run with local search is a configuration of its own
+        return mode_label(self.stats.mode, self.stats.search_budget)
+
+
+    '''
+    Output
+    '''
+    def summarize_results(self):
+        record = {}
+        for rank, label in enumerate(self.choice_labels()):
+            record[label] = self.rank.count(rank)
+        return record
+
+    def allocation_report(self):
+        # Stats of the last allocation (see allocation_stats.py) and its result, as plain dicts for JSON
+        report = self.stats.report()
+        report['cached'] = self.from_cache
+        report['result'] = self.summarize_results()
+        report['result']['unallocated'] = len(self.unlucky_students)
+        report['memory'] = self.memory_usage()
+        return report
+
+    def memory_usage(self):
+        # Bytes held by the student store and the allocation structures, counting the ints the lists point to
+        return {
+            'names': self.names.nbytes(),
+            'choices': array_bytes(self.choices),
+            'rank': array_bytes(self.rank),
+            'subjects': list_bytes(self.capacity) + list_bytes(self.allocated),
+            'unlucky_students': list_bytes(self.unlucky_students),
+            'index': self.index.nbytes() if self.index is not None else 0
+        }
+
+    def allocated_subject(self, position):
+        # Name of the subject a student received, or None
+        rank = self.rank[position]
+        if rank == UNALLOCATED:
+            return None
+        return self.subject_names[self.choices[self.choice_num * position + rank]]
+
+    def form_result_df(self):
+        subject_names = self.subject_names
+        data = {}
+        data['Name'] = list(self.names)
+        data['Allocated Choice'] = []
+        for position in range(len(self.names)):
+            subject = self.allocated_subject(position)
+            data['Allocated Choice'].append(subject if subject is not None else "Didn't Receive a Choice")
+        for rank, label in enumerate(self.choice_labels()):
+            data[f'{label} Choice'] = [subject_names[subject] for subject in self.choices[rank::self.choice_num]]
+        return pd.DataFrame(data)
+
+    @staticmethod
+    def output_df(df, file_name):
+        # Returns the name of the file actually written
+        if file_name[-4:] == '.csv':
+            df.to_csv(file_name, index=False)
+        elif file_name[-5:] == '.xlsx':
+            df.to_excel(file_name, index=False)
+        else:
+            file_name = file_name + '.xlsx'
+            df.to_excel(file_name, index=False)
+        return file_name
+
+
+def read_excel_chunks(filename, chunk_size):
+    # openpyxl in read-only mode streams the rows instead of loading the whole workbook
+    from openpyxl import load_workbook
+    workbook = load_workbook(filename, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = list(next(rows, ()))
+        while header and header[-1] is None:  # A formatted but empty cell widens the sheet. read_excel trims these columns.
+            header.pop()
+        width = len(header)
+        batch, yielded = [], False
+        for row in rows:
+            row = row[:width]
+            if all(cell is None for cell in row):  # Skip blank rows, like read_csv does
+                continue
+            batch.append(row)
+            if len(batch) == chunk_size:
+                yield pd.DataFrame(batch, columns=header)
+                batch, yielded = [], True
+        if batch or not yielded:  # An empty sheet still gives one chunk, so its header gets checked
+            yield pd.DataFrame(batch, columns=header)
+    finally:
+        workbook.close()
+
+
+def is_unnamed(column):
+    # A header cell left empty, as pandas names it ('Unnamed: 5') or openpyxl leaves it (None)
+    return column is None or (isinstance(column, float) and column != column) \
+        or (isinstance(column, str) and (column.strip() == '' or column.startswith('Unnamed: ')))
+
+
+def array_bytes(values):
+    return len(values) * values.itemsize
+
+
+def list_bytes(values):
+    return sys.getsizeof(values) + sum(map(sys.getsizeof, values))
+
+
+def allocate_component(names, choices, subject_names, capacities, mode):
+    # Allocate one component (see AllocationEngine.allocate_components), usually in a worker process.
+    # Returns its ranks and the report of its stats.
+    engine = AllocationEngine()
+    engine.load_import(names, choices, subject_names)
+    engine.allocate(capacities, mode)
+    return engine.rank, engine.stats.report()
+
+
+def run_components(tasks, mode, workers, progress):
+    # Results of allocate_component for every task, in task order. One worker or one task runs in this process.
+    jobs = [(names, choices, subject_names, capacities, mode) for _, names, choices, subject_names, capacities in tasks]
+    results = []
+    if workers == 1 or len(jobs) == 1:
+        for job in jobs:
+            results.append(allocate_component(*job))
+            progress(f'Allocated {len(results)}/{len(jobs)} components')
+        return results
+    with ProcessPoolExecutor(min(workers, len(jobs))) as pool:
+        # The largest components are started first, so a big one never runs alone at the end
+        futures = {i: pool.submit(allocate_component, *jobs[i]) for i in sorted(range(len(jobs)), key=lambda i: -len(jobs[i][0]))}
+        for i in range(len(jobs)):
+            results.append(futures[i].result())
+            progress(f'Allocated {len(results)}/{len(jobs)} components')
+    return results
+
+
+def mode_label(mode, search_budget):
+    return f'{mode}+{search_budget:g}s' if search_budget else mode
+
+
+def rank_costs(choice_num):
+    # Cost of every rank in the optimal mode: 0, 1, 3, 7, ... Each choice is worse than two of the choice before it.
+    return [2 ** rank - 1 for rank in range(choice_num)]
+
+
+def rank_label(rank):
+    # 0 -> '1st', 1 -> '2nd', 2 -> '3rd', 3 -> '4th', ...
+    number = rank + 1
+    if number % 100 in (11, 12, 13):
+        return f'{number}th'
+    return f'{number}' + {1: 'st', 2: 'nd', 3: 'rd'}.get(number % 10, 'th')
+
+
+def rank_labels(choice_num):
+    return [rank_label(rank) for rank in range(choice_num)]
+
+
+def read_capacities(filename):
+    # Capacities file: a spreadsheet whose first two columns are subject and capacity, or a JSON object {subject: capacity}
+    return {subject: int(cap) for subject, cap in read_two_columns(filename).items()}
+
+
+"""
+Optimization algorithms:
+
+Algo rankings:
+A (good optimization): 1, 2
+B (round 1): 3 (110 --> 122, no 3rd choice resulted)
+C (round 2): 5 (120 --> 123), 6 (10 --> 13), 7 (20 --> 23)
+D (round 3): 4 (110 --> 123), 8 (110 --> 123)
+E (round 4): 10 (120 --> 133)
+F (round 5): 9 (110 --> 133)
+
+1.
+Conditions:
+Student A: got 1st choice
+Student B: no 1st choice, no 2nd choice
+A and B have the same 1st choice
+A's 2nd choice is available
+Result:
+A drops 1st choice, gets 2nd choice
+B gets 1st choice
+Good optimization (13 or 10 --> 12)
+
+2.
+Conditions:
+Student A: got 1st choice
+Student B: got 2nd choice
+Student C: no 1st choice, no 2nd choice
+B and C have the same 2nd choice
+A and B have the same 1st choice
+A's 2nd choice is available
+Result:
+A drops 1st choice, gets 2nd choice
+B drops 2nd choice, gets 1st choice
+C gets 2nd choice
+Good optimization (123 or 120 --> 122)
+
+3.
+Conditions: 
+Student A: got 1st choice
+Student B: got 1st choice
+Student C: no 1st choice, no 2nd choice, no 3rd choice
+B and C have the same 1st choice
+B's 2nd choice = A's 1st choice
+A's 2nd choice is available
+Result:
+A drops 1st choice, gets 2nd choice
+B drops 1st choice, gets 2nd choice
+C gets 1st choice
+110 --> 122 (round 1)
+
+4. 
+Conditions: 
+Student A: got 1st choice
+Student B: got 1st choice
+Student C: no 1st choice, no 2nd choice, no 3rd choice
+A and C have the same 1st choice
+A's 2nd choice = B's 1st choice
+B's 3rd choice is available (2nd choice not available)
+Result:
+B drops 1st choice, gets 3rd choice
+A drops 1st choice, gets 2nd choice
+C gets 1st choice
+110 --> 123 (round 3)
+
+5.
+Conditions: 
+Student A: got 1st choice
+Student B: got 2nd choice
+Student C: no 1st choice, no 2nd choice, no 3rd choice
+A and C have the same 1st choice
+A and B have the same 2nd choice
+B's 3rd choice is available
+Result:
+B drops 2nd choice, gets 3rd choice
+A drops 1st choice, gets 2nd choice
+C gets 1st choice
+120 --> 123 (round 2)
+
+6.
+Conditions: 
+Student A: got 1st choice
+Student B: no 1st choice, no 2nd choice, no 3rd choice
+A and B have the same 1st choice
+A's 3rd choice is available
+Result:
+A drops 1st choice, gets 3rd choice
+B gets 1st choice
+10 --> 13 (round 2)
+
+7.
+Conditions: 
+Student A: got 2nd choice
+Student B: no 1st choice, no 2nd choice, no 3rd choice
+A and B have the same 2nd choice
+A's 3rd choice is available
+Result:
+A drops end choice, gets 3rd choice
+B gets 2nd choice
+20 --> 23 (round 2)
+
+8.
+Conditions: 
+Student A: got 1st choice
+Student B: got 1st choice
+Student C: no 1st choice, no 2nd choice, no 3rd choice
+A and C have the same 1st choice
+B's 1st choice = A's 3rd choice
+B's 2nd choice is available
+Result:
+B drops 1st choice, gets 2nd choice
+A drops 1st choice, gets 3rd choice
+C gets 1st choice
+110 --> 123 (round 3)
+
+9.
+Conditions:
+Student A: got 1st choice
+Student B: got 1st choice
+Student C: no 1st choice, no 2nd choice, no 3rd choice
+B and C have the same 1st choice
+A's 1st choice = B's 3rd choice
+A's 3rd choice is available (2nd choice not available)
+Result:
+B drops 1st choice, gets 3rd choice
+A drops 1st choice, gets 3rd choice
+C gets 1st choice
+110 --> 133 (round 5)
+
+10.
+Conditions: 
+Student A: got 2nd choice
+Student B: got 1st choice
+Student C: no 1st choice, no 2nd choice, no 3rd choice
+B and C have the same 1st choice
+A's 2nd choice = B's 3rd choice
+A's 3rd choice is available
+Result:
+A drops 2nd choice, gets 3rd choice
+B drops 1st choice, gets 3rd choice
+C gets 1st choice
+120 --> 133 (round 4)
+
+11
+Conditions:
+Student A: got 1st choice
+Student B: no 1st choice, no 2nd choice, no 3rd choice
+A's 1st choice = B's 2nd choice
+A's 2nd choice is available
+Result:
+A gets 2nd choice
+B gets 2nd choice
+10 --> 22 (round 1)
+
+12
+Conditions:
+Student A: got 1st choice
+Student B: no 1st choice, no 2nd choice, no 3rd choice
+A's 1st choice = B's 2nd choice
+A's 3rd choice is available (2nd choice not available)
+Result:
+A gets 3rd choice
+B gets 2nd choice
+10 --> 23 (round 3)
+
+13
+Conditions:
+Student A: got 1st choice
+Student B: no 1st choice, no 2nd choice, no 3rd choice
+A's 1st choice = B's 3rd choice
+A's 2nd choice available
+Result:
+A gets 2nd choice
+B gets 3rd choice
+10 --> 23 (round 3)
+
+14 
+Conditions:
+Student A: got 1st choice
+Student B: no 1st choice, no 2nd choice, no 3rd choice
+A's 1st choice = B's 3rd choice
+A's 3rd choice is available (2nd choice not available)
+Result: 
+A gets 3rd choice
+B gets 3rd choice
+10 --> 33 (round 5)
+
+15: 
+Conditions: 
+Student A: got 2nd choice
+Student B: no 1st choice, no 2nd choice, no 3rd choice
+A's 3rd choice is available
+A's 2nd choice = B's 3rd choice
+Result: 
+A gets 3rd
+B gets 3rd
+20 --> 33 (round 4)
+"""
+
+
+
+
+
+
+
+
+
+
+
+
+
+
+
+
+
+
+
+
+
+
+
+
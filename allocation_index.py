@@ -0,0 +1,109 @@
+"""
+Live indexes over the allocation, used by the swap algorithms.
+
+Every student who currently holds their 1st or 2nd choice is filed under
+(allocated rank, choice position i, subject at i, choice position j, subject at j) for each pair of choice positions
+among the first 3, the only ones the swap algorithms look at. Students with a single choice are never filed.
+The swap algorithms look for "the first student (in submission order) who got their 1st choice X and has Y as 3rd choice",
+which is then a single bucket lookup instead of a scan of every student.
+
+Buckets are heaps of positions, plain ints rather than tuples to keep the index small on large cohorts.
+The first filing appends the students in submission order, so a bucket starts as a sorted list, which is already a heap.
+An entry is stale once the student no longer holds the rank of its bucket, the choices of a student never change,
+so a move costs a few heap pushes and stale entries are dropped lazily when they reach the top.
+A student who moves back to a rank may be filed twice in a bucket, which only repeats a valid entry.
+"""
+
+import heapq
+import sys
+
+CHOICE_PAIRS = [(0, 1), (0, 2), (1, 2)]
+INDEXED_RANKS = [0, 1]  # Students with their 3rd choice or no choice are never moved by the swap algorithms
+
+
+def earliest(position_1, position_2):
+    # Earlier of two positions, either of which may be None
+    if position_1 is None:
+        return position_2
+    if position_2 is None:
+        return position_1
+    return min(position_1, position_2)
+
+
+class AllocationIndex(object):
+    def __init__(self, choices, rank, choice_num):
+        # choices and rank are the AllocationEngine arrays, with choice_num choices per student.
+        # rank is shared and updated by move. Positions are submission order, i.e. the order the old scans used.
+        self.choices = choices
+        self.rank = rank
+        self.choice_num = choice_num
+        self.pairs = [(i, j) for i, j in CHOICE_PAIRS if j < choice_num]
+        self.buckets = {}
+        self.lookups = 0  # Number of calls to first, read by AllocationStats
+        self._file_all()
+
+    def _file_all(self):
+        # Same as _file for every position. Positions are filed in ascending order, so appending keeps every bucket sorted.
+        choices, held, k, pairs, buckets = self.choices, self.rank, self.choice_num, self.pairs, self.buckets
+        for position in range(len(held)):
+            rank = held[position]
+            if rank not in INDEXED_RANKS:
+                continue
+            base = k * position
+            for i, j in pairs:
+                key = (rank, i, choices[base + i], j, choices[base + j])
+                bucket = buckets.get(key)
+                if bucket is None:
+                    buckets[key] = [position]
+                else:
+                    bucket.append(position)
+
+    def _file(self, position):
+        rank = self.rank[position]
+        if rank not in INDEXED_RANKS:
+            return
+        choices, base = self.choices, self.choice_num * position
+        for i, j in self.pairs:
+            key = (rank, i, choices[base + i], j, choices[base + j])
+            if key in self.buckets:
+                heapq.heappush(self.buckets[key], position)
+            else:
+                self.buckets[key] = [position]
+
+    def move(self, position, rank):
+        # Record that a student now holds their choice number rank (0, 1, 2)
+        self.rank[position] = rank
+        self._file(position)
+
+    def first(self, rank, i, subject_i, j, subject_j):
+        # Earliest student holding choice number rank whose choice i is subject_i and choice j is subject_j, or None
+        self.lookups += 1
+        heap = self.buckets.get((rank, i, subject_i, j, subject_j))
+        if not heap:
+            return None
+        held = self.rank
+        while heap and held[heap[0]] != rank:
+            heapq.heappop(heap)
+        return heap[0] if heap else None
+
+    def first_of(self, rank, i, subject_i, j, subjects_j):
+        # Same as first, for choice j being any of subjects_j. Inlined, this is the innermost loop of the swap searches.
+        self.lookups += len(subjects_j)
+        buckets, held, found = self.buckets, self.rank, None
+        for subject_j in subjects_j:
+            heap = buckets.get((rank, i, subject_i, j, subject_j))
+            if not heap:
+                continue
+            while heap and held[heap[0]] != rank:
+                heapq.heappop(heap)
+            if heap and (found is None or heap[0] < found):
+                found = heap[0]
+        return found
+
+    def nbytes(self):
+        # Size of the buckets, their keys and heaps, and of the position ints they hold, each counted once
+        size, positions = sys.getsizeof(self.buckets), {}
+        for key, heap in self.buckets.items():
+            size += sys.getsizeof(key) + sys.getsizeof(heap)
+            positions.update((id(position), sys.getsizeof(position)) for position in heap)
+        return size + sum(positions.values())
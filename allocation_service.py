@@ -0,0 +1,296 @@
+"""
+Local allocation service: the import -> allocate -> output pipeline behind an HTTP/JSON API on localhost.
+
+Coordinators on the same machine (or a shared one they log into) post a spreadsheet and capacities and get the allocation
+back, instead of each running the desktop app on their own copy. Requests are handled on an asyncio event loop and every
+allocation runs on a process pool, so a long allocation never holds up the other requests.
+Responses are cached by a hash of the input (file content, capacities, mode, aliases, search budget), so posting the same input again
+is answered from memory, and identical requests that arrive while it is being allocated wait for the same allocation.
+The service only listens on a loopback address and never makes a connection itself.
+
+POST /allocate with a JSON body
+    {"filename": "students.xlsx", "students": "<the file, base64>", "capacities": {"Biology": 12, ...},
+     "mode": "heuristic", "aliases": {"Bio": "Biology"}, "search_budget": 10}
+mode, aliases and search_budget (seconds of local search after the heuristic mode, at most MAX_SEARCH_BUDGET) are optional. The answer is
+    {"result": {"1st": ..., "2nd": ..., ...}, "students": ..., "unallocated": ..., "columns": [...], "rows": [...],
+     "notes": [...], "report": {...}, "cached": false, "seconds": ...}
+where columns and rows are the table the desktop app writes out. Errors are {"error": "..."} with a 4xx or 5xx status.
+GET /health returns the request counters.
+
+Usage:
+python allocation_service.py --port 8765 --workers 4
+python allocation_service.py --cache  # Also keep the imported spreadsheets in the import cache
+python service_load_test.py students.csv capacities.csv -n 200 --spawn  # Throughput and latency
+"""
+
+import argparse
+import asyncio
+import base64
+import binascii
+import contextlib
+import hashlib
+import io
+import ipaddress
+import json
+import os
+import signal
+import sys
+import tempfile
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from http import HTTPStatus
+
+from allocation_engine import ALLOCATION_MODES, AllocationEngine
+from import_cache import DEFAULT_CACHE_DIR, ImportCache
+from subject_aliases import SubjectAliases
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+MAX_BODY_BYTES = 64 * 1024 * 1024  # Larger requests are refused before they are read
+DEFAULT_CACHE_ENTRIES = 64  # Responses kept in memory, least recently used dropped first
+SUFFIXES = ('.xlsx', '.csv')
+MAX_SEARCH_BUDGET = 60  # Seconds of local search a request may ask for
+
+worker_cache = None  # ImportCache of this worker process, see start_worker
+
+
+class RequestError(Exception):
+    # Answered with its status and message
+    def __init__(self, status, message):
+        super().__init__(status, message)
+        self.status = status
+        self.message = message
+
+
+def is_loopback(host):
+    if host == 'localhost':
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+def parse_request(body):
+    # JSON body of POST /allocate -> (suffix, file content, capacities, mode, aliases, search budget). Raises RequestError.
+    try:
+        request = json.loads(body)
+    except (UnicodeDecodeError, json.JSONDecodeError):
+        raise RequestError(400, 'The body must be a JSON object')
+    if not isinstance(request, dict):
+        raise RequestError(400, 'The body must be a JSON object')
+    suffix = os.path.splitext(str(request.get('filename', '')))[1].lower()
+    if suffix not in SUFFIXES:
+        raise RequestError(400, 'filename must end with .xlsx or .csv')
+    try:
+        content = base64.b64decode(request.get('students', ''), validate=True)
+    except (TypeError, binascii.Error):
+        raise RequestError(400, 'students must be the spreadsheet encoded in base64')
+    capacities = request.get('capacities')
+    if not isinstance(capacities, dict) or \
+            not all(isinstance(cap, int) and not isinstance(cap, bool) and cap >= 0 for cap in capacities.values()):
+        raise RequestError(400, 'capacities must map every subject to a whole number of seats')
+    mode = request.get('mode', 'heuristic')
+    if mode not in ALLOCATION_MODES:
+        raise RequestError(400, f'mode must be one of {", ".join(ALLOCATION_MODES)}')
+    aliases = request.get('aliases') or {}
+    if not isinstance(aliases, dict):
+        raise RequestError(400, 'aliases must map spellings to subjects')
+    search_budget = request.get('search_budget', 0)
+    if isinstance(search_budget, bool) or not isinstance(search_budget, (int, float)) \
+            or not 0 <= search_budget <= MAX_SEARCH_BUDGET:
+        raise RequestError(400, f'search_budget must be a number of seconds from 0 to {MAX_SEARCH_BUDGET}')
+    return suffix, content, capacities, mode, aliases, search_budget
+
+
+def request_key(suffix, content, capacities, mode, aliases, search_budget):
+    # Hash of everything the answer depends on
+    digest = hashlib.sha256(json.dumps([suffix, sorted(capacities.items()), mode, sorted(aliases.items()),
+                                        search_budget]).encode('utf-8'))
+    digest.update(content)
+    return digest.hexdigest()
+
+
+def start_worker(cache_directory):
+    # Pool initializer
+    global worker_cache
+    worker_cache = ImportCache(cache_directory) if cache_directory else None
+
+
+def allocate_upload(suffix, content, capacities, mode, aliases, search_budget):
+    # One allocation, in a worker process. Returns the answer without 'cached' and 'seconds'. Raises RequestError.
+    messages = io.StringIO()  # The engine's ERRORs and NOTEs, sent back as notes
+    with tempfile.TemporaryDirectory() as directory, contextlib.redirect_stdout(messages):
+        filename = os.path.join(directory, f'students{suffix}')
+        with open(filename, 'wb') as f:
+            f.write(content)
+        engine = AllocationEngine(SubjectAliases(aliases))
+        try:
+            imported = engine.import_file(filename, cache=worker_cache)
+        except Exception as error:  # Not a readable spreadsheet at all
+            raise RequestError(400, f'The spreadsheet could not be read: {type(error).__name__}: {error}')
+    notes = messages.getvalue().splitlines()
+    if not imported:
+        raise RequestError(400, ' '.join(notes) or 'The spreadsheet could not be imported')
+    engine.allocate(capacities, mode, search_budget=search_budget)
+    df = engine.form_result_df()
+    return {
+        'result': engine.summarize_results(),
+        'students': len(engine.names),
+        'unallocated': len(engine.unlucky_students),
+        'columns': df.columns.tolist(),
+        'rows': df.values.tolist(),
+        'notes': notes,
+        'report': engine.allocation_report()
+    }
+
+
+class AllocationService(object):
+    def __init__(self, workers=None, cache_directory=None, cache_entries=DEFAULT_CACHE_ENTRIES):
+        self.pool = ProcessPoolExecutor(workers, initializer=start_worker, initargs=(cache_directory,))
+        self.cache_entries = cache_entries
+        self.answers = OrderedDict()  # Request key -> answer, least recently used first
+        self.running = {}  # Request key -> future of the allocation, shared by identical requests
+        self.counters = {'requests': 0, 'allocations': 0, 'cache_hits': 0, 'errors': 0}
+
+    async def allocate(self, body):
+        start = time.perf_counter()
+        request = parse_request(body)
+        key = request_key(*request)
+        cached = key in self.answers or key in self.running
+        if key in self.answers:
+            self.answers.move_to_end(key)
+            answer = self.answers[key]
+        elif key in self.running:
+            answer = await asyncio.shield(self.running[key])
+        else:
+            future = asyncio.get_running_loop().run_in_executor(self.pool, allocate_upload, *request)
+            self.running[key] = future
+            self.counters['allocations'] += 1
+            try:
+                answer = await future
+            finally:
+                del self.running[key]
+            self.answers[key] = answer
+            if len(self.answers) > self.cache_entries:
+                self.answers.popitem(last=False)
+        self.counters['cache_hits'] += cached
+        return dict(answer, cached=cached, seconds=round(time.perf_counter() - start, 6))
+
+    async def respond(self, method, path, body):
+        # (status, answer) of one request
+        self.counters['requests'] += 1
+        try:
+            if path == '/allocate':
+                if method != 'POST':
+                    raise RequestError(405, 'Use POST /allocate')
+                return 200, await self.allocate(body)
+            if path == '/health':
+                return 200, dict(self.counters, status='ok')
+            raise RequestError(404, f'No such path: {path}')
+        except RequestError as error:
+            self.counters['errors'] += 1
+            return error.status, {'error': error.message}
+        except Exception as error:
+            self.counters['errors'] += 1
+            return 500, {'error': f'{type(error).__name__}: {error}'}
+
+    async def handle(self, reader, writer):
+        # One connection. HTTP/1.1 keeps it open for further requests unless the client asks to close it.
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                try:
+                    method, path, version = request_line.decode('latin-1').split()
+                    length = int(headers.get('content-length', 0))
+                    if length < 0:
+                        raise ValueError(length)
+                except ValueError:
+                    await self.send(writer, 400, {'error': 'Malformed request'}, False)
+                    break
+                if length > MAX_BODY_BYTES:
+                    await self.send(writer, 413, {'error': f'Requests are limited to {MAX_BODY_BYTES} bytes'}, False)
+                    break
+                body = await reader.readexactly(length)
+                status, answer = await self.respond(method, path.split('?')[0], body)
+                keep_alive = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+                await self.send(writer, status, answer, keep_alive)
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass  # The client went away
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def send(writer, status, answer, keep_alive):
+        body = json.dumps(answer).encode('utf-8')
+        head = (f'HTTP/1.1 {status} {HTTPStatus(status).phrase}\r\nContent-Type: application/json\r\n'
+                f'Content-Length: {len(body)}\r\nConnection: {"keep-alive" if keep_alive else "close"}\r\n\r\n')
+        writer.write(head.encode('latin-1') + body)
+        await writer.drain()
+
+    async def serve(self, host=DEFAULT_HOST, port=DEFAULT_PORT, ready=None):
+        # Runs until cancelled. ready(port) is called once the service accepts connections.
+        if not is_loopback(host):
+            raise ValueError(f'The service only listens on localhost, not {host}')
+        server = await asyncio.start_server(self.handle, host, port, limit=MAX_BODY_BYTES)
+        async with server:
+            if ready is not None:
+                ready(server.sockets[0].getsockname()[1])
+            await server.serve_forever()
+
+    def close(self):
+        self.pool.shutdown(cancel_futures=True)
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description='Serve allocations over HTTP/JSON on localhost.')
+    parser.add_argument('--host', default=DEFAULT_HOST, help=f'Loopback address to listen on (default {DEFAULT_HOST})')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help=f'Port (default {DEFAULT_PORT}, 0 for any free port)')
+    parser.add_argument('--workers', type=int, help='Worker processes for the allocations (default: one per core)')
+    parser.add_argument('--cache', nargs='?', const=DEFAULT_CACHE_DIR, metavar='DIR',
+                        help=f'Keep imported spreadsheets in an on-disk cache (default {DEFAULT_CACHE_DIR})')
+    parser.add_argument('--cache-entries', type=int, default=DEFAULT_CACHE_ENTRIES,
+                        help=f'Answers kept in memory (default {DEFAULT_CACHE_ENTRIES})')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if not is_loopback(args.host):
+        print(f'ERROR: The service only listens on localhost, not {args.host}')
+        return 2
+    service = AllocationService(args.workers, args.cache, args.cache_entries)
+
+    def ready(port):
+        print(f'Serving allocations on http://{args.host}:{port}', flush=True)
+
+    async def serve_until_stopped():
+        # SIGTERM stops the service like Ctrl+C, so the worker pool is shut down too (Windows has no signal handlers)
+        serving = asyncio.ensure_future(service.serve(args.host, args.port, ready))
+        with contextlib.suppress(NotImplementedError):
+            asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, serving.cancel)
+        with contextlib.suppress(asyncio.CancelledError):
+            await serving
+    try:
+        asyncio.run(serve_until_stopped())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
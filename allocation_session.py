@@ -0,0 +1,111 @@
+"""
+One cohort being worked on: its import, its allocation and the allocations tried so far.
+
+The desktop app used to keep the engine and the import_success / allocate_success flags in module globals, so one process
+could only hold one cohort. An AllocationSession holds all of it, so several cohorts (year groups, schools) can be
+imported and allocated side by side, each on its own thread, without sharing anything but the on-disk import cache.
+
+Every method that reads or changes the session takes its lock, so a session can be used from several threads.
+check_capacities is the exception: it only reads the bounds, which import_file builds before the engine is swapped in
+and which never change, so the desktop app can show them while an allocation holds the lock.
+An import builds a new AllocationEngine and only swaps it in once it is complete, and a cancelled or failed import
+or allocation leaves the flags False, so a half-done job is never shown or written out.
+
+allocation_engine is only imported once a session imports something, so the desktop app still starts without pandas.
+"""
+
+import threading
+
+from result_cache import ResultCache
+
+
+class AllocationSession(object):
+    def __init__(self, aliases=None, name=''):
+        self.name = name  # What the user calls the cohort, e.g. a year group
+        self.aliases = aliases  # SubjectAliases used by every import, None for none
+        self.lock = threading.RLock()
+        self.engine = None  # AllocationEngine of the last successful import
+        self.imported = False  # Whether engine holds a complete import
+        self.allocated = False  # Whether engine holds a complete allocation of it
+        self.result_cache = ResultCache()  # Allocations tried so far, see result_cache.py
+
+    def reset(self):
+        with self.lock:
+            self.engine = None
+            self.imported = False
+            self.allocated = False
+
+    def import_file(self, filename, progress=None, cache=None):
+        # Same as AllocationEngine.import_file. The session is empty while the file is read, and holds it once it is in.
+        from allocation_engine import AllocationEngine  # Usually preloaded by now, see startup.py
+        self.reset()
+        importing = AllocationEngine(self.aliases)
+        if not importing.import_file(filename, progress=progress, cache=cache):
+            return False
+        importing.allocation_bounds()  # Built before anyone can see the engine, see check_capacities
+        with self.lock:
+            self.engine = importing
+            self.imported = True
+        return True
+
+    def allocate(self, capacities, mode='heuristic', progress=None, search_budget=0):
+        with self.lock:
+            self.require_import()
+            self.allocated = False  # Until the allocation is done, also when it is cancelled
+            self.engine.allocate(capacities, mode, progress, self.result_cache, search_budget)
+            self.allocated = True
+
+    def check_capacities(self, capacities):
+        # Bounds of capacities without allocating, see AllocationEngine.check_capacities.
+        # Takes no lock, so it returns while an allocation runs. The engine is read once, an import may reset it meanwhile.
+        engine = self.engine
+        if engine is None:
+            raise RuntimeError(f'Nothing imported in session {self.name}'.rstrip())
+        return engine.check_capacities(capacities)
+
+    def change_capacity(self, subject, capacity, progress=None):
+        # Allocate again after one capacity changed, see AllocationEngine.change_capacity
+        with self.lock:
+            self.require_import()
+            self.allocated = False
+            self.engine.change_capacity(subject, capacity, progress, self.result_cache)
+            self.allocated = True
+
+    def restore_allocation(self, cached):
+        # Show a CachedAllocation of this session again
+        with self.lock:
+            self.require_import()
+            self.result_cache.get(ResultCache.key(self.engine.fingerprint(), cached.capacity, cached.mode))  # Most recently used
+            self.engine.restore_allocation(cached)
+            self.allocated = True
+
+    def configurations(self):
+        # Allocations of the imported choices tried so far, oldest first
+        with self.lock:
+            return self.result_cache.configurations(self.engine.fingerprint()) if self.imported else []
+
+    def results(self):
+        # Everything the result labels show, read at once: (students per rank, students, unallocated, report)
+        with self.lock:
+            self.require_allocation()
+            engine = self.engine
+            return engine.summarize_results(), len(engine.names), len(engine.unlucky_students), engine.allocation_report()
+
+    def output(self, filename, progress=None):
+        # Write the allocation to filename. Returns the file written.
+        progress = progress if progress is not None else (lambda message: None)
+        with self.lock:
+            self.require_allocation()
+            progress('Forming result...')
+            df = self.engine.form_result_df()
+        progress('Writing file...')
+        return self.engine.output_df(df, filename)
+
+    def require_import(self):
+        if not self.imported:
+            raise RuntimeError(f'Nothing imported in session {self.name}'.rstrip())
+
+    def require_allocation(self):
+        self.require_import()
+        if not self.allocated:
+            raise RuntimeError(f'Nothing allocated in session {self.name}'.rstrip())
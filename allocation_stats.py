@@ -0,0 +1,123 @@
+"""
+Instrumentation of one allocation.
+
+AllocationEngine.allocate fills an AllocationStats with:
+- the wall time of every phase
+- per optimize round: the unallocated students it was tried on, the candidate pairs it examined and how often it succeeded.
+  A candidate pair is one AllocationIndex lookup, i.e. "the earliest student with subject X as choice i and subject Y as choice j".
+- how often each of the swap algorithms Algo 1-15 succeeded (see the algorithm docs at the bottom of allocation_engine.py)
+- the chains, moves and progress trace of the local search, if it ran (local_search.py)
+- the upper bounds on the students placed and the 1st choices, if they were needed and checked before (allocation_bounds.py)
+
+report() returns plain dicts, ready for json.dump. format_report turns a report into text for the GUI.
+"""
+
+import time
+
+ALGORITHMS = list(range(1, 16))
+ROUNDS = ['first_optimize', 'round_1', 'round_2', 'round_3', 'round_4', 'round_5']
+ROUND_ALGORITHMS = {
+    'first_optimize': [1, 2],
+    'round_1': [3, 11],
+    'round_2': [5, 6, 7],
+    'round_3': [4, 8, 12, 13],
+    'round_4': [10, 15],
+    'round_5': [9, 14]
+}
+
+MAX_SHORT_SUBJECTS = 5  # Subjects short of seats named by format_bounds
+
+
+class AllocationStats(object):
+    def __init__(self, mode, search_budget=0):
+        self.mode = mode
+        self.search_budget = search_budget  # Seconds of local search after the heuristic mode, 0 for none
+        self.search = None  # LocalSearch.report of the local search, if it ran
+        self.bounds = None  # AllocationBounds.check of the capacities, if students were left after the greedy passes
+        # and the capacities were checked before allocating (AllocationEngine.limit_placement)
+        self.phase_times = {}  # Phase -> seconds, in the order the phases ran
+        self.rounds = {name: {'students': 0, 'pairs_examined': 0, 'successes': 0} for name in ROUNDS}
+        self.algo_successes = {algo: 0 for algo in ALGORITHMS}
+
+    def time(self, phase, function, *args):
+        # Run function(*args) and add its wall time to phase
+        start = time.perf_counter()
+        result = function(*args)
+        self.phase_times[phase] = self.phase_times.get(phase, 0.0) + time.perf_counter() - start
+        return result
+
+    def count_round(self, name, pairs_examined, success):
+        counts = self.rounds[name]
+        counts['students'] += 1
+        counts['pairs_examined'] += pairs_examined
+        counts['successes'] += 1 if success else 0
+
+    def count_algo(self, algo):
+        self.algo_successes[algo] += 1
+
+    def add_report(self, report):
+        # Add the round counters and algorithm successes of another allocation's report, e.g. of one component
+        for name, counts in report['rounds'].items():
+            for key, value in counts.items():
+                self.rounds[name][key] += value
+        for algo, count in report['algorithms'].items():
+            self.algo_successes[int(algo)] += count
+
+    def report(self):
+        return {
+            'mode': self.mode,
+            'phases': {phase: round(seconds, 6) for phase, seconds in self.phase_times.items()},
+            'total_time': round(sum(self.phase_times.values()), 6),
+            'rounds': {name: dict(counts) for name, counts in self.rounds.items()},
+            'algorithms': {str(algo): count for algo, count in self.algo_successes.items()},
+            'search': self.search,
+            'bounds': self.bounds
+        }
+
+
+def format_report(report):
+    lines = [f"Mode: {report['mode']}, total {report['total_time']:.3f} s", 'Phases:']
+    if report.get('cached'):
+        lines[0] += ' (restored from cache, timings of the original run)'
+    for phase, seconds in report['phases'].items():
+        lines.append(f'  {phase}: {seconds:.4f} s')
+    if report['mode'] == 'heuristic':
+        lines.append('Rounds (students tried / candidate pairs examined / successes):')
+        for name, counts in report['rounds'].items():
+            algos = ', '.join(str(algo) for algo in ROUND_ALGORITHMS[name])
+            lines.append(f"  {name} (Algo {algos}): {counts['students']} / {counts['pairs_examined']} / {counts['successes']}")
+        fired = [f'Algo {algo}: {count}' for algo, count in report['algorithms'].items() if count > 0]
+        lines.append('Successful algorithms: ' + (', '.join(fired) if fired else 'none'))
+    if report.get('bounds'):
+        lines.append(format_bounds(report['bounds']))
+    if report.get('search'):
+        search = report['search']
+        first, last = search['trace'][0], search['trace'][-1]
+        lines.append(f"Local search: {search['chains']} chains moved {search['moved']} students in {search['seconds']:.2f} s "
+                     f"(budget {search['budget']:g} s, stopped: {search['stopped']}), unallocated {first[1]} -> {last[1]}, "
+                     f"3rd or later choice {first[2]} -> {last[2]}")
+    if 'result' in report:
+        lines.append('Result: ' + ', '.join(f'{key} {value}' for key, value in report['result'].items()))
+    if 'memory' in report:
+        memory = report['memory']
+        lines.append(f'Memory: {sum(memory.values()) / 1e6:.2f} MB ('
+                     + ', '.join(f'{key} {size / 1e6:.2f} MB' for key, size in memory.items()) + ')')
+    return '\n'.join(lines)
+
+
+def format_bounds(bounds):
+    # One line for a report of AllocationBounds.check
+    line = (f"Bounds: at most {bounds['placed']}/{bounds['students']} students placed, "
+            f"at most {bounds['first_choice']} 1st choices ({bounds['seats']} seats)")
+    if bounds['short_subjects']:
+        line += '. Short of seats: ' + short_subjects_text(bounds)
+    return line
+
+
+def short_subjects_text(bounds):
+    # The subjects short of seats, naming at most MAX_SHORT_SUBJECTS of them
+    short = bounds['short_subjects']
+    if len(short) == bounds['subjects']:
+        return f'all {len(short)} subjects'
+    more = len(short) - MAX_SHORT_SUBJECTS
+    return ', '.join(short[:MAX_SHORT_SUBJECTS]) + (f' and {more} more' if more > 0 else '')
@@ -0,0 +1,308 @@
+"""
+Phase-level benchmark of the allocation engine.
+
+Every case generates a synthetic cohort (synthetic_cohort.py), writes it to a temporary csv, runs the same steps as
+AllocationEngine.import_file timing each phase on its own, then AllocationEngine.allocate, which times its own phases.
+Each case runs --repeat times and the fastest time of every phase is kept, which is the least noisy estimate.
+The allocation result (students per rank) is recorded too, so a comparison also catches changes in behaviour.
+
+Usage:
+python benchmark.py                                      # print the timings
+python benchmark.py --save benchmark_baseline.json       # record a baseline
+python benchmark.py --compare benchmark_baseline.json    # exit code 1 if a phase got slower than the tolerance allows
+python benchmark.py --incremental                        # single capacity changes: incremental repair vs full optimal rerun
+python benchmark.py --memory                             # bytes held after the import and the allocation, and their peaks
+
+--memory runs every case once more under tracemalloc, which slows it down, so its timings are not used.
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from allocation_engine import ALLOCATION_MODES, DEFAULT_CHUNK_SIZE, AllocationEngine, rank_costs
+from synthetic_cohort import generate_capacities, generate_cohort
+
+CASES = [
+    {'name': 'small', 'students': 300, 'subjects': 20, 'zipf': 1.0, 'seed': 1},
+    {'name': 'medium', 'students': 3000, 'subjects': 35, 'zipf': 1.0, 'seed': 2},
+    {'name': 'large', 'students': 30000, 'subjects': 40, 'zipf': 1.1, 'seed': 3},
+]
+QUICK_CASES = ['small', 'medium']
+IMPORT_PHASES = ['read_spreadsheet', 'convert_data_type', 'check_choice_repetition', 'process_subjects']
+HEURISTIC_PHASES = ['process_capacity', 'allocate_1st_choice', 'allocate_2nd_choice', 'build_index', 'first_optimize',
+                    'allocate_3rd_choice', 'final_help_unlucky']
+OPTIMAL_PHASES = ['process_capacity', 'optimal_allocate']
+OUTPUT_PHASES = ['form_result_df']
+DEFAULT_TOLERANCE = 0.25  # A phase regresses when it is this much slower than the baseline...
+MIN_REGRESSION = 0.005  # ...and at least this many seconds slower, so tiny phases don't fail on noise
+INCREMENTAL_CHANGES = 20  # Single capacity changes per case in --incremental
+MAX_CHANGE = 3  # Seats added or removed by one change
+
+
+def phases(mode):
+    return IMPORT_PHASES + (OPTIMAL_PHASES if mode == 'optimal' else HEURISTIC_PHASES) + OUTPUT_PHASES
+
+
+class PhaseTimer(object):
+    def __init__(self, mode):
+        self.times = {phase: 0.0 for phase in phases(mode)}  # Phases that are skipped (no unlucky students) stay at 0
+
+    def time(self, phase, function, *args):
+        start = time.perf_counter()
+        result = function(*args)
+        self.times[phase] += time.perf_counter() - start
+        return result
+
+
+def run_once(filename, capacities, mode):
+    # The steps of import_file, then allocate. Returns (engine, phase -> seconds).
+    timer = PhaseTimer(mode)
+    engine = AllocationEngine()
+    engine.start_import()
+    chunks = iter(engine.read_spreadsheet_chunks(filename, DEFAULT_CHUNK_SIZE))
+    while True:
+        chunk = timer.time('read_spreadsheet', next, chunks, None)
+        if chunk is None:
+            break
+        if not timer.time('convert_data_type', engine.convert_data_type, chunk):
+            raise ValueError(f'Import failed: {filename}')
+        timer.time('check_choice_repetition', engine.check_choice_repetition)
+    timer.time('process_subjects', engine.process_subjects)
+
+    engine.allocate(capacities, mode)
+    timer.times.update(engine.stats.phase_times)  # allocate times its own phases
+
+    timer.time('form_result_df', engine.form_result_df)
+    return engine, timer.times
+
+
+def write_case(case, directory):
+    # Writes the cohort of case to a csv. Returns (filename, capacities).
+    df = generate_cohort(case['students'], case['subjects'], case['zipf'], seed=case['seed'])
+    filename = os.path.join(directory, f"{case['name']}.csv")
+    df.to_csv(filename, index=False)
+    return filename, generate_capacities(case['students'], case['subjects'], case['zipf'])
+
+
+def run_case(case, mode, repeat, directory):
+    filename, capacities = write_case(case, directory)
+    best = None
+    for _ in range(repeat):
+        with contextlib.redirect_stdout(io.StringIO()):  # The engine's NOTEs about the messy rows
+            engine, times = run_once(filename, capacities, mode)
+        best = times if best is None else {phase: min(best[phase], seconds) for phase, seconds in times.items()}
+    result = engine.summarize_results()
+    result['unallocated'] = len(engine.unlucky_students)
+    return {
+        'params': dict(case, mode=mode),
+        'phases': {phase: round(seconds, 6) for phase, seconds in best.items()},
+        'total': round(sum(best.values()), 6),
+        'result': result
+    }
+
+
+def run_memory_case(case, mode, directory):
+    # Bytes still allocated after import_file and after allocate, and the peak during each, as traced by tracemalloc.
+    # Also the engine's own account of its structures (AllocationEngine.memory_usage).
+    filename, capacities = write_case(case, directory)
+    tracemalloc.start()
+    try:
+        engine = AllocationEngine()
+        with contextlib.redirect_stdout(io.StringIO()):
+            engine.import_file(filename)
+        imported, import_peak = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        engine.allocate(capacities, mode)
+        allocated, allocate_peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {
+        'params': dict(case, mode=mode),
+        'import': imported,
+        'import_peak': import_peak,
+        'allocate': allocated,
+        'allocate_peak': allocate_peak,
+        'per_student': round(allocated / case['students'], 1),
+        'structures': engine.memory_usage()
+    }
+
+
+def score(engine):
+    # (students placed, total rank_costs), which an incremental repair must match
+    costs = rank_costs(engine.choice_num)
+    ranks = [rank for rank in engine.rank if rank >= 0]
+    return len(ranks), sum(costs[rank] for rank in ranks)
+
+
+def median(values):
+    return sorted(values)[len(values) // 2]
+
+
+def run_incremental_case(case, changes):
+    # Change one random capacity by up to MAX_CHANGE seats at a time. Each change is applied incrementally
+    # to an optimal allocation and timed against a full optimal allocation with the same capacities.
+    df = generate_cohort(case['students'], case['subjects'], case['zipf'], seed=case['seed'])
+    capacities = generate_capacities(case['students'], case['subjects'], case['zipf'])
+    with contextlib.redirect_stdout(io.StringIO()):
+        engine, full = AllocationEngine(), AllocationEngine()
+        engine.import_df(df)
+        full.import_df(df)
+    engine.allocate(capacities, 'optimal')
+
+    rnd = random.Random(case['seed'])
+    build, incremental_times, full_times, mismatches = 0.0, [], [], 0
+    for _ in range(changes):
+        subject = rnd.choice(engine.subjects())
+        capacity = max(0, engine.capacity[engine.subject_id(subject)] + rnd.randint(-MAX_CHANGE, MAX_CHANGE))
+        engine.change_capacity(subject, capacity)
+        build += engine.stats.phase_times.get('build_incremental', 0.0)
+        incremental_times.append(engine.stats.phase_times['incremental_update'])
+        full.allocate(dict(zip(engine.subject_names, engine.capacity)), 'optimal')
+        full_times.append(sum(full.stats.phase_times.values()))
+        mismatches += score(engine) != score(full)
+    return {
+        'params': dict(case, changes=changes),
+        'build': round(build, 6),
+        'incremental_median': round(median(incremental_times), 6),
+        'incremental_max': round(max(incremental_times), 6),
+        'full_median': round(median(full_times), 6),
+        'speedup': round(median(full_times) / max(median(incremental_times), 1e-9), 1),
+        'mismatches': mismatches
+    }
+
+
+def environment():
+    return {
+        'date': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'platform': platform.platform(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'cpu_count': os.cpu_count()
+    }
+
+
+def print_report(report):
+    for name, case in report['cases'].items():
+        params = case['params']
+        print(f"{name}: {params['students']} students, {params['subjects']} subjects, {params['mode']} "
+              f"(total {case['total']:.4f} s)")
+        for phase, seconds in case['phases'].items():
+            print(f'  {phase:<24}{seconds:>10.4f} s')
+        print('  result: ' + ', '.join(f'{key} {value}' for key, value in case['result'].items()))
+
+
+def print_incremental(report):
+    for name, case in report['incremental'].items():
+        print(f"{name}: {case['params']['changes']} single capacity changes, built in {case['build']:.4f} s, "
+              f"incremental {case['incremental_median']:.4f} s (max {case['incremental_max']:.4f} s), "
+              f"full optimal {case['full_median']:.4f} s, {case['speedup']}x, {case['mismatches']} mismatches")
+
+
+def print_memory(report):
+    for name, case in report['memory'].items():
+        print(f"{name}: imported {case['import'] / 1e6:.2f} MB (peak {case['import_peak'] / 1e6:.2f} MB), "
+              f"allocated {case['allocate'] / 1e6:.2f} MB (peak {case['allocate_peak'] / 1e6:.2f} MB), "
+              f"{case['per_student']} bytes per student")
+        print('  ' + ', '.join(f'{key} {size / 1e6:.2f} MB' for key, size in case['structures'].items()))
+
+
+def allocation_time(case):
+    # Seconds of all the allocation phases of a case, including ones only some runs have (check_bounds, local_search)
+    return sum(seconds for phase, seconds in case['phases'].items() if phase not in IMPORT_PHASES + OUTPUT_PHASES)
+
+
+def compare(report, baseline, tolerance):
+    # Returns the list of regressions. Cases missing from the baseline are skipped, phases missing from it count as 0 s,
+    # so a new phase is caught like a slower one. The total allocation time is compared too.
+    regressions = []
+    for name, case in report['cases'].items():
+        if name not in baseline['cases']:
+            continue
+        base = baseline['cases'][name]
+        if base['params'] != case['params']:
+            print(f'NOTE: {name} has different parameters than the baseline, skipped')
+            continue
+        if base['result'] != case['result']:
+            regressions.append(f"{name}: result changed from {base['result']} to {case['result']}")
+        for phase, seconds in case['phases'].items():
+            before = base['phases'].get(phase, 0.0)
+            if seconds > before * (1 + tolerance) and seconds - before > MIN_REGRESSION:
+                regressions.append(f'{name}: {phase} took {seconds:.4f} s, baseline {before:.4f} s')
+        seconds, before = allocation_time(case), allocation_time(base)
+        if seconds > before * (1 + tolerance) and seconds - before > MIN_REGRESSION:
+            regressions.append(f'{name}: the allocation took {seconds:.4f} s, baseline {before:.4f} s')
+    for name, case in report.get('memory', {}).items():
+        base = baseline.get('memory', {}).get(name)
+        if base is None or base['params'] != case['params']:
+            continue
+        for key in ['import', 'allocate']:
+            if case[key] > base[key] * (1 + tolerance):
+                regressions.append(f'{name}: {case[key]} bytes held after {key}, baseline {base[key]}')
+    return regressions
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description='Time every phase of the allocation on synthetic cohorts.')
+    parser.add_argument('--mode', choices=ALLOCATION_MODES, default='heuristic')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per case, the fastest is kept (default 3)')
+    parser.add_argument('--quick', action='store_true', help=f"Only run {' and '.join(QUICK_CASES)}")
+    parser.add_argument('--incremental', action='store_true',
+                        help='Also time single capacity changes, incremental against a full optimal allocation')
+    parser.add_argument('--memory', action='store_true',
+                        help='Also measure the memory held after the import and the allocation (tracemalloc)')
+    parser.add_argument('--save', metavar='FILE', help='Write the timings as a JSON baseline')
+    parser.add_argument('--compare', metavar='FILE', help='Compare with a JSON baseline, exit code 1 on regressions')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help=f'Allowed slowdown per phase as a fraction (default {DEFAULT_TOLERANCE})')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    cases = [case for case in CASES if not args.quick or case['name'] in QUICK_CASES]
+    report = {'environment': environment(), 'repeat': args.repeat, 'cases': {}}
+    with tempfile.TemporaryDirectory() as directory:
+        for case in cases:
+            report['cases'][case['name']] = run_case(case, args.mode, args.repeat, directory)
+        if args.memory:
+            report['memory'] = {case['name']: run_memory_case(case, args.mode, directory) for case in cases}
+    print_report(report)
+    if args.memory:
+        print_memory(report)
+    if args.incremental:
+        report['incremental'] = {case['name']: run_incremental_case(case, INCREMENTAL_CHANGES) for case in cases}
+        print_incremental(report)
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f'Baseline written to {args.save}')
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f'REGRESSION: {regression}')
+        if regressions:
+            return 1
+        print('No regressions')
+    if args.incremental and any(case['mismatches'] for case in report['incremental'].values()):
+        print('ERROR: An incremental allocation differs from the full optimal allocation')
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
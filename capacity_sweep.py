@@ -0,0 +1,163 @@
+"""
+Capacity what-if sweep.
+
+Allocates every combination of candidate capacities and ranks the results: fewest unallocated students first,
+then fewest students below their 2nd choice (worst choices first), then fewest seats in total. The combinations are spread over a process pool using all cores.
+Each worker process receives the imported cohort once, through the pool initializer, and builds its own AllocationEngine.
+A task is only a capacity vector, so the cohort is never pickled per task.
+
+Usage:
+python capacity_sweep.py students.xlsx capacities.csv sweep.csv
+python capacity_sweep.py students.xlsx capacities.csv sweep.csv --mode optimal --top 20 -o ranked.xlsx
+
+The sweep file is a spreadsheet (xlsx or csv) or JSON object whose first two columns are subject and candidates:
+a range (10-14), a range with a step (10-20/5), a list (10,12,15) or a single capacity.
+Subjects not in it keep their capacity from the capacities file.
+"""
+
+import argparse
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from itertools import product
+from math import prod
+
+import pandas as pd
+
+from allocation_engine import ALLOCATION_MODES, AllocationEngine, read_capacities
+from subject_aliases import SubjectAliases, read_two_columns
+
+MAX_COMBINATIONS = 100000
+
+worker_engine = None  # AllocationEngine of this worker process, see start_worker
+worker_mode = None
+
+
+def parse_candidates(text):
+    # '10-14' -> [10, 11, 12, 13, 14], '10-20/5' -> [10, 15, 20], '10,12,15' -> [10, 12, 15], '12' -> [12]
+    values = set()
+    for part in str(text).replace(' ', '').split(','):
+        if '-' in part:
+            bounds, _, step = part.partition('/')
+            low, high = bounds.split('-')
+            values.update(range(int(low), int(high) + 1, int(step) if step else 1))
+        else:
+            values.add(int(float(part)))  # pandas reads a lone 12 as 12.0 in a column of ranges
+    if not values or min(values) < 0:
+        raise ValueError(f'Capacity candidates must be non-negative: {text}')
+    return sorted(values)
+
+
+def read_candidates(filename):
+    # Sweep file -> {subject: sorted candidate capacities}
+    return {subject: parse_candidates(text) for subject, text in read_two_columns(filename).items()}
+
+
+def start_worker(names, choices, subject_names, bounds, mode):
+    # Pool initializer: runs once per worker process with the cohort and its AllocationBounds, if built
+    global worker_engine, worker_mode
+    worker_engine = AllocationEngine()
+    worker_engine.load_import(names, choices, subject_names, bounds)
+    worker_mode = mode
+
+
+def allocate_vector(capacity):
+    # One task: allocate with a capacity per subject id, return the counts
+    engine = worker_engine
+    engine.allocate(dict(zip(engine.subject_names, capacity)), worker_mode)
+    return (sum(capacity),) + tuple(engine.summarize_results().values()) + (len(engine.unlucky_students),)
+
+
+def sweep(engine, base_capacities, candidates, mode='heuristic', workers=None, progress=None):
+    # Allocate every combination of candidates (subject -> capacities) on top of base_capacities (subject -> capacity).
+    # Returns a list of rows {subject: capacity for the swept subjects, 'Seats', '1st', '2nd', ..., 'Unallocated'}, ranked.
+    # progress(done, total) is called as results come in. workers=1 allocates in this process.
+    swept = []
+    for subject in candidates:
+        subject_id = engine.subject_id(subject)
+        if subject_id is None:
+            raise KeyError(f'{subject} is not chosen by any student')
+        swept.append(subject_id)
+    total = prod(len(values) for values in candidates.values())
+    if total > MAX_COMBINATIONS:
+        raise ValueError(f'{total} combinations, the limit is {MAX_COMBINATIONS}. Narrow the candidates down.')
+
+    base = [0] * len(engine.subject_names)
+    for subject, cap in base_capacities.items():
+        subject_id = engine.subject_id(subject)
+        if subject_id is not None:
+            base[subject_id] = cap
+
+    def vectors():
+        for values in product(*candidates.values()):
+            capacity = list(base)
+            for subject_id, cap in zip(swept, values):
+                capacity[subject_id] = cap
+            yield tuple(capacity)
+
+    workers = workers or os.cpu_count() or 1
+    cohort = (engine.names, engine.choice_matrix(), engine.subject_names, engine.bounds, mode)
+    if workers == 1:
+        start_worker(*cohort)
+        results = map(allocate_vector, vectors())
+        rows = collect(engine, swept, candidates, results, total, progress)
+    else:
+        with ProcessPoolExecutor(workers, initializer=start_worker, initargs=cohort) as pool:
+            results = pool.map(allocate_vector, vectors(), chunksize=max(1, total // (workers * 8)))
+            rows = collect(engine, swept, candidates, results, total, progress)
+    worst_first = engine.choice_labels()[:1:-1]
+    rows.sort(key=lambda row: (row['Unallocated'],) + tuple(row[label] for label in worst_first) + (row['Seats'],))
+    return rows
+
+
+def collect(engine, swept, candidates, results, total, progress):
+    # Results come back in the order of the combinations
+    rows = []
+    columns = ['Seats'] + engine.choice_labels() + ['Unallocated']
+    for done, (values, counts) in enumerate(zip(product(*candidates.values()), results), 1):
+        row = {engine.subject_names[subject_id]: cap for subject_id, cap in zip(swept, values)}
+        row.update(zip(columns, counts))
+        rows.append(row)
+        if progress is not None:
+            progress(done, total)
+    return rows
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description='Allocate every combination of candidate capacities and rank the results.')
+    parser.add_argument('students', help='Student choices exported from Google Forms (xlsx or csv)')
+    parser.add_argument('capacities', help='Capacities of the subjects that are not swept (xlsx, csv or json)')
+    parser.add_argument('sweep', help='Candidate capacities per subject (xlsx, csv or json), e.g. Biology,10-14')
+    parser.add_argument('-o', '--output', help='Where to write the ranked table (xlsx or csv)')
+    parser.add_argument('--mode', choices=ALLOCATION_MODES, default='heuristic')
+    parser.add_argument('--workers', type=int, help='Worker processes (default: one per core)')
+    parser.add_argument('--top', type=int, default=10, help='Rows of the ranked table to print (default 10)')
+    parser.add_argument('--aliases', metavar='FILE',
+                        help='Alias table (xlsx, csv or json) mapping other spellings to one subject')
+    return parser.parse_args(argv)
+
+
+def show_progress(done, total):
+    if done % max(1, total // 100) != 0 and done != total:
+        return
+    print(f'\rAllocating... {done}/{total} combinations', end='', file=sys.stderr, flush=True)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    engine = AllocationEngine(SubjectAliases.from_file(args.aliases) if args.aliases else None)
+    if not engine.import_file(args.students):
+        return 1
+    rows = sweep(engine, read_capacities(args.capacities), read_candidates(args.sweep), args.mode, args.workers,
+                 show_progress)
+    print(file=sys.stderr)
+
+    df = pd.DataFrame(rows)
+    print(df.head(args.top).to_string(index=False))
+    if args.output:
+        print(f'Ranked table written to {engine.output_df(df, args.output)}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
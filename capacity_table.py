@@ -0,0 +1,105 @@
+"""
+Capacity table of the desktop app.
+
+CapacityTableModel has one row per subject: the subject, its capacity (editable) and its demand,
+i.e. how many students chose it as their 1st, 2nd, 3rd, ... choice, one column per choice of the import.
+A QTableView over the model only paints the rows that are scrolled into view, so thousands of subjects are no slower than a screenful.
+"""
+
+from PyQt5 import QtCore, QtGui, QtWidgets
+
+COLUMNS = ['Subject', 'Capacity']  # Then one demand column per choice
+CAPACITY_COLUMN = 1
+DEMAND_COLUMN = 2  # The first one
+MAX_CAPACITY = 999999
+ROW_COLORS = [QtGui.QColor(0, 143, 53), QtGui.QColor(0, 0, 0)]  # Alternating green and black, like the rest of the app
+
+
+class CapacityTableModel(QtCore.QAbstractTableModel):
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.subjects = []
+        self.capacity = []
+        self.demand = []  # Row -> (1st, 2nd, ... choice demand)
+        self.columns = COLUMNS + ['1st', '2nd', '3rd']
+
+    def load(self, subjects, demand, rank_labels):
+        # demand: row -> number of students with the subject as every choice, labelled by rank_labels ('1st', ...).
+        # Capacities start at 0.
+        self.beginResetModel()
+        self.columns = COLUMNS + list(rank_labels)
+        self.subjects = list(subjects)
+        self.capacity = [0] * len(self.subjects)
+        self.demand = [tuple(int(count) for count in counts) for counts in demand]
+        self.endResetModel()
+
+    def set_capacities(self, capacity):
+        # capacity: row -> capacity, e.g. a configuration tried before
+        self.capacity = [int(cap) for cap in capacity]
+        if self.subjects:
+            self.dataChanged.emit(self.index(0, CAPACITY_COLUMN), self.index(len(self.subjects) - 1, CAPACITY_COLUMN),
+                                  [QtCore.Qt.DisplayRole, QtCore.Qt.EditRole])
+
+    def capacities(self):
+        # Key = subject. Value = capacity.
+        return dict(zip(self.subjects, self.capacity))
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        return 0 if parent.isValid() else len(self.subjects)
+
+    def columnCount(self, parent=QtCore.QModelIndex()):
+        return 0 if parent.isValid() else len(self.columns)
+
+    def data(self, index, role=QtCore.Qt.DisplayRole):
+        row, column = index.row(), index.column()
+        if role == QtCore.Qt.DisplayRole or role == QtCore.Qt.EditRole:
+            if column == 0:
+                return self.subjects[row]
+            if column == CAPACITY_COLUMN:
+                return self.capacity[row]
+            return self.demand[row][column - DEMAND_COLUMN]
+        if role == QtCore.Qt.ForegroundRole:
+            return QtGui.QBrush(ROW_COLORS[row % 2])
+        if role == QtCore.Qt.TextAlignmentRole and column != 0:
+            return int(QtCore.Qt.AlignRight | QtCore.Qt.AlignVCenter)
+        if role == QtCore.Qt.ToolTipRole and column == 0:
+            return self.subjects[row]  # Long names are cut off in the table
+        return None
+
+    def setData(self, index, value, role=QtCore.Qt.EditRole):
+        if role != QtCore.Qt.EditRole or index.column() != CAPACITY_COLUMN:
+            return False
+        try:
+            value = int(value)
+        except (TypeError, ValueError):
+            return False
+        if value < 0:
+            return False
+        self.capacity[index.row()] = value
+        self.dataChanged.emit(index, index, [QtCore.Qt.DisplayRole, QtCore.Qt.EditRole])
+        return True
+
+    def flags(self, index):
+        flags = super().flags(index)
+        if index.column() == CAPACITY_COLUMN:
+            flags |= QtCore.Qt.ItemIsEditable
+        return flags
+
+    def headerData(self, section, orientation, role=QtCore.Qt.DisplayRole):
+        if orientation != QtCore.Qt.Horizontal:
+            return None
+        if role == QtCore.Qt.DisplayRole:
+            return self.columns[section]
+        if role == QtCore.Qt.ToolTipRole and section >= DEMAND_COLUMN:
+            return f'Number of students with the subject as {self.columns[section]} choice'
+        return None
+
+
+class CapacityDelegate(QtWidgets.QStyledItemDelegate):
+    # Capacities are edited with a spin box that can't go below 0
+    def createEditor(self, parent, option, index):
+        spin_box = QtWidgets.QSpinBox(parent)
+        spin_box.setRange(0, MAX_CAPACITY)
+        spin_box.setFrame(False)
+        spin_box.valueChanged.connect(lambda: self.commitData.emit(spin_box))  # Every step reaches the model, for live results
+        return spin_box
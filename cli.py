@@ -0,0 +1,126 @@
+"""
+Command line entry point for the allocation engine. Does not import Qt, so it can run on servers without a display.
+
+Usage:
+python cli.py students.xlsx capacities.csv -o result.xlsx
+python cli.py students.xlsx capacities.csv -o result.xlsx --mode optimal
+python cli.py students.xlsx capacities.csv -o result.xlsx --search-budget 30
+python cli.py students.xlsx --capacity-template capacities.csv
+python cli.py students.xlsx capacities.csv --aliases aliases.csv
+python cli.py students.xlsx capacities.csv --report report.json
+python cli.py students.xlsx capacities.csv --cache
+python cli.py students.xlsx capacities.csv --workers 8
+
+The capacities file is a spreadsheet (xlsx or csv) whose first two columns are subject and capacity,
+or a JSON object {subject: capacity}. Use --capacity-template to write one with every imported subject.
+The aliases file has the same layout with alias and subject (see subject_aliases.py).
+"""
+
+import argparse
+import contextlib
+import json
+import sys
+
+from allocation_engine import ALLOCATION_MODES, DEFAULT_CHUNK_SIZE, AllocationEngine, read_capacities
+from allocation_stats import short_subjects_text
+from import_cache import DEFAULT_CACHE_DIR, ImportCache
+from subject_aliases import SubjectAliases
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description='Allocate Extended Essay subjects without the desktop app.')
+    parser.add_argument('students', help='Student choices exported from Google Forms (xlsx or csv)')
+    parser.add_argument('capacities', nargs='?', help='Subject capacities (xlsx, csv or json)')
+    parser.add_argument('-o', '--output', help='Where to write the allocation result (xlsx or csv)')
+    parser.add_argument('--mode', choices=ALLOCATION_MODES, default='heuristic',
+                        help='heuristic: greedy passes and swap algorithms (default). optimal: exact min-cost flow')
+    parser.add_argument('--search-budget', type=float, default=0, metavar='SECONDS',
+                        help='Improve a heuristic allocation by local search for up to SECONDS (default 0: none)')
+    parser.add_argument('--workers', type=int, metavar='N',
+                        help='Allocate groups of students that share no subject separately, on N processes (0: one per core)')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+                        help=f'Rows of the student spreadsheet read at a time (default {DEFAULT_CHUNK_SIZE})')
+    parser.add_argument('--aliases', metavar='FILE',
+                        help='Alias table (xlsx, csv or json) mapping other spellings to one subject')
+    parser.add_argument('--report', metavar='FILE',
+                        help='Write the phase timings, optimize round counters and swap algorithm successes as JSON (- for stdout)')
+    parser.add_argument('--cache', nargs='?', const=DEFAULT_CACHE_DIR, metavar='DIR',
+                        help=f'Reuse the import of an unchanged spreadsheet from an on-disk cache (default {DEFAULT_CACHE_DIR})')
+    parser.add_argument('--capacity-template', metavar='FILE',
+                        help='Write a capacities file listing every imported subject, then exit')
+    return parser.parse_args(argv)
+
+
+def show_import_progress(rows):
+    print(f'\rImporting... {rows} rows processed', end='', file=sys.stderr, flush=True)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.report != '-':
+        return run(args, sys.stdout)
+    report_file = sys.stdout
+    with contextlib.redirect_stdout(sys.stderr):  # Only the JSON report goes to stdout, so it can be parsed
+        return run(args, report_file)
+
+
+def run(args, report_file):
+    # Import, allocate and write out. report_file receives the JSON report of --report -.
+    engine = AllocationEngine(SubjectAliases.from_file(args.aliases) if args.aliases else None)
+    cache = ImportCache(args.cache) if args.cache else None
+    imported = engine.import_file(args.students, args.chunk_size, show_import_progress, cache)
+    print(file=sys.stderr)
+    if not imported:
+        return 1
+
+    if args.capacity_template:
+        import pandas as pd
+        template = pd.DataFrame({'Subject': engine.subjects(), 'Capacity': 0})
+        print(f'Capacity template written to {engine.output_df(template, args.capacity_template)}')
+        return 0
+
+    if not args.capacities:
+        print('ERROR: A capacities file is required to allocate')
+        return 2
+
+    capacities = read_capacities(args.capacities)
+    for subject in capacities:
+        if engine.subject_id(subject) is None:
+            print(f'NOTE: {subject} is not chosen by any student')
+    given = {engine.subject_id(subject) for subject in capacities}
+    for subject in engine.subjects():
+        if engine.subject_ids[subject] not in given:
+            print(f'NOTE: No capacity given for {subject}, using 0')
+    bounds = engine.check_capacities(capacities)
+    if bounds['short_subjects']:
+        print(f"NOTE: At most {bounds['placed']}/{bounds['students']} students can be placed. "
+              f"Short of seats: {short_subjects_text(bounds)}")
+
+    if args.workers is not None:
+        if args.search_budget:
+            print('NOTE: --search-budget is ignored with --workers')
+        engine.allocate_components(capacities, args.mode, args.workers or None)
+    else:
+        engine.allocate(capacities, args.mode, search_budget=args.search_budget)
+    record = engine.summarize_results()
+    for label, count in record.items():
+        print(f'{label} Choice Receivers: {count}')
+    if len(engine.unlucky_students) == 0:
+        print(f'Allocation Complete: {len(engine.names)}/{len(engine.names)} students allocated')
+    else:
+        print(f'Allocation Incomplete: {sum(record.values())}/{len(engine.names)} students allocated')
+        print(f'Unallocated Students: {len(engine.unlucky_students)}')
+
+    if args.output:
+        print(f'Result written to {engine.output_df(engine.form_result_df(), args.output)}')
+    if args.report == '-':
+        print(json.dumps(engine.allocation_report(), indent=2), file=report_file)
+    elif args.report:
+        with open(args.report, 'w') as f:
+            json.dump(engine.allocation_report(), f, indent=2)
+        print(f'Report written to {args.report}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,55 @@
+"""
+Independent groups of students.
+
+Two students can only affect each other's allocation through a subject, so the subjects that appear together in someone's
+choices form connected components (union-find over the distinct choice pairs), and so do the students choosing them.
+A cohort of several schools, or of sciences and arts students who never mix, splits into one component per group.
+Each component can then be allocated on its own, see AllocationEngine.allocate_components.
+
+VIOLATION (id 0) links nothing: students who repeated a choice still only share their real subjects.
+"""
+
+import numpy as np
+
+VIOLATION = 0  # Same as allocation_engine.VIOLATION
+
+
+def find_components(choices, subject_num):
+    # choices: the N x k AllocationEngine choice matrix. Returns (component of every student, component of every subject),
+    # numbered in the order the components first appear in submission order. VIOLATION is -1, unless some student
+    # has no other choice. Then it is a component of its own.
+    parent = list(range(subject_num))
+
+    def find(subject):
+        while parent[subject] != subject:
+            parent[subject] = parent[parent[subject]]
+            subject = parent[subject]
+        return subject
+
+    # A student belongs to the component of their first choice that is not VIOLATION, which every other choice links to
+    first = choices[np.arange(len(choices)), np.argmax(choices != VIOLATION, axis=1)]
+    links = [np.stack([first, choices[:, j]], axis=1) for j in range(choices.shape[1])]
+    pairs = np.unique(np.concatenate(links), axis=0) if len(choices) else []
+    for a, b in pairs:
+        if a != VIOLATION and b != VIOLATION:
+            root_a, root_b = find(a), find(b)
+            if root_a != root_b:
+                parent[root_b] = root_a
+    roots = np.array([find(subject) for subject in range(subject_num)], dtype=np.intc)
+
+    student_roots = roots[first]
+    _, first_seen, student_components = np.unique(student_roots, return_index=True, return_inverse=True)
+    order = np.argsort(np.argsort(first_seen, kind='stable'), kind='stable')  # Renumber by first appearance
+    student_components = order[student_components]
+
+    subject_components = np.full(subject_num, -1, dtype=np.intp)
+    subject_components[roots[first]] = student_components  # Every root that heads a student
+    subject_components = subject_components[roots]
+    return student_components, subject_components
+
+
+def split(student_components, component_num):
+    # Positions of the students of every component, in submission order
+    order = np.argsort(student_components, kind='stable')
+    bounds = np.cumsum(np.bincount(student_components, minlength=component_num))[:-1]
+    return np.split(order, bounds)
@@ -0,0 +1,53 @@
+"""
+Background tasks for the desktop app.
+
+Import, allocation and output run on an EngineTask (a QThread), so the window keeps repainting and the cancel button keeps working.
+The job reports progress through a callback, which is also where a cancel request stops it: once cancel() is called,
+the next report raises Cancelled, so the engine is only ever stopped between two steps.
+The result comes back through the succeeded signal, which Qt delivers on the GUI thread, where the labels can be updated.
+"""
+
+import time
+
+from PyQt5 import QtCore
+
+PROGRESS_INTERVAL = 0.05  # Seconds between two progress signals, so fast loops don't flood the event queue
+
+
+class Cancelled(Exception):
+    pass
+
+
+class EngineTask(QtCore.QThread):
+    progress = QtCore.pyqtSignal(str)
+    succeeded = QtCore.pyqtSignal(object)  # Whatever the job returned
+    failed = QtCore.pyqtSignal(str)
+    cancelled = QtCore.pyqtSignal()
+
+    def __init__(self, job, parent=None):
+        # job(report) runs on the worker thread. report(message) shows progress, and raises Cancelled after cancel().
+        super().__init__(parent)
+        self.job = job
+        self.cancel_requested = False
+        self.last_report = 0
+
+    def cancel(self):
+        self.cancel_requested = True
+
+    def report(self, message):
+        if self.cancel_requested:
+            raise Cancelled()
+        now = time.monotonic()
+        if now - self.last_report >= PROGRESS_INTERVAL:
+            self.last_report = now
+            self.progress.emit(message)
+
+    def run(self):
+        try:
+            result = self.job(self.report)
+        except Cancelled:
+            self.cancelled.emit()
+        except Exception as error:
+            self.failed.emit(f'{type(error).__name__}: {error}')
+        else:
+            self.succeeded.emit(result)
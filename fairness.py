@@ -0,0 +1,218 @@
+"""
+Monte Carlo fairness over submission orderings.
+
+The greedy passes and swap searches of the heuristic mode go through the students in submission order, so who gets
+their 1st choice depends on who filled in the form first. This allocates the cohort under many random orderings
+and gives every student the probability of receiving each of their choices, or no choice.
+Allocating with a uniformly random ordering is a lottery, and these are its odds.
+
+Replication r uses the ordering np.random.default_rng([seed, r]).permutation, so a (seed, replication) pair always
+gives the same allocation, whatever the number of workers. The replications are spread over a process pool in batches.
+Each worker process receives the cohort once, through the pool initializer, and loads it into its engine once.
+A replication only writes the permuted choices over the engine's choices, the subjects and bounds stay, and the
+worker sends back the rank of every student for the batch (one byte per student and replication).
+
+One ordering is then picked by a criterion:
+- unallocated: fewest unallocated students, then fewest of their last choices, and so on up to the 2nd choices
+- typical: among the orderings with the fewest unallocated students, the one where every student's outcome is closest
+  to what the lottery gives them on average (least squared difference from their expected cost)
+- lottery: a replication drawn at random with the seed, i.e. one draw of the lottery
+
+Usage:
+python fairness.py students.xlsx capacities.csv -n 10000 -o odds.xlsx
+python fairness.py students.xlsx capacities.csv -n 10000 --criterion lottery --seed 7 --allocation result.xlsx
+"""
+
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from allocation_engine import (ALLOCATION_MODES, UNALLOCATED, AllocationEngine, rank_costs, rank_labels,
+                               read_capacities)
+from subject_aliases import SubjectAliases
+
+CRITERIA = ['typical', 'unallocated', 'lottery']
+BATCHES_PER_WORKER = 8
+
+worker_engine = None  # AllocationEngine of this worker process, see start_worker
+worker_cohort = None
+
+
+def ordering(seed, replication, student_num):
+    # Submission positions in the order replication allocates them
+    return np.random.default_rng([seed, replication]).permutation(student_num)
+
+
+def start_worker(names, choices, subject_names, bounds, capacities, mode, seed):
+    # Pool initializer: runs once per worker process with the cohort
+    global worker_engine, worker_cohort
+    choices = np.asarray(choices)
+    worker_engine = AllocationEngine()
+    worker_engine.load_import(names, choices, subject_names, bounds)
+    worker_cohort = (choices, capacities, mode, seed)
+
+
+def allocate_replications(replications):
+    # One task: a range of replications. Returns their ranks in submission order, replications x students int8 bytes.
+    choices, capacities, mode, seed = worker_cohort
+    engine = worker_engine
+    ranks = np.empty((len(replications), len(choices)), dtype=np.int8)
+    for row, replication in enumerate(replications):
+        order = ordering(seed, replication, len(choices))
+        engine.reorder_choices(choices[order])
+        engine.allocate(capacities, mode)
+        ranks[row, order] = np.frombuffer(engine.rank, dtype=np.int8)
+    return ranks.tobytes()
+
+
+class OrderingResults(object):
+    def __init__(self, seed, ranks, choice_num):
+        self.seed = seed
+        self.ranks = ranks  # Replication x student, the rank in submission order (UNALLOCATED = -1)
+        self.choice_num = choice_num
+
+    def __len__(self):
+        return len(self.ranks)
+
+    def outcome_labels(self):
+        # Every choice, then no choice
+        return rank_labels(self.choice_num) + ['Unallocated']
+
+    def outcomes(self):
+        # Replication x student, the column of outcome_labels
+        return np.where(self.ranks == UNALLOCATED, self.choice_num, self.ranks)
+
+    def counts(self):
+        # Student x outcome, the number of replications that gave it
+        outcomes = self.outcomes()
+        return np.stack([(outcomes == outcome).sum(axis=0) for outcome in range(self.choice_num + 1)], axis=1)
+
+    def probabilities(self):
+        return self.counts() / len(self.ranks)
+
+    def totals(self):
+        # Replication x outcome, the number of students who got it
+        outcomes = self.outcomes()
+        return np.stack([(outcomes == outcome).sum(axis=1) for outcome in range(self.choice_num + 1)], axis=1)
+
+    def choose(self, criterion):
+        # Replication picked by a criterion of CRITERIA
+        totals = self.totals()
+        if criterion == 'unallocated':
+            return int(np.lexsort(tuple(totals[:, 1:].T))[0])  # The last key, unallocated, sorts first
+        if criterion == 'typical':
+            costs = rank_costs(self.choice_num)
+            # No choice costs 2 ** k, above the last choice (2 ** (k - 1) - 1) even when there is only one choice
+            costs = np.array(costs + [2 ** self.choice_num])[self.outcomes()]
+            distance = ((costs - costs.mean(axis=0)) ** 2).sum(axis=1)
+            distance[totals[:, -1] > totals[:, -1].min()] = np.inf
+            return int(np.argmin(distance))
+        if criterion == 'lottery':
+            return int(np.random.default_rng(self.seed).integers(len(self.ranks)))
+        raise ValueError(f'Unknown criterion {criterion}, expected one of {", ".join(CRITERIA)}')
+
+
+def evaluate(engine, capacities, replications, seed=0, mode='heuristic', workers=None, progress=None):
+    # Allocate the imported cohort of engine under replications random orderings. Returns an OrderingResults.
+    # progress(done, total) is called as batches come in. workers=1 allocates in this process.
+    workers = workers or os.cpu_count() or 1
+    batch_size = max(1, -(-replications // (workers * BATCHES_PER_WORKER)))
+    batches = [range(start, min(start + batch_size, replications)) for start in range(0, replications, batch_size)]
+    # The bounds do not depend on the order of the students, so they are checked once here and every replication
+    # of the heuristic mode reuses the check (AllocationEngine.limit_placement). The optimal mode never uses them.
+    bounds = None
+    if mode == 'heuristic':
+        bounds = engine.allocation_bounds()
+        bounds.check(engine.capacity_list(capacities))
+    cohort = (engine.names, engine.choice_matrix(), engine.subject_names, bounds, capacities, mode, seed)
+    if workers == 1 or len(batches) == 1:
+        start_worker(*cohort)
+        results = map(allocate_replications, batches)
+        ranks = collect(batches, results, len(engine.names), replications, progress)
+    else:
+        with ProcessPoolExecutor(min(workers, len(batches)), initializer=start_worker, initargs=cohort) as pool:
+            results = pool.map(allocate_replications, batches)
+            ranks = collect(batches, results, len(engine.names), replications, progress)
+    return OrderingResults(seed, ranks, engine.choice_num)
+
+
+def collect(batches, results, student_num, replications, progress):
+    # Results come back in the order of the batches
+    ranks = np.empty((replications, student_num), dtype=np.int8)
+    for batch, result in zip(batches, results):
+        ranks[batch.start:batch.stop] = np.frombuffer(result, dtype=np.int8).reshape(len(batch), student_num)
+        if progress is not None:
+            progress(batch.stop, replications)
+    return ranks
+
+
+def odds_df(engine, results):
+    # One row per student in submission order: their choices, their allocation in submission order and their odds
+    df = engine.form_result_df()
+    df = df[['Name'] + [f'{label} Choice' for label in engine.choice_labels()]]
+    df.insert(1, 'Submission Order', [engine.allocated_subject(position) or "Didn't Receive a Choice"
+                                      for position in range(len(engine.names))])
+    for label, column in zip(results.outcome_labels(), results.probabilities().T):
+        df[f'P({label})'] = column
+    return df
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description='Allocate under many random submission orderings and report every '
+                                                 "student's odds.")
+    parser.add_argument('students', help='Student choices exported from Google Forms (xlsx or csv)')
+    parser.add_argument('capacities', help='Subject capacities (xlsx, csv or json)')
+    parser.add_argument('-n', '--replications', type=int, default=1000, help='Random orderings to allocate (default 1000)')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the orderings and of the lottery draw (default 0)')
+    parser.add_argument('--criterion', choices=CRITERIA, default='typical', help='How to pick one ordering (default typical)')
+    parser.add_argument('--mode', choices=ALLOCATION_MODES, default='heuristic')
+    parser.add_argument('--workers', type=int, help='Worker processes (default: one per core)')
+    parser.add_argument('-o', '--output', help="Where to write every student's odds (xlsx or csv)")
+    parser.add_argument('--allocation', metavar='FILE', help='Where to write the allocation of the picked ordering')
+    parser.add_argument('--aliases', metavar='FILE',
+                        help='Alias table (xlsx, csv or json) mapping other spellings to one subject')
+    return parser.parse_args(argv)
+
+
+def show_progress(done, total):
+    print(f'\rAllocating... {done}/{total} orderings', end='', file=sys.stderr, flush=True)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    engine = AllocationEngine(SubjectAliases.from_file(args.aliases) if args.aliases else None)
+    if not engine.import_file(args.students):
+        return 1
+    capacities = read_capacities(args.capacities)
+
+    start = time.perf_counter()
+    results = evaluate(engine, capacities, args.replications, args.seed, args.mode, args.workers, show_progress)
+    print(file=sys.stderr)
+    print(f'{len(results)} orderings of {len(engine.names)} students in {time.perf_counter() - start:.2f}s')
+
+    totals = pd.DataFrame(results.totals(), columns=results.outcome_labels())
+    print(totals.describe().loc[['mean', 'min', 'max']].to_string(float_format='{:.1f}'.format))
+    probabilities = results.probabilities()
+    print(f'{int((probabilities.max(axis=1) < 1).sum())} students get a different outcome in some ordering')
+
+    engine.allocate(capacities, args.mode)
+    df = odds_df(engine, results)
+    if args.output:
+        print(f'Odds written to {engine.output_df(df, args.output)}')
+
+    replication = results.choose(args.criterion)
+    engine.allocate_ordering(capacities, ordering(args.seed, replication, len(engine.names)), args.mode)
+    print(f'Ordering picked ({args.criterion}): replication {replication}, '
+          + ', '.join(f'{label} {count}' for label, count in zip(results.outcome_labels(), results.totals()[replication])))
+    if args.allocation:
+        print(f'Allocation written to {engine.output_df(engine.form_result_df(), args.allocation)}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,104 @@
+"""
+On-disk cache of imported spreadsheets.
+
+An entry is keyed by the SHA-256 of the file content, PARSER_VERSION and the alias table, so an unchanged export is never parsed
+twice, and a changed file, alias table or import code never hits a stale entry.
+An entry holds the state an import leaves in the AllocationEngine: student names, the N x k choice ids and the subject names.
+It is stored column by column in an uncompressed .npz (numpy arrays, strings packed as one UTF-8 buffer plus offsets),
+which loads without parsing and without pickle. The names are kept packed in the engine too (NameTable).
+
+When the cache grows over max_bytes, the least recently used entries are deleted.
+"""
+
+import contextlib
+import hashlib
+import os
+import tempfile
+
+import numpy as np
+
+from name_table import NameTable
+
+PARSER_VERSION = 3  # Bump whenever the import produces different names, choices or subjects for the same file
+DEFAULT_CACHE_DIR = os.environ.get('EE_ALLOCATION_CACHE', os.path.join(os.path.expanduser('~'), '.ee_allocation_cache'))
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+HASH_BLOCK_SIZE = 1024 * 1024
+
+
+def pack_strings(strings):
+    # Strings -> (UTF-8 buffer as uint8, end offset of every string in characters)
+    text = ''.join(strings)
+    offsets = np.cumsum([len(string) for string in strings], dtype=np.int64)
+    return np.frombuffer(text.encode('utf-8'), dtype=np.uint8), offsets
+
+
+def unpack_strings(buffer, offsets):
+    text = buffer.tobytes().decode('utf-8')
+    starts = [0] + offsets[:-1].tolist()
+    return [text[start:end] for start, end in zip(starts, offsets.tolist())]
+
+
+class ImportCache(object):
+    def __init__(self, directory=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+    def key(self, filename, aliases):
+        digest = hashlib.sha256(f'{PARSER_VERSION}\n{aliases.fingerprint()}\n'.encode('utf-8'))
+        with open(filename, 'rb') as f:
+            for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, f'{key}.npz')
+
+    def load(self, key, engine):
+        # Put a cached import into engine. Returns False on a miss.
+        path = self.path(key)
+        if not os.path.exists(path):
+            return False
+        try:
+            with np.load(path, allow_pickle=False) as entry:
+                names = NameTable.from_packed(entry['names'].tobytes().decode('utf-8'),
+                                              entry['name_offsets'].astype(np.int64).tobytes())
+                subject_names = unpack_strings(entry['subjects'], entry['subject_offsets'])
+                choices = entry['choices']
+        except (OSError, ValueError, KeyError, UnicodeDecodeError):  # Damaged entry, or evicted by another process meanwhile
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(path)
+            return False
+        with contextlib.suppress(FileNotFoundError):
+            os.utime(path)  # Most recently used
+        engine.load_import(names, choices, subject_names)
+        return True
+
+    def store(self, key, engine):
+        os.makedirs(self.directory, exist_ok=True)
+        names = np.frombuffer(engine.names.joined().encode('utf-8'), dtype=np.uint8)
+        name_offsets = np.frombuffer(engine.names.ends, dtype=np.int64)  # The NameTable layout, see name_table.py
+        subjects, subject_offsets = pack_strings(engine.subject_names)
+        choices = engine.choice_matrix()
+        # Written under a temporary name first, so a half written entry is never loaded
+        handle, temporary = tempfile.mkstemp(suffix='.npz', dir=self.directory)
+        with os.fdopen(handle, 'wb') as f:
+            np.savez(f, names=names, name_offsets=name_offsets, subjects=subjects, subject_offsets=subject_offsets,
+                     choices=choices)
+        os.replace(temporary, self.path(key))
+        self.evict()
+
+    def evict(self):
+        # Delete the least recently used entries until the cache fits in max_bytes
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith('.npz'):
+                with contextlib.suppress(FileNotFoundError):  # Another process may evict at the same time
+                    stat = os.stat(os.path.join(self.directory, name))
+                    entries.append((stat.st_mtime, stat.st_size, name))
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(os.path.join(self.directory, name))
+            total -= size
@@ -0,0 +1,188 @@
+"""
+Incremental re-allocation after the capacity of one subject changes.
+
+An optimal allocation (min-cost flow, see AllocationEngine.optimal_allocate) stays optimal after a capacity change
+once a few students are moved along the cheapest chain of moves:
+- one more seat in subject s: the cheapest chain ending in s. Either it starts with a student who had no choice
+  (a placement, always preferred), or it starts with a student whose move to a better choice frees a seat somewhere else.
+  Only applied when it lowers the cost.
+- one seat less in a full subject s: the cheapest chain starting with a student leaving s and ending in a free seat,
+  or with a student losing their allocation.
+Every seat changed is one chain, so the work depends on the number of subjects, not on the number of students.
+
+The chains are shortest paths over a small graph whose nodes are the subjects plus POOL, the students without a choice.
+An edge a -> b means a student holding subject a has b as another choice, and costs the change in rank costs.
+Placing a student costs its rank cost - BIG and dropping one BIG - its rank cost, so placing more students always comes first,
+as in the optimal mode. The students behind every edge are kept in buckets that are updated on every move.
+
+The result places as many students as a full optimal run and has the same total cost. Which of several students with
+the same choices gets the better rank can differ, here the earliest submission is moved up and the latest moved down.
+"""
+
+from collections import deque
+
+UNALLOCATED = -1  # Same as allocation_engine.UNALLOCATED
+
+
+class IncrementalAllocation(object):
+    def __init__(self, choices, rank, capacity, allocated, rank_costs):
+        # choices, rank, capacity and allocated are the AllocationEngine arrays of an optimal allocation.
+        # rank and allocated are updated in place. rank_costs has the cost of each of the k choices.
+        self.choices = choices
+        self.rank = rank
+        self.capacity = capacity
+        self.allocated = allocated
+        self.rank_costs = rank_costs
+        self.choice_num = len(rank_costs)
+        self.pool_node = len(capacity)
+        self.big = rank_costs[-1] * (len(capacity) + 2) + 1  # More than any chain of moves can save
+        self.moves = {}  # (a, rank at a, b, rank at b) -> students holding a with b as another choice
+        self.drops = {}  # (a, rank at a) -> students holding a
+        self.places = {}  # (b, rank at b) -> students without a choice who have b as a choice
+        self.pool = set()  # Students without a choice
+        for position in range(len(rank)):
+            self._file(position)
+
+    def _buckets(self, position):
+        # The buckets position is filed in for its current rank
+        k = self.choice_num
+        rank, base, choices = self.rank[position], k * position, self.choices
+        if rank == UNALLOCATED:
+            return [(self.places, (choices[base + i], i)) for i in range(k)]
+        subject = choices[base + rank]
+        buckets = [(self.drops, (subject, rank))]
+        for i in range(k):
+            if i != rank:
+                buckets.append((self.moves, (subject, rank, choices[base + i], i)))
+        return buckets
+
+    def _file(self, position):
+        for buckets, key in self._buckets(position):
+            if key in buckets:
+                buckets[key].add(position)
+            else:
+                buckets[key] = {position}
+        if self.rank[position] == UNALLOCATED:
+            self.pool.add(position)
+
+    def _unfile(self, position):
+        for buckets, key in self._buckets(position):
+            bucket = buckets[key]
+            bucket.discard(position)
+            if not bucket:
+                del buckets[key]
+        self.pool.discard(position)
+
+    def _set_rank(self, position, rank):
+        old = self.rank[position]
+        self._unfile(position)
+        if old != UNALLOCATED:
+            self.allocated[self.choices[self.choice_num * position + old]] -= 1
+        self.rank[position] = rank
+        if rank != UNALLOCATED:
+            self.allocated[self.choices[self.choice_num * position + rank]] += 1
+        self._file(position)
+
+    def _edges(self):
+        # node -> {next node: (cost, step)}, keeping the cheapest step between two nodes
+        costs, capacity, pool_node, big = self.rank_costs, self.capacity, self.pool_node, self.big
+        edges = {}
+
+        def add(u, v, cost, step):
+            out = edges.setdefault(u, {})
+            if v not in out or cost < out[v][0]:
+                out[v] = (cost, step)
+
+        for key in self.moves:
+            a, rank_a, b, rank_b = key
+            if capacity[b] > 0:
+                add(a, b, costs[rank_b] - costs[rank_a], ('move', key))
+        for key in self.drops:
+            add(key[0], pool_node, big - costs[key[1]], ('drop', key))
+        for key in self.places:
+            if capacity[key[0]] > 0:
+                add(pool_node, key[0], costs[key[1]] - big, ('place', key))
+        return edges
+
+    def _shortest_paths(self, sources):
+        # Bellman-Ford with a queue from several sources at distance 0.
+        # Returns (distance, parent) where parent[v] = (u, step). An optimal allocation has no negative cycles.
+        edges = self._edges()
+        dist = {node: 0 for node in sources}
+        parent = {}
+        relaxed = {}
+        queue, queued = deque(sources), set(sources)
+        while queue:
+            u = queue.popleft()
+            queued.discard(u)
+            for v, (cost, step) in edges.get(u, {}).items():
+                distance = dist[u] + cost
+                if v not in dist or distance < dist[v]:
+                    dist[v] = distance
+                    parent[v] = (u, step)
+                    relaxed[v] = relaxed.get(v, 0) + 1
+                    if relaxed[v] > self.pool_node + 1:
+                        raise ValueError('The allocation is not optimal, it can only be changed incrementally when it is')
+                    if v not in queued:
+                        queue.append(v)
+                        queued.add(v)
+        return dist, parent
+
+    def _pick(self, step):
+        # (student, new rank) of one step of a chain
+        kind, key = step
+        if kind == 'move':
+            # Moving up goes to the earliest submission, moving down to the latest
+            bucket = self.moves[key]
+            return min(bucket) if key[3] < key[1] else max(bucket), key[3]
+        if kind == 'drop':
+            return max(self.drops[key]), UNALLOCATED
+        return min(self.places[key]), key[1]
+
+    def _move_all(self, steps):
+        # The students are all picked before anyone moves. Returns the students moved.
+        moves = [self._pick(step) for step in steps]
+        for position, rank in moves:
+            self._set_rank(position, rank)
+        return len(moves)
+
+    def _apply(self, parent, node):
+        # Move the students along the path ending at node
+        steps = []
+        while node in parent:
+            node, step = parent[node]
+            steps.append(step)
+        return self._move_all(steps)
+
+    def increase(self, subject):
+        # Use the free seats of subject while that places more students or lowers the cost. Returns the students moved.
+        moved = 0
+        while self.allocated[subject] < self.capacity[subject]:
+            sources = list(range(len(self.capacity)))
+            if self.pool:
+                sources.append(self.pool_node)
+            dist, parent = self._shortest_paths(sources)
+            if dist[subject] >= 0:
+                break
+            moved += self._apply(parent, subject)
+        return moved
+
+    def decrease(self, subject):
+        # Move students out of subject until it fits its capacity. Returns the students moved.
+        moved = 0
+        while self.allocated[subject] > self.capacity[subject]:
+            dist, parent = self._shortest_paths([subject])
+            ends = [node for node in dist if node == self.pool_node
+                    or (node != subject and self.allocated[node] < self.capacity[node])]
+            moved += self._apply(parent, min(ends, key=lambda node: (dist[node], node)))
+        return moved
+
+    def set_capacity(self, subject, capacity):
+        # capacity is shared with the engine, so the new capacity is stored there too. Returns the students moved.
+        self.capacity[subject] = capacity
+        if self.allocated[subject] > capacity:
+            return self.decrease(subject)
+        return self.increase(subject)
+
+    def unallocated(self):
+        return sorted(self.pool)
@@ -0,0 +1,124 @@
+"""
+Anytime improvement of a heuristic allocation by ejection chains.
+
+The swap algorithms of the heuristic mode only try chains of up to three students over the first 3 choices, and take the
+first one that fits. LocalSearch then keeps applying the best improving chain of moves over the subject graph of
+incremental_allocation.py, over all k choices:
+- a chain from a student without a choice to a free seat places one more student, moving the students in between
+- a chain from any student to a free seat, or a cycle of moves, whose change in rank costs is negative lowers the total cost
+A chain is found by Bellman-Ford from every node at once, so it is the cheapest one wherever it starts, and a negative
+cycle shows up as a cycle in the parent links.
+
+Every chain places more students, or as many at a lower total cost, so the allocation is always the best found so far
+and stopping between two chains leaves a complete allocation. The search stops when its time budget runs out, or when
+no improving chain is left. Then the allocation is optimal: as many students placed at the same total cost as the optimal mode.
+"""
+
+import time
+from collections import deque
+
+from incremental_allocation import UNALLOCATED, IncrementalAllocation
+
+TRACE_INTERVAL = 0.1  # Seconds between two points of the progress trace
+
+
+class LocalSearch(IncrementalAllocation):
+    def __init__(self, choices, rank, capacity, allocated, rank_costs):
+        # Same arrays as IncrementalAllocation, of any valid allocation
+        super().__init__(choices, rank, capacity, allocated, rank_costs)
+        self.counts = [0] * (self.choice_num + 1)  # Rank -> students holding it. counts[UNALLOCATED] is the last one.
+        for position in range(len(rank)):
+            self.counts[rank[position]] += 1
+        self.chains = 0  # Improving chains applied
+        self.moved = 0  # Students moved by them
+        self.trace = []  # [seconds, unallocated, students on their 3rd or a later choice], see improve
+
+    def _set_rank(self, position, rank):
+        self.counts[self.rank[position]] -= 1
+        self.counts[rank] += 1
+        super()._set_rank(position, rank)
+
+    def worse(self):
+        # Students on their 3rd or a later choice
+        return sum(self.counts[2:self.choice_num])
+
+    def improving_chain(self):
+        # Steps of the cheapest improving chain or of a negative cycle, or None when the allocation is optimal
+        edges = self._edges()
+        nodes = list(range(len(self.capacity))) + ([self.pool_node] if self.pool else [])
+        dist = {node: 0 for node in nodes}
+        parent = {}
+        relaxed = {}
+        queue, queued = deque(nodes), set(nodes)
+        while queue:
+            u = queue.popleft()
+            queued.discard(u)
+            for v, (cost, step) in edges.get(u, {}).items():
+                distance = dist[u] + cost
+                if distance < dist.get(v, 0):
+                    dist[v] = distance
+                    parent[v] = (u, step)
+                    relaxed[v] = relaxed.get(v, 0) + 1
+                    if relaxed[v] > len(nodes):
+                        cycle = self._cycle(parent, v)
+                        if cycle is not None:
+                            return cycle
+                    if v not in queued:
+                        queue.append(v)
+                        queued.add(v)
+
+        ends = [node for node, distance in dist.items()
+                if distance < 0 and node != self.pool_node and self.allocated[node] < self.capacity[node]]
+        if not ends:
+            return None
+        node = min(ends, key=lambda node: (dist[node], node))
+        steps, seen = [], set()
+        while node in parent:
+            if node in seen:  # The path runs into a cycle of the parent links, which is negative
+                return self._cycle(parent, node)
+            seen.add(node)
+            node, step = parent[node]
+            steps.append(step)
+        return steps
+
+    @staticmethod
+    def _cycle(parent, node):
+        # Steps of the cycle of the parent links reached from node, or None if they lead to a start instead
+        order, visited = [], {}
+        while node in parent and node not in visited:
+            visited[node] = len(order)
+            order.append(node)
+            node = parent[node][0]
+        if node not in visited:
+            return None
+        return [parent[node][1] for node in order[visited[node]:]]
+
+    def improve(self, budget, progress=None):
+        # Apply improving chains for at most budget seconds. Returns True when it stopped because none is left.
+        # progress(unallocated, worse, seconds) is called about every TRACE_INTERVAL seconds and may raise to stop.
+        start = time.perf_counter()
+        reported = None
+        while True:
+            seconds = time.perf_counter() - start
+            if reported is None or seconds - reported >= TRACE_INTERVAL:
+                reported = seconds
+                self.trace.append([round(seconds, 3), self.counts[UNALLOCATED], self.worse()])
+                if progress is not None:
+                    progress(self.counts[UNALLOCATED], self.worse(), seconds)
+            if seconds >= budget:
+                return False
+            steps = self.improving_chain()
+            if steps is None:
+                return True
+            self.moved += self._move_all(steps)
+            self.chains += 1
+
+    def report(self, budget, optimal, seconds):
+        return {
+            'budget': budget,
+            'seconds': round(seconds, 6),
+            'chains': self.chains,
+            'moved': self.moved,
+            'stopped': 'optimal' if optimal else 'budget',
+            'trace': self.trace + [[round(seconds, 3), self.counts[UNALLOCATED], self.worse()]]
+        }
@@ -6,22 +6,56 @@ Created by Benji Xu.
 Finished on 14th July 2023, in Beijing.
 """
 
+from startup import StartupTimer, preload
+startup_timer = StartupTimer()  # Started before Qt is imported, so the startup report includes the imports
+
 from PyQt5 import QtCore, QtGui, QtWidgets
 from PyQt5.QtWidgets import QFileDialog
 from PyQt5.QtCore import Qt  # DO NOT DELETE THIS. THIS IS USED.
-import pandas as pd
+import json
+import os
 import sys
 
-student_info = {}  # Key = student name. Value = [1st choice, 2nd choice, 3rd choice]. Allocated choice is appended to the list.
-student_info_copy = {}  # Copy initial student info to allow multiple allocations
-capacity = {}  # Key = subject. Value = [capacity, number of already allocated choices]
-unlucky_students = {}  # Similar to student_info.
-displayed_subjects_num = 0
-import_success, allocate_success = False, False
+# Only small modules here. allocation_engine (pandas, numpy, openpyxl) is loaded in the background once the window is up.
+from allocation_session import AllocationSession
+from allocation_stats import format_report, short_subjects_text
+from capacity_table import CAPACITY_COLUMN, DEMAND_COLUMN, CapacityDelegate, CapacityTableModel
+from engine_worker import EngineTask
+from subject_aliases import load_aliases
+
+CONFIGURATION_COLUMNS = ['#', 'Mode', 'Seats']  # Then one column per choice and Unalloc.
+DEFAULT_RANK_LABELS = ['1st', '2nd', '3rd']  # Choice columns before anything is imported
+SPREADSHEET_EXTENSIONS = ('.xlsx', '.csv')  # Same check as AllocationEngine.is_spreadsheet, usable before pandas is loaded
+# Optional alias table (alias, subject), read again on every import. Next to main.py wherever the app is launched from
+ALIASES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'subject_aliases.csv')
+NEW_COHORT = 'New cohort'  # Last entry of the cohort box, adds an empty cohort
+LIVE_DELAY_MS = 150  # Live results wait this long after the last capacity edit, so a burst of edits allocates once
+BOUNDS_DELAY_MS = 100  # Same for the capacity bounds, which take about 0.1 s on 100000 students
 # Ensure that the window and widgets do not change size based on the machine they are on.
 QtWidgets.QApplication.setAttribute(QtCore.Qt.AA_EnableHighDpiScaling, True)
 
 
+def receiver_lines(record):
+    # The three result lines: 1st choice, 2nd choice, then every further choice together (e.g. 3rd-5th)
+    items = list(record.items())
+    lines = [f'{label} Choice Receivers: {count}' for label, count in items[:2]]
+    rest = items[2:]
+    if rest:
+        label = rest[0][0] if len(rest) == 1 else f'{rest[0][0]}-{rest[-1][0]}'
+        lines.append(f'{label} Choice Receivers: {sum(count for _, count in rest)}')
+    return lines + [''] * (3 - len(lines))
+
+
+def bounds_text(bounds):
+    # Text of the bounds label for AllocationEngine.check_capacities
+    placed = 'Everyone' if bounds['placed'] == bounds['students'] else f"At most {bounds['placed']}"
+    lines = [f"{bounds['seats']} seats for {bounds['students']} students",
+             f"{placed} can be placed, at most {bounds['first_choice']} with their 1st choice"]
+    if bounds['short_subjects']:
+        lines.append(f'Short of seats: {short_subjects_text(bounds)}')
+    return '\n'.join(lines)
+
+
 class Ui_MainWindow(object):
     """
     Overall architecture:
@@ -30,26 +64,46 @@ class Ui_MainWindow(object):
     Includes the function setupUi
 
     2. Creating widgets
-    Includes functions: create_button, create_subject_labels, create_spin_box, create_allocation_result_labels, create_bars, create_other_labels
+    Includes functions: create_button, create_capacity_table, create_configuration_table, create_allocation_result_labels,
+    create_bars, create_other_labels
     These create widgets, but don't necessarily show them. They are called from within setupUi
 
     3. Process data
-    Includes the 6 functions under the Process Data label.
-    The first 5 are called from within main_process_data, which is called from interactions() when the import button is clicked.
-    These are for converting dataframes into other data structures, cleaning data, etc
+    Includes the 8 functions under the Process Data label.
+    main_process_data is called from interactions() when the import button is clicked.
+    Converting and cleaning the data is done by the AllocationEngine (allocation_engine.py), these functions only update the widgets.
+    Each cohort, its engine and whether it is imported and allocated are held by an AllocationSession (allocation_session.py).
+    The cohort box switches between them (switch_cohort): every cohort keeps its import, capacities, allocation and
+    configurations, and imports go into the cohort shown.
 
     4. Allocation
-    Includes the 12 functions under the Allocation label.
-    The first 11 are called from within main_allocate, which is called from interactions() when the allocate button is clicked.
-    These are for allocating students by modifying the student_info dictionary.
+    Includes the 13 functions under the Allocation label.
+    main_allocate is called from interactions() when the allocate button is clicked.
+    It reads the capacities from the spin boxes and lets the AllocationEngine allocate the students.
+    The allocation details (timings and swap algorithm counters) can be expanded below the result.
+    Every allocation is kept in the ResultCache of the session (result_cache.py). Allocating a configuration again restores it instantly,
+    and the configuration table above the result lists the ones tried so far. Double-clicking one restores it.
+    With live results on, capacity_changed allocates again on every capacity change, once no edit followed for LIVE_DELAY_MS.
+    An optimal allocation is only repaired where the change affects it (AllocationEngine.change_capacity), on a background
+    task like any allocation. The capacity bounds below the capacity table are computed on their own task (check_bounds),
+    once no edit followed for BOUNDS_DELAY_MS, so they can be shown while an allocation runs.
 
     5. Output
-    Includes the 3 functions under the Output label.
-    The first 2 are called from within main_output, which is called from interactions() when the output button is clicked.
+    Includes the 2 functions under the Output label.
+    main_output is called from interactions() when the output button is clicked.
     These are for outputting the result as an Excel or csv.
 
-    6. Interactions
+    6. Background tasks
+    Includes the 6 functions under the Background tasks label.
+    Import, allocation and output run on an EngineTask (engine_worker.py) so the window never freezes.
+    While one runs, the three buttons are disabled and the cancel button is shown next to the progress in the status bar.
+
+    7. Interactions
     Includes the interactions() function, which connects the buttons with other functions.
+
+    8. Startup
+    Includes the 2 functions under the Startup label.
+    window_shown runs once the window is on screen and loads the heavy modules in the background (startup.py).
     """
 
     '''
@@ -68,8 +122,8 @@ class Ui_MainWindow(object):
 
         # Creating visible widgets
         self.create_buttons()
-        self.create_subject_labels()
-        self.create_spin_box()
+        self.create_capacity_table()
+        self.create_configuration_table()
         self.create_allocation_result_labels()
         self.create_bars()
         self.create_other_labels()  # Need to call this last so the error label overwrites the other labels
@@ -83,6 +137,27 @@ class Ui_MainWindow(object):
         self.statusbar = QtWidgets.QStatusBar(MainWindow)
         self.statusbar.setObjectName("statusbar")
         MainWindow.setStatusBar(self.statusbar)
+        self.cancelButton = QtWidgets.QPushButton(self.statusbar)  # Only shown while a background task runs
+        self.cancelButton.setObjectName("cancelButton")
+        self.cancelButton.setText("Cancel")
+        self.statusbar.addPermanentWidget(self.cancelButton)
+        self.cancelButton.hide()
+        self.task = None  # EngineTask currently running, if any
+        self.preload_task = None  # EngineTask loading the heavy modules after startup
+        self.session = AllocationSession(name='Cohort 1')  # The cohort shown and its allocation, see allocation_session.py
+        self.sessions = [self.session]  # Every cohort, in the order of the cohort box
+        self.entered_capacities = {}  # AllocationSession -> capacities left in the table when another cohort was shown
+        self.configurations = []  # CachedAllocation of every row of the configuration table
+        self.live_pending = False  # A capacity changed with live results on while a task was running
+        self.live_edits = {}  # Row -> capacity of the single capacity edits live results have not allocated yet
+        self.liveTimer = QtCore.QTimer()  # Restarted on every edit, see capacity_changed
+        self.liveTimer.setSingleShot(True)
+        self.liveTimer.setInterval(LIVE_DELAY_MS)
+        self.bounds_pending = False  # A capacity changed while the bounds were computed, so they are out of date
+        self.bounds_task = None  # EngineTask computing the capacity bounds, runs alongside self.task
+        self.boundsTimer = QtCore.QTimer()  # Restarted on every capacity change, see show_bounds
+        self.boundsTimer.setSingleShot(True)
+        self.boundsTimer.setInterval(BOUNDS_DELAY_MS)
         MainWindow.setWindowTitle(QtCore.QCoreApplication.translate("MainWindow", "Extended Essay Allocation"))
         self.interactions()
         QtCore.QMetaObject.connectSlotsByName(MainWindow)
@@ -135,6 +210,40 @@ class Ui_MainWindow(object):
         self.allocateButton.setFont(QtGui.QFont('Artifakt Element', 17))
         self.allocateButton.setText("Allocate")
 
+        # Optimal allocation check box. When checked, Allocate uses the exact min-cost flow instead of the swap algorithms.
+        self.optimalCheckBox = QtWidgets.QCheckBox(self.centralwidget)
+        self.optimalCheckBox.setGeometry(QtCore.QRect(75, 310, 226, 30))
+        self.optimalCheckBox.setFont(QtGui.QFont('Artifakt Element', 14))
+        self.optimalCheckBox.setStyleSheet("color: rgba(0, 143, 53, 1);")
+        self.optimalCheckBox.setObjectName("optimalCheckBox")
+        self.optimalCheckBox.setText("Optimal allocation")
+
+        # Live results check box. When checked, every capacity change allocates again right away.
+        self.liveCheckBox = QtWidgets.QCheckBox(self.centralwidget)
+        self.liveCheckBox.setGeometry(QtCore.QRect(75, 430, 226, 30))
+        self.liveCheckBox.setFont(QtGui.QFont('Artifakt Element', 14))
+        self.liveCheckBox.setStyleSheet("color: rgba(0, 143, 53, 1);")
+        self.liveCheckBox.setObjectName("liveCheckBox")
+        self.liveCheckBox.setText("Live results")
+
+        # Cohort box: one entry per cohort, then NEW_COHORT
+        self.cohortComboBox = QtWidgets.QComboBox(self.centralwidget)
+        self.cohortComboBox.setGeometry(QtCore.QRect(60, 230, 241, 30))
+        self.cohortComboBox.setFont(QtGui.QFont('Artifakt Element', 14))
+        self.cohortComboBox.setObjectName("cohortComboBox")
+        self.cohortComboBox.addItems(['Cohort 1', NEW_COHORT])
+
+        # Local search budget. Above 0, a heuristic allocation is improved for up to that many seconds (local_search.py).
+        self.searchSpinBox = QtWidgets.QSpinBox(self.centralwidget)
+        self.searchSpinBox.setGeometry(QtCore.QRect(75, 470, 226, 30))
+        self.searchSpinBox.setFont(QtGui.QFont('Artifakt Element', 14))
+        self.searchSpinBox.setStyleSheet("color: rgba(0, 143, 53, 1);")
+        self.searchSpinBox.setObjectName("searchSpinBox")
+        self.searchSpinBox.setRange(0, 600)
+        self.searchSpinBox.setPrefix("Improve for ")
+        self.searchSpinBox.setSuffix(" s")
+        self.searchSpinBox.setSpecialValueText("No local search")
+
         # Output Button
         self.outputButton = QtWidgets.QPushButton(self.centralwidget)
         self.outputButton.setGeometry(QtCore.QRect(60, 630, 241, 71))
@@ -154,36 +263,63 @@ class Ui_MainWindow(object):
         self.outputButton.setFont(QtGui.QFont('Artifakt Element', 17))
         self.outputButton.setText("Output")
 
-    # Hide subject labels by setting transparency (can also adjust position to hide)
-    def create_subject_labels(self):
-        font = QtGui.QFont()
-        font.setFamily("Artifakt Element")
-        font.setPointSize(16)
-
-        for i in range(1, 50):  # Creating 50 labels, which is more than enough. Should be the same as the num of spinbox in function create_spin_box
-            exec(f"self.subjectLabel{i} = QtWidgets.QLabel(self.centralwidget)")
-            eval(f"self.subjectLabel{i}.setGeometry(QtCore.QRect(430, 180, 140, 21))")  # Positions will be adjusted later
-            eval(f"self.subjectLabel{i}.setFont(font)")
-            eval(f"self.subjectLabel{i}.setFrameShape(QtWidgets.QFrame.NoFrame)")
-            eval(f"self.subjectLabel{i}.setFrameShadow(QtWidgets.QFrame.Raised)")
-            eval(f'self.subjectLabel{i}.setStyleSheet("color: rgba(0, 0, 0, 0);")')  # Set transparency as 0. Hide labels
-            eval(f'self.subjectLabel{i}.setStyleSheet("background-color: rgba(0, 0, 0, 0);")')
-            eval(f'self.subjectLabel{i}.setObjectName("subjectLabel{i}")')
-            eval(f'self.subjectLabel{i}.setAlignment(Qt.AlignTop)')
-
-    # # Hide spin boxes by adjusting position
-    def create_spin_box(self):
-        font = QtGui.QFont()
-        font.setFamily("Artifakt Element")
-        font.setPointSize(15)
-
-        for i in range(1, 50):  # Should be the same number as the num of subject labels in the function create_subject_labels
-            exec(f"self.spinBox{i} = QtWidgets.QSpinBox(self.centralwidget)")
-            # Set spinbox out of screen so it's not initially visible. Use position instead of transparency to hide spinbox because it's hard to hide a spinbox using transparency.
-            eval(f"self.spinBox{i}.setGeometry(QtCore.QRect(2000, 680, 48, 24))")
-            eval(f'self.spinBox{i}.setStyleSheet("color: rgba(0, 143, 53, 1);")')
-            eval(f'self.spinBox{i}.setObjectName("spinBox{i}")')
-            eval(f'self.spinBox{i}.setFont(font)')
+    # The capacity editor: a table with a row per imported subject (capacity_table.py). Hidden until an import succeeds.
+    def create_capacity_table(self):
+        self.capacityModel = CapacityTableModel(self.centralwidget)
+        self.capacityTable = QtWidgets.QTableView(self.centralwidget)
+        self.capacityTable.setGeometry(QtCore.QRect(390, 100, 500, 540))
+        self.capacityTable.setModel(self.capacityModel)
+        self.capacityTable.setItemDelegateForColumn(1, CapacityDelegate(self.capacityTable))
+        self.capacityTable.setFont(QtGui.QFont('Artifakt Element', 14))
+        self.capacityTable.setStyleSheet("background-color: rgba(255, 255, 255, 1);")
+        self.capacityTable.setEditTriggers(QtWidgets.QAbstractItemView.AllEditTriggers)
+        self.capacityTable.setSelectionMode(QtWidgets.QAbstractItemView.SingleSelection)
+        self.capacityTable.verticalHeader().hide()
+        # Fixed row heights and column widths: nothing is measured per row, which keeps thousands of subjects fast
+        self.capacityTable.verticalHeader().setSectionResizeMode(QtWidgets.QHeaderView.Fixed)
+        self.capacityTable.verticalHeader().setDefaultSectionSize(32)
+        self.capacityTable.horizontalHeader().setSectionResizeMode(0, QtWidgets.QHeaderView.Stretch)
+        self.size_capacity_columns()
+        self.capacityTable.setObjectName("capacityTable")
+        self.capacityTable.hide()
+
+    def size_capacity_columns(self):
+        # Again after every import, which can have a different number of choices
+        header = self.capacityTable.horizontalHeader()
+        demand_columns = range(DEMAND_COLUMN, self.capacityModel.columnCount())
+        demand_width = max(45, min(60, 180 // len(demand_columns)))  # Narrower with more choices, to leave room for the subject
+        widths = [(CAPACITY_COLUMN, 90)] + [(column, demand_width) for column in demand_columns]
+        for column, width in widths:
+            header.setSectionResizeMode(column, QtWidgets.QHeaderView.Fixed)
+            header.resizeSection(column, width)
+
+    # Configurations allocated so far with their results, for comparison. Hidden until there is one.
+    def create_configuration_table(self):
+        self.configurationTable = QtWidgets.QTableWidget(0, 0, self.centralwidget)
+        self.configurationTable.setGeometry(QtCore.QRect(920, 60, 425, 170))
+        self.set_configuration_columns(DEFAULT_RANK_LABELS)
+        self.configurationTable.setFont(QtGui.QFont('Artifakt Element', 12))
+        self.configurationTable.setStyleSheet("background-color: rgba(255, 255, 255, 1);")
+        self.configurationTable.setEditTriggers(QtWidgets.QAbstractItemView.NoEditTriggers)
+        self.configurationTable.setSelectionBehavior(QtWidgets.QAbstractItemView.SelectRows)
+        self.configurationTable.setSelectionMode(QtWidgets.QAbstractItemView.SingleSelection)
+        self.configurationTable.verticalHeader().hide()
+        self.configurationTable.verticalHeader().setDefaultSectionSize(24)
+        self.configurationTable.setToolTip('Configurations allocated so far. Double-click one to restore it.')
+        self.configurationTable.setObjectName("configurationTable")
+        self.configurationTable.hide()
+
+    def set_configuration_columns(self, rank_labels):
+        # One column per choice the students were asked for
+        columns = CONFIGURATION_COLUMNS + rank_labels + ['Unalloc.']
+        self.configurationTable.setColumnCount(len(columns))
+        self.configurationTable.setHorizontalHeaderLabels(columns)
+        header = self.configurationTable.horizontalHeader()
+        header.setSectionResizeMode(QtWidgets.QHeaderView.Stretch)
+        for column, width in [(0, 35), (1, 90)]:
+            header.setSectionResizeMode(column, QtWidgets.QHeaderView.Fixed)
+            header.resizeSection(column, width)
+        header.setSectionResizeMode(len(columns) - 1, QtWidgets.QHeaderView.ResizeToContents)
 
     # Hide labels at first by not giving them text. They should not have text because unsure of allocation result.
     def create_allocation_result_labels(self):
@@ -224,7 +360,7 @@ class Ui_MainWindow(object):
 
         # Third choice label
         self.thirdChoiceLabel = QtWidgets.QLabel(self.centralwidget)
-        self.thirdChoiceLabel.setGeometry(QtCore.QRect(1000, 421, 200, 31))
+        self.thirdChoiceLabel.setGeometry(QtCore.QRect(1000, 421, 260, 31))
         self.thirdChoiceLabel.setFont(small_font)
         self.thirdChoiceLabel.setStyleSheet("color: rgba(0, 0, 0, 1);")
         self.thirdChoiceLabel.setFrameShape(QtWidgets.QFrame.NoFrame)
@@ -249,6 +385,24 @@ class Ui_MainWindow(object):
         self.unallocatedStudentLabel.setFrameShadow(QtWidgets.QFrame.Raised)
         self.unallocatedStudentLabel.setObjectName("unallocatedStudentLabel")
 
+        # Allocation details toggle. Expands the details panel below the result.
+        self.detailsButton = QtWidgets.QToolButton(self.centralwidget)
+        self.detailsButton.setGeometry(QtCore.QRect(9999, 590, 200, 25))
+        self.detailsButton.setToolButtonStyle(QtCore.Qt.ToolButtonTextBesideIcon)
+        self.detailsButton.setArrowType(QtCore.Qt.RightArrow)
+        self.detailsButton.setCheckable(True)
+        self.detailsButton.setStyleSheet("border: none; color: rgba(0, 0, 0, 1);")
+        self.detailsButton.setObjectName("detailsButton")
+        self.detailsButton.setText("Allocation details")
+
+        # Allocation details panel: phase timings, optimize round counters and swap algorithm successes
+        self.detailsPanel = QtWidgets.QPlainTextEdit(self.centralwidget)
+        self.detailsPanel.setGeometry(QtCore.QRect(9999, 618, 425, 120))
+        self.detailsPanel.setReadOnly(True)
+        self.detailsPanel.setFont(QtGui.QFont('Courier', 10))
+        self.detailsPanel.setStyleSheet("background-color: rgba(255, 255, 255, 1);")
+        self.detailsPanel.setObjectName("detailsPanel")
+
     # Hide bars at first by adjusting position
     def create_bars(self):
         # Left bar
@@ -328,6 +482,14 @@ class Ui_MainWindow(object):
         self.enterCapLabel.setObjectName("enterCapLabel")
         self.enterCapLabel.setText('Enter Subject Capacity:')
 
+        # Bounds label: how many students any allocation of the capacities entered can place, updated on every change
+        self.boundsLabel = QtWidgets.QLabel(self.centralwidget)
+        self.boundsLabel.setGeometry(QtCore.QRect(9999, 648, 500, 92))
+        self.boundsLabel.setFont(QtGui.QFont('Artifakt Element', 12))
+        self.boundsLabel.setWordWrap(True)
+        self.boundsLabel.setAlignment(QtCore.Qt.AlignLeft | QtCore.Qt.AlignTop)
+        self.boundsLabel.setObjectName("boundsLabel")
+
         # Import first label
         self.importFirstLabel = QtWidgets.QLabel(self.centralwidget)
         self.importFirstLabel.setGeometry(QtCore.QRect(9999, 435, 315, 30))
@@ -377,162 +539,31 @@ class Ui_MainWindow(object):
     '''
     Process data
     '''
-    def convert_data_type(self, df):
-        # Convert df into dictionary for student choices
-
-        names_reference = {
-            'business': 'Business',
-            'environment': 'ESS',
-            'computer': 'ComSci',
-            'self': 'SSSTL'
-        }  # English is complex
-
-        if df.shape[1] == 6:  # 6 columns: timestamp, name, 1st, 2nd, 3rd, email
-            if df.columns[0] == 'Timestamp' and (df.columns[-1] == 'Email address' or df.columns[1] == 'Email address'):
-                df.drop(['Email address'], axis=1, inplace=True)
-            else:
-                print('ERROR: Spreadsheet format not as expected')
-                self.importUnsuccLabel.setGeometry(QtCore.QRect(370, 80, 600, 30))
-                return False
-
-        if df.shape[1] == 5 and df.columns[0] == 'Timestamp':  # 5 columns: timestamp, name, 1st, 2nd, 3rd
-            for index, row in df.iterrows():
-
-                for i in range(2, 5):  # Change subject names to shorter names
-                    for keyword, short_name in names_reference.items():
-                        if keyword in row[df.columns[i]].lower().strip():
-                            row[df.columns[i]] = short_name
-                            break
-
-                if row[df.columns[1]] not in student_info.keys():
-                    student_info[row[df.columns[1]]] = [row[df.columns[2]], row[df.columns[3]], row[df.columns[4]]]
-                else:  # Exact same name
-                    student_info[f'{row[df.columns[1]]}_2'] = [row[df.columns[2]], row[df.columns[3]], row[df.columns[4]]]  # SMALL ISSUE: THIS DOES NOT CONSIDER THE CASE WHEN THERE ARE 3 NAMES THAT RE EXACTLY THE SAME
-        else:
-            print('ERROR: Spreadsheet format not as expected')
-            self.importUnsuccLabel.setGeometry(QtCore.QRect(370, 80, 600, 30))
-            return False
-
-        return True
-
-    def check_choice_repetition(self):
-        global student_info_copy
-        for choices in student_info.values():
-            if choices[0] == choices[1] and choices[0] == choices[2]:
-                choices[1], choices[2] = 'VIOLATION', 'VIOLATION'
-            elif choices[0] == choices[1]:
-                choices[1] = 'VIOLATION'
-            elif choices[0] == choices[2] or choices[1] == choices[2]:
-                choices[2] = 'VIOLATION'
-        capacity['VIOLATION'] = [0, 0]
-
-        # Copy info
-        for name, choices in student_info.items():
-            student_info_copy[name] = choices.copy()
-
-    def process_subjects(self):
-        del_lis = []
-
-        # Set up data structure of capacity based on subjects in student choices
-        for choices in student_info.values():  # SMALL ISSUE: THIS FOR LOOP IS NOT INTEGRATED INTO THE CHECK CHOICE REPETITION FUNCTION BECAUSE THEY DO DIFFERENT THINGS. IDK IF THEY SHOULD BE INTEGRATED. BASICALLY, PRIORITIZE FUNCTION CATEGORIZATION OR SPEED?
-            for choice in choices:
-                if choice not in capacity.keys():
-                    capacity[choice] = [0, 0]
-
-        # Check for white space and capitalization - name variation of same subject
-        for key in capacity.keys():
-            if key in del_lis:
-                continue
-            for key_2 in capacity.keys():
-                if key != key_2 and key.lower().strip() == key_2.lower().strip():
-                    # Variations of the same subject exist
-                    print(f"NOTE: Name variation of the same subject exists ({key} AND {key_2})")
-                    del_lis.append(key_2)  # SMALL ISSUE: BY DIRECTLY DELETING KEY_2, I DO NOT KNOW WHICH KEY IS INCORRECTLY FORMATTED - I MIGHT BE DELETING THE CORRECTLY FORMATTED KEY. BUT CHECKING WHICH KEY (KEY OR KEY_2) IS CORRECTLY FORMATTED TAKES MORE TIME.
-        for subject in del_lis:
-            capacity.pop(subject)
-
-    def show_subject_labels(self, subjects):
-        global displayed_subjects_num
-        # Move label to correct place. Set color.
-        # Move spinbox to correct place.
-
-        if len(subjects) > 34:  # 34 is the max number of subjects that can be displayed
-            print('ERROR: Too many subjects to display!')
-            self.errorLabel.setGeometry(QtCore.QRect(450, 350, 600, 80))
-            return False
-
-        margins = {}  # 1:[140, 57]    140 is y starting positionfirst subject of the . 57 is space between lines of subjects
-        for i in range(1, 35):
-            if i <= 22:
-                margins[str(i)] = [140, 57]
-            elif i == 23 or i == 24:
-                margins[str(i)] = [140, 50]
-            elif i == 25 or i == 26:
-                margins[str(i)] = [110, 50]
-            elif i == 27 or i == 28:
-                margins[str(i)] = [110, 47]
-            elif i == 29 or i == 30:
-                margins[str(i)] = [110, 45]
-            elif i == 31 or i == 32:
-                margins[str(i)] = [110, 42]
-            elif i == 33 or i == 34:
-                margins[str(i)] = [110, 38]
-
-        for i in range(1, len(subjects) + 1):
-
-            # Change position of label and spinbox
-            if i <= (len(subjects) // 2) + (len(subjects) % 2):
-                eval(
-                    f'self.subjectLabel{i}.setGeometry(QtCore.QRect(390, {margins[str(len(subjects))][0]} + (i - 1) * {margins[str(len(subjects))][1]}, 160, 39))')
-                eval(
-                    f"self.spinBox{i}.setGeometry(QtCore.QRect(550, {margins[str(len(subjects))][0]} + (i - 1) * {margins[str(len(subjects))][1]}, 48, 24))")
-            else:
-                eval(
-                    f'self.subjectLabel{i}.setGeometry(QtCore.QRect(670, {margins[str(len(subjects))][0]} + (i - (len(subjects) // 2) - (len(subjects)) % 2 - 1) * {margins[str(len(subjects))][1]}, 160, 39))')
-                eval(
-                    f"self.spinBox{i}.setGeometry(QtCore.QRect(830, {margins[str(len(subjects))][0]} + (i - (len(subjects) // 2) - (len(subjects)) % 2 - 1) * {margins[str(len(subjects))][1]}, 48, 24))")
-
-            # Set color
-            if i % 2 == 1:
-                eval(f'self.subjectLabel{i}.setStyleSheet("color: rgba(0, 143, 53, 1);")')
-                eval(f'self.spinBox{i}.setStyleSheet("color: rgba(0, 143, 53, 1);")')
-            elif i % 2 == 0:
-                eval(f'self.subjectLabel{i}.setStyleSheet("color: rgba(0, 0, 0, 1);")')
-                eval(f'self.spinBox{i}.setStyleSheet("color: rgba(0, 0, 0, 1);")')
-
-            # Handle long names
-            if len(subjects[i - 1]) > 16 and len(subjects[i - 1]) <= 28:  # Split into 2 lines
-                subject_name = f'{subjects[i - 1][:16]}\n{subjects[i - 1][16:]}'
-                eval(f'self.subjectLabel{i}.setText(subject_name)')
-            elif len(subjects[i - 1]) > 28:  # Cannot fit into 2 lines, use ...
-                subject_name = f'{subjects[i - 1][:16]}\n{subjects[i - 1][16:27]}...'
-                eval(f'self.subjectLabel{i}.setText(subject_name)')
-            else:
-                eval(f'self.subjectLabel{i}.setText(subjects[{i - 1}])')
-
-            # Reset spinbox value
-            eval(f'self.spinBox{i}.setValue(0)')
-
-        # Update variable. Used in hiding labels
-        displayed_subjects_num = len(subjects)
+    def show_capacity_table(self, subjects, demand, rank_labels):
+        # One row per subject with its demand as every choice. Any number of subjects fits, the table scrolls.
+        self.capacityModel.load(subjects, demand, rank_labels)
+        self.size_capacity_columns()
+        self.capacityTable.scrollToTop()
+        self.capacityTable.show()
 
         # Show other labels
         self.importSuccLabel.setGeometry(QtCore.QRect(90, 140, 185, 30))
-        if len(subjects) > 24:  # If not many subjects, leave more space so it's more aesthetically pleasing.
-            self.enterCapLabel.setGeometry(QtCore.QRect(530, 55, 220, 31))
-        else:
-            self.enterCapLabel.setGeometry(QtCore.QRect(530, 75, 220, 31))
-        return True
+        self.enterCapLabel.setGeometry(QtCore.QRect(530, 55, 220, 31))
 
     def hide_labels(self):
         self.importSuccLabel.setGeometry(QtCore.QRect(9999, 80, 185, 30))
         self.importUnsuccLabel.setGeometry(QtCore.QRect(9999, 80, 600, 30))
         self.errorLabel.setGeometry(QtCore.QRect(9999, 350, 600, 80))
         self.enterCapLabel.setGeometry(QtCore.QRect(9999, 120, 201, 31))
+        self.boundsLabel.setGeometry(QtCore.QRect(9999, 648, 500, 92))
         self.importFirstLabel.setGeometry(QtCore.QRect(9999, 435, 315, 30))
         self.allocateFirstLabel.setGeometry(QtCore.QRect(9999, 715, 315, 30))
         self.notSpreadsheetLabel.setGeometry(QtCore.QRect(9999, 350, 600, 80))
+        self.hide_result_labels()
+        self.capacityTable.hide()
+        self.configurationTable.hide()
 
+    def hide_result_labels(self):
         self.leftBar.setGeometry(QtCore.QRect(9999, 260, 21, 258))
         self.rightBar.setGeometry(QtCore.QRect(9999, 260, 21, 258))
         self.topBar.setGeometry(QtCore.QRect(9999, 246, 402, 31))
@@ -541,25 +572,18 @@ class Ui_MainWindow(object):
         self.allocationResultLabel.setGeometry(QtCore.QRect(9999, 271, 191, 31))
         self.firstChoiceLabel.setGeometry(QtCore.QRect(9999, 321, 200, 31))
         self.secondChoiceLabel.setGeometry(QtCore.QRect(9999, 371, 200, 31))
-        self.thirdChoiceLabel.setGeometry(QtCore.QRect(9999, 421, 200, 31))
+        self.thirdChoiceLabel.setGeometry(QtCore.QRect(9999, 421, 260, 31))
         self.allocationSummaryLabel.setGeometry(QtCore.QRect(9999, 471, 365, 31))
         self.unallocatedStudentLabel.setGeometry(QtCore.QRect(9999, 471, 361, 31))
-
-        for i in range(displayed_subjects_num):  # When first allocating, displayed_s_num = 0, won't run loop
-            eval(f'self.subjectLabel{i + 1}.setGeometry(QtCore.QRect(9999, 0, 1, 1))')
-            eval(f'self.spinBox{i + 1}.setGeometry(QtCore.QRect(9999, 0, 1, 1))')
+        self.detailsButton.setGeometry(QtCore.QRect(9999, 590, 200, 25))
+        self.detailsPanel.setGeometry(QtCore.QRect(9999, 618, 425, 120))
 
     def main_process_data(self):
-        global student_info, student_info_copy, unlucky_students, capacity, import_success, allocate_success
         import_is_spread = True
 
         filename, _ = QFileDialog.getOpenFileName()
         if filename:
-            if filename[-5:] == '.xlsx':
-                df = pd.read_excel(filename)
-            elif filename[-4:] == '.csv':
-                df = pd.read_csv(filename)
-            else:
+            if not filename.endswith(SPREADSHEET_EXTENSIONS):
                 # Imported a file, but file is NOT spreadsheet
                 import_is_spread = False
         else:
@@ -570,221 +594,129 @@ class Ui_MainWindow(object):
         self.hide_labels()
 
         # Reset all variables
-        student_info, student_info_copy, unlucky_students, capacity = {}, {}, {}, {}
-        allocate_success = False
+        self.session.reset()
+        self.entered_capacities.pop(self.session, None)
+        self.clear_live_edits()
 
         if not import_is_spread:
             # This goes below the should_reset if statement, because we want to show label after hiding al labels.
             self.notSpreadsheetLabel.setGeometry(QtCore.QRect(450, 350, 600, 80))
-            import_success = False
             return None
 
-        if self.convert_data_type(df):
-            self.check_choice_repetition()
-            self.process_subjects()
-            subjects = list(capacity.keys())
-            if 'VIOLATION' in subjects:
-                subjects.pop(subjects.index('VIOLATION'))
-            import_success = self.show_subject_labels(subjects)
+        # The session stays empty until the background import is done
+        def job(report):
+            from import_cache import ImportCache
+            self.session.aliases = load_aliases(ALIASES_FILE)
+            return self.session.import_file(filename, progress=lambda rows: report(f'Importing... {rows} rows processed'),
+                                            cache=ImportCache())
+        self.start_task('Import', job, lambda imported: self.finish_import(imported, filename))
+
+    def finish_import(self, imported, filename):
+        if imported:
+            self.session.name = os.path.splitext(os.path.basename(filename))[0]  # The cohort is named after its file
+            self.refresh_cohorts()
+            engine = self.session.engine
+            self.show_capacity_table(engine.subjects(), engine.demand_counts()[1:], engine.choice_labels())
+            self.show_bounds()
+            self.show_configurations()  # Configurations tried on an earlier import of the same choices
         else:
-            import_success = False
+            self.importUnsuccLabel.setGeometry(QtCore.QRect(370, 80, 600, 30))
+        self.statusbar.clearMessage()
+
+    def refresh_cohorts(self):
+        # One entry per session, then NEW_COHORT. The cohort shown is selected.
+        self.cohortComboBox.blockSignals(True)
+        self.cohortComboBox.clear()
+        self.cohortComboBox.addItems([session.name for session in self.sessions] + [NEW_COHORT])
+        self.cohortComboBox.setCurrentIndex(self.sessions.index(self.session))
+        self.cohortComboBox.blockSignals(False)
+
+    def switch_cohort(self, index):
+        # Show another cohort, or a new empty one for NEW_COHORT. The cohort left keeps the capacities in the table.
+        if self.task is not None:
+            return None
+        if self.session.imported:
+            self.entered_capacities[self.session] = list(self.capacityModel.capacity)
+        self.clear_live_edits()
+        if index == len(self.sessions):
+            self.sessions.append(AllocationSession(name=f'Cohort {len(self.sessions) + 1}'))
+        self.session = self.sessions[index]
+        self.refresh_cohorts()
+        self.show_cohort()
+
+    def show_cohort(self):
+        # Put the widgets back the way the cohort shown was left
+        self.hide_labels()
+        session = self.session
+        if not session.imported:
+            self.statusbar.showMessage(f'{session.name}: nothing imported yet')
+            return None
+        engine = session.engine
+        self.show_capacity_table(engine.subjects(), engine.demand_counts()[1:], engine.choice_labels())
+        capacity = self.entered_capacities.get(session)
+        if capacity is None and session.allocated:
+            capacity = engine.capacity[1:]  # Id 0 is VIOLATION, which has no row
+        if capacity is not None:
+            self.capacityModel.set_capacities(capacity)
+        self.show_bounds()
+        self.show_configurations()
+        if session.allocated:
+            self.optimalCheckBox.setChecked(engine.stats.mode == 'optimal')
+            self.searchSpinBox.setValue(int(engine.stats.search_budget))
+            self.summarize_results()
+        self.statusbar.showMessage(f'{session.name} shown')
 
 
     '''
     Allocation
     '''
     def process_capacity(self):
-        global capacity, unlucky_students, student_info
-        count = 1
-        for subject, caps in capacity.items():
-            if subject != 'VIOLATION':
-                caps[0] = eval(f'self.spinBox{count}.value()')
-                count += 1
-            caps[1] = 0
-
-        unlucky_students = {}
-        for key, val in student_info_copy.items():
-            # To allocate again, must retrieve original data from student_info_copy because student_info is modified
-            student_info[key] = val.copy()
-
-    def allocate_1st_choice(self):
-        for name, choices in student_info.items():
-            if choices[0] not in capacity.keys():  # Error check
-                print("ERROR - Student's subject is recorded not in the capacity dictionary")
-            if capacity[choices[0]][1] < capacity[choices[0]][0]:
-                capacity[choices[0]][1] += 1
-                choices.append(f'1st CHOICE - {choices[0]}')
-
-    def allocate_2nd_choice(self):
-        for name, choices in student_info.items():
-            if len(choices) == 3:
-                if capacity[choices[1]][1] < capacity[choices[1]][0]:  # If capacity of 2nd choice not full
-                    capacity[choices[1]][1] += 1
-                    choices.append(f'2nd CHOICE - {choices[1]}')
-                else:
-                    unlucky_students[name] = choices.copy()  # Using copy() is important. Otherwise lists are linked
-
-    def first_optimize(self):
-        del_list = []
-        for unlucky_name, unlucky_choices in unlucky_students.items():
-            swicthed = False  # Use this variable to break because codes below have nested loops
-            for name_1, choices_1 in student_info.items():
-                if swicthed:
-                    break
-                if '1st CHOICE' in choices_1[-1] and unlucky_choices[0] == choices_1[0]:
-                    # Algo 1 (13 or 10 --> 12)
-                    if capacity[choices_1[1]][0] > capacity[choices_1[1]][1]:
-                        capacity[choices_1[1]][1] += 1
-                        choices_1[-1] = f'2nd CHOICE - {choices_1[1]}'
-                        student_info[unlucky_name].append(f'1st CHOICE - {unlucky_choices[0]}')
-                        del_list.append(unlucky_name)
-                        break
-                elif '2nd CHOICE' in choices_1[-1] and unlucky_choices[1] == choices_1[1]:
-                    # Algo 2 (123 or 120 --> 122)
-                    for name_2, choices_2 in student_info.items():
-                        if '1st CHOICE' in choices_2[-1] and choices_1[0] == choices_2[0] and capacity[choices_2[1]][0] > capacity[choices_2[1]][1]:  # No need name != name
-                            capacity[choices_2[1]][1] += 1
-                            choices_1[-1] = f'1st CHOICE - {choices_1[0]}'
-                            choices_2[-1] = f'2nd CHOICE - {choices_2[1]}'
-                            student_info[unlucky_name].append(f'2nd CHOICE - {unlucky_choices[1]}')
-                            del_list.append(unlucky_name)
-                            swicthed = True
-                            break
-        for student in del_list:
-            unlucky_students.pop(student)
-
-    def allocate_3rd_choice(self):
-        del_list = []
-        for name, choices in unlucky_students.items():
-            if capacity[choices[2]][0] > capacity[choices[2]][1]:
-                capacity[choices[2]][1] += 1
-                del_list.append(name)
-                student_info[name].append(f'3rd CHOICE - {choices[2]}')
-        for student in del_list:
-            unlucky_students.pop(student)
-
-    def optimization_helper(self, increased_subject, choice_1, choice_1_num, choice_2, choice_2_num, unlucky_name, unlucky_choices, unlucky_num):
-        capacity[increased_subject][1] += 1
-        ref = ['1st CHOICE', '2nd CHOICE', '3rd CHOICE']
-        choice_1[-1] = f'{ref[choice_1_num]} - {choice_1[choice_1_num]}'
-        if choice_2 is not False:
-            choice_2[-1] = f'{ref[choice_2_num]} - {choice_2[choice_2_num]}'
-        student_info[unlucky_name].append(f'{ref[unlucky_num]} - {unlucky_choices[unlucky_num]}')
-        return True
-
-    def optimize_round_1(self, unlucky_name, unlucky_choices):
-        for name_1, choices_1 in student_info.items():
-            if '1st CHOICE' in choices_1[-1] and capacity[choices_1[1]][0] > capacity[choices_1[1]][1]:
-                if choices_1[0] == unlucky_choices[1]:
-                    # Algo 11 (10 --> 22)
-                    return self.optimization_helper(choices_1[1], choices_1, 1, False, False, unlucky_name, unlucky_choices, 1)
-                else:
-                    for name_2, choices_2 in student_info.items():
-                        if '1st CHOICE' in choices_2[-1] and choices_2[0] == unlucky_choices[0] and choices_1[0] == choices_2[1] and name_1 != name_2:
-                            # Algo 3 (110 --> 122)
-                            return self.optimization_helper(choices_1[1], choices_1, 1, choices_2, 1, unlucky_name, unlucky_choices, 0)
-
-    def optimize_round_2(self, unlucky_name, unlucky_choices):
-        for name_1, choices_1 in student_info.items():
-            if '1st CHOICE' in choices_1[-1] and choices_1[0] == unlucky_choices[0]:
-                if capacity[choices_1[2]][0] > capacity[choices_1[2]][1]:
-                    # Algo 6 (10 --> 13)
-                    return self.optimization_helper(choices_1[2], choices_1, 2, False, False, unlucky_name, unlucky_choices, 0)
-                else:
-                    for name_2, choices_2 in student_info.items():
-                        if '2nd CHOICE' in choices_2[-1] and choices_1[1] == choices_2[1] and capacity[choices_2[2]][0] > capacity[choices_2[2]][1]:
-                            # Algo 5 (120 --> 123)
-                            return self.optimization_helper(choices_2[2], choices_2, 2, choices_1, 1, unlucky_name, unlucky_choices, 0)
-            elif '2nd CHOICE' in choices_1[-1] and choices_1[1] == unlucky_choices[1] and capacity[choices_1[2]][0] > capacity[choices_1[2]][1]:
-                # Algo 7 (20 --> 23)
-                return self.optimization_helper(choices_1[2], choices_1, 2, False, False, unlucky_name, unlucky_choices, 1)
-
-    def optimize_round_3(self, unlucky_name, unlucky_choices):
-        for name_1, choices_1 in student_info.items():
-            if '1st CHOICE' in choices_1[-1]:
-                if choices_1[0] == unlucky_choices[1] and capacity[choices_1[2]][0] > capacity[choices_1[2]][1]:
-                    # Algo 12 (10 --> 23)
-                    return self.optimization_helper(choices_1[2], choices_1, 2, False, False, unlucky_name, unlucky_choices, 1)
-                elif choices_1[0] == unlucky_choices[2] and capacity[choices_1[1]][0] > capacity[choices_1[1]][1]:
-                    # Algo 13 (10 --> 23)
-                    return self.optimization_helper(choices_1[1], choices_1, 1, False, False, unlucky_name, unlucky_choices, 2)
-                else:
-                    for name_2, choices_2 in student_info.items():
-                        if '1st CHOICE' in choices_2[-1] and choices_1[0] == unlucky_choices[0] and name_1 != name_2:
-                            if choices_1[1] == choices_2[0] and capacity[choices_2[2]][0] > capacity[choices_2[2]][1]:
-                                # Algo 4 (110 --> 123)
-                                return self.optimization_helper(choices_2[2], choices_2, 2, choices_1, 1, unlucky_name, unlucky_choices, 0)
-                            elif choices_1[2] == choices_2[0] and capacity[choices_2[1]][0] > capacity[choices_2[1]][1]:
-                                # Algo 8 (110 --> 123)
-                                return self.optimization_helper(choices_2[1], choices_2, 1, choices_1, 2, unlucky_name, unlucky_choices, 0)
-
-    def optimize_round_4(self, unlucky_name, unlucky_choices):
-        for name_1, choices_1 in student_info.items():
-            if '2nd CHOICE' in choices_1[-1] and capacity[choices_1[2]][0] > capacity[choices_1[2]][1]:
-                if choices_1[1] == unlucky_choices[2]:
-                    # Algo 15 (20 --> 33)
-                    return self.optimization_helper(choices_1[2], choices_1, 2, False, False, unlucky_name, unlucky_choices, 2)
-                else:
-                    for name_2, choices_2 in student_info.items():
-                        if '1st CHOICE' in choices_2[-1] and choices_2[0] == unlucky_choices[0] and choices_1[1] == choices_2[2]:
-                            # Algo 10 (120 --> 133)
-                            return self.optimization_helper(choices_1[2], choices_1, 2, choices_2, 2, unlucky_name, unlucky_choices, 0)
-
-    def optimize_round_5(self, unlucky_name, unlucky_choices):
-        for name_1, choices_1 in student_info.items():
-            if '1st CHOICE' in choices_1[-1] and capacity[choices_1[2]][0] > capacity[choices_1[2]][1]:
-                if choices_1[0] == unlucky_choices[2]:
-                    # Algo 14 (10 --> 33)
-                    return self.optimization_helper(choices_1[2], choices_1, 2, False, False, unlucky_name, unlucky_choices, 2)
-                else:
-                    for name_2, choices_2 in student_info.items():
-                        if '1st CHOICE' in choices_2[-1] and choices_2[0] == unlucky_choices[0] and choices_1[0] == choices_2[2] and name_1 != name_2:
-                            # Algo 9 (110 --> 133)
-                            return self.optimization_helper(choices_1[2], choices_1, 2, choices_2, 2, unlucky_name, unlucky_choices, 0)
-
-    def final_help_unlucky(self):
-        global unlucky_students
-        del_list = []
-        for unlucky_name, unlucky_choices in unlucky_students.items():
-            failed = False
-            # Each round contains several optimizations of the same level of superiority.
-            # The earlier a round occurs, it means it's preferred over other rounds.
-            # Refer to algorithms ranking at the bottom.
-            if not self.optimize_round_1(unlucky_name, unlucky_choices):
-                if not self.optimize_round_2(unlucky_name, unlucky_choices):
-                    if not self.optimize_round_3(unlucky_name, unlucky_choices):
-                        if not self.optimize_round_4(unlucky_name, unlucky_choices):
-                            if not self.optimize_round_5(unlucky_name, unlucky_choices):
-                                failed = True
-            if not failed:
-                del_list.append(unlucky_name)
-        for name in del_list:
-            unlucky_students.pop(name)
+        # Read the capacity of each subject from the capacity table
+        self.capacityTable.setCurrentIndex(QtCore.QModelIndex())  # Commits a capacity that is still being edited
+        return self.capacityModel.capacities()
+
+    def show_bounds(self):
+        # Upper bounds of the capacities in the table, without allocating (allocation_bounds.py).
+        # Computed once no capacity changed for BOUNDS_DELAY_MS, holding a spin box arrow only computes them once.
+        self.boundsTimer.start()
+
+    def check_bounds(self):
+        # Compute the bounds on a background task. Capacities changed meanwhile are checked once it is done.
+        if self.bounds_task is not None:
+            self.bounds_pending = True
+            return None
+        if not self.session.imported:
+            return None
+        session = self.session
+        capacities = self.capacityModel.capacities()
+        self.bounds_task = EngineTask(lambda report: session.check_capacities(capacities))
+        self.bounds_task.succeeded.connect(lambda bounds: self.finish_bounds(session, bounds))
+        self.bounds_task.failed.connect(lambda error: print(f'NOTE: Checking the capacities failed ({error})'))
+        self.bounds_task.finished.connect(self.end_bounds_task)
+        self.bounds_task.start()
+
+    def finish_bounds(self, session, bounds):
+        if session is not self.session or not session.imported:
+            return None  # Another cohort is shown, or the cohort is being imported again
+        self.boundsLabel.setText(bounds_text(bounds))
+        self.boundsLabel.setStyleSheet("color: rgba(0, 143, 53, 1);" if not bounds['short_subjects']
+                                       else "color: rgba(200, 20, 20, 1);")
+        self.boundsLabel.setGeometry(QtCore.QRect(390, 648, 500, 92))
 
     def summarize_results(self):
-        record = {
-            '1st': 0,
-            '2nd': 0,
-            '3rd': 0
-        }
-        for choices in student_info.values():
-            if '1st' in choices[-1]:
-                record['1st'] += 1
-            elif '2nd' in choices[-1]:
-                record['2nd'] += 1
-            elif '3rd' in choices[-1]:
-                record['3rd'] += 1
+        record, student_num, unallocated, report = self.session.results()
 
         _translate = QtCore.QCoreApplication.translate
         self.allocationResultLabel.setText(_translate("MainWindow", "Allocation Result:"))
-        self.firstChoiceLabel.setText(_translate("MainWindow", f"1st Choice Receivers: {record['1st']}"))
-        self.secondChoiceLabel.setText(_translate("MainWindow", f"2nd Choice Receivers: {record['2nd']}"))
-        self.thirdChoiceLabel.setText(_translate("MainWindow", f"3rd Choice Receivers: {record['3rd']}"))
+        first, second, rest = receiver_lines(record)
+        self.firstChoiceLabel.setText(_translate("MainWindow", first))
+        self.secondChoiceLabel.setText(_translate("MainWindow", second))
+        self.thirdChoiceLabel.setText(_translate("MainWindow", rest))
 
         self.allocationResultLabel.setGeometry(QtCore.QRect(1050, 271, 191, 31))
         self.firstChoiceLabel.setGeometry(QtCore.QRect(1000, 321, 200, 31))
         self.secondChoiceLabel.setGeometry(QtCore.QRect(1000, 371, 200, 31))
-        self.thirdChoiceLabel.setGeometry(QtCore.QRect(1000, 421, 200, 31))
+        self.thirdChoiceLabel.setGeometry(QtCore.QRect(1000, 421, 260, 31))
         self.allocationSummaryLabel.setGeometry(QtCore.QRect(950, 471, 365, 31))
 
         self.leftBar.setGeometry(QtCore.QRect(920, 260, 21, 258))
@@ -792,79 +724,202 @@ class Ui_MainWindow(object):
         self.topBar.setGeometry(QtCore.QRect(929, 246, 407, 31))
         self.bottomBar.setGeometry(QtCore.QRect(930, 501, 405, 31))
 
-        if len(unlucky_students) == 0:
-            self.allocationSummaryLabel.setText(_translate("MainWindow", f"Allocation Complete: {len(student_info)}/{len(student_info)} students allocated"))
+        if unallocated == 0:
+            self.allocationSummaryLabel.setText(_translate("MainWindow", f"Allocation Complete: {student_num}/{student_num} students allocated"))
             self.unallocatedStudentLabel.setGeometry(QtCore.QRect(9999, 471, 361, 31))
             self.allocationSummaryLabel.setStyleSheet("color: rgba(0, 143, 53, 1);")
         else:  # There are students who received no choice: extend left bar right bar, lower bottom bar, lower allocation text, change color, add unallocated stats
-            self.allocationSummaryLabel.setText(_translate("MainWindow", f"Allocation Incomplete: {sum(record.values())}/{len(student_info)} students allocated"))
+            self.allocationSummaryLabel.setText(_translate("MainWindow", f"Allocation Incomplete: {sum(record.values())}/{student_num} students allocated"))
             self.allocationSummaryLabel.setStyleSheet("color: rgba(200, 50, 50, 1);")
             self.allocationSummaryLabel.setGeometry(QtCore.QRect(950, 521, 375, 31))
             self.unallocatedStudentLabel.setGeometry(QtCore.QRect(1000, 471, 361, 31))
-            self.unallocatedStudentLabel.setText(_translate("MainWindow", f"Unallocated Students: {len(unlucky_students)}"))
+            self.unallocatedStudentLabel.setText(_translate("MainWindow", f"Unallocated Students: {unallocated}"))
             self.leftBar.setGeometry(QtCore.QRect(920, 260, 21, 300))
             self.rightBar.setGeometry(QtCore.QRect(1325, 260, 21, 300))
             self.bottomBar.setGeometry(QtCore.QRect(930, 543, 405, 31))
 
+        self.detailsPanel.setPlainText(format_report(report))
+        self.detailsButton.setGeometry(QtCore.QRect(920, 590, 200, 25))
+        self.toggle_details(self.detailsButton.isChecked())
+
+    def toggle_details(self, expanded):
+        # Collapsible allocation details below the result
+        if expanded:
+            self.detailsButton.setArrowType(QtCore.Qt.DownArrow)
+            self.detailsPanel.setGeometry(QtCore.QRect(920, 618, 425, 120))
+        else:
+            self.detailsButton.setArrowType(QtCore.Qt.RightArrow)
+            self.detailsPanel.setGeometry(QtCore.QRect(9999, 618, 425, 120))
+
     def main_allocate(self):
-        global allocate_success
-        if import_success:
+        if self.session.imported:
+            self.clear_live_edits()  # Every capacity in the table is allocated now
             self.allocateFirstLabel.setGeometry(QtCore.QRect(9999, 715, 315, 30))
-            self.process_capacity()
-            self.allocate_1st_choice()
-            self.allocate_2nd_choice()
-            if len(unlucky_students) != 0:
-                self.first_optimize()
-            self.allocate_3rd_choice()
-            if len(unlucky_students) != 0:
-                # Series of tricks to ensure that no students receive 3rd choice.
-                self.final_help_unlucky()
-            self.summarize_results()
-            allocate_success = True
+            capacities = self.process_capacity()  # Widgets are only read on the GUI thread
+            mode = 'optimal' if self.optimalCheckBox.isChecked() else 'heuristic'
+            search_budget = self.searchSpinBox.value()
+
+            def job(report):
+                self.session.allocate(capacities, mode, report, search_budget)  # Not allocated until it is done
+            self.start_task('Allocation', job, self.finish_allocate)
         else:
-            allocate_success = False
             self.importFirstLabel.setGeometry(QtCore.QRect(41, 435, 315, 30))
 
+    def finish_allocate(self, _):
+        self.summarize_results()
+        self.show_configurations()
+        self.statusbar.clearMessage()
+
+    def show_configurations(self):
+        # One row per cached allocation of the imported choices. The one shown as the result is selected.
+        engine = self.session.engine
+        self.configurations = self.session.configurations()
+        self.configurationTable.clearSelection()
+        self.configurationTable.setRowCount(len(self.configurations))
+        current = (tuple(engine.capacity), engine.mode_label())
+        if self.configurations:
+            self.set_configuration_columns([label for label in self.configurations[0].result if label != 'unallocated'])
+        for row, cached in enumerate(self.configurations):
+            values = [cached.number, cached.mode, sum(cached.capacity)] + list(cached.result.values())
+            for column, value in enumerate(values):
+                item = QtWidgets.QTableWidgetItem(str(value))
+                if column != 1:
+                    item.setTextAlignment(int(QtCore.Qt.AlignRight | QtCore.Qt.AlignVCenter))
+                self.configurationTable.setItem(row, column, item)
+            if self.session.allocated and (cached.capacity, cached.mode) == current:
+                self.configurationTable.selectRow(row)
+        self.configurationTable.setVisible(len(self.configurations) > 0)
+
+    def capacity_changed(self, top_left, bottom_right):
+        # Live results: allocate again as soon as the capacity of one subject changes
+        if self.session.imported:
+            self.show_bounds()
+        if not (self.liveCheckBox.isChecked() and self.session.imported):
+            return None
+        if top_left.row() != bottom_right.row() or top_left.column() != CAPACITY_COLUMN:
+            return None  # Not a single capacity edit, e.g. a restored configuration
+        row = top_left.row()
+        self.live_edits[row] = self.capacityModel.capacity[row]
+        self.liveTimer.start()  # Holding a spin box arrow only allocates once it is let go
+
+    def live_update(self):
+        # Allocate the edits collected by capacity_changed on a background task, so the window never waits for the engine
+        if not self.live_edits:
+            return None
+        if self.task is not None:
+            self.live_pending = True  # Allocated once the task is done
+            return None
+        mode = 'optimal' if self.optimalCheckBox.isChecked() else 'heuristic'
+        if not (self.session.allocated and mode == 'optimal' and self.session.engine.stats.mode == 'optimal'):
+            self.main_allocate()
+            return None
+        edits = [(self.capacityModel.subjects[row], capacity) for row, capacity in self.live_edits.items()]
+        self.clear_live_edits()
+
+        def job(report):
+            for subject, capacity in edits:
+                self.session.change_capacity(subject, capacity, report)
+        self.start_task('Allocation', job, self.finish_allocate)
+
+    def clear_live_edits(self):
+        self.liveTimer.stop()
+        self.live_edits = {}
+
+    def restore_configuration(self, row):
+        # Put a configuration tried before back into the capacity table and show its result, without allocating again
+        if self.task is not None:
+            return None
+        cached = self.configurations[row]
+        self.clear_live_edits()  # The restored capacities replace them
+        self.session.restore_allocation(cached)
+        self.capacityModel.set_capacities(cached.capacity[1:])  # Id 0 is VIOLATION, which has no row
+        self.optimalCheckBox.setChecked(cached.mode == 'optimal')
+        self.searchSpinBox.setValue(int(cached.stats.search_budget))
+        self.allocateFirstLabel.setGeometry(QtCore.QRect(9999, 715, 315, 30))
+        self.summarize_results()
+        self.configurationTable.selectRow(row)
+        self.statusbar.showMessage(f'Configuration {cached.number} restored')
+
 
     '''
     Output
     '''
-    def form_result_df(self):
-        data = {}
-        data['Name'] = [name for name in student_info.keys()]
-        data['Allocated Choice'] = []
-        for choices in student_info.values():
-            if len(choices) == 3:
-                data['Allocated Choice'].append("Didn't Receive a Choice")
-            else:
-                data['Allocated Choice'].append(choices[-1].split(' - ')[-1])
-        data['1st Choice'] = [choices[0] for choices in student_info.values()]
-        data['2nd Choice'] = [choices[1] for choices in student_info.values()]
-        data['3rd Choice'] = [choices[2] for choices in student_info.values()]
-        return pd.DataFrame(data)
-
-    def output_df(self, df):
-        try:
-            file_name, _ = QtWidgets.QFileDialog.getSaveFileName()
-            if file_name[-4:] == '.csv':
-                df.to_csv(file_name, index=False)
-            elif file_name[-5:] == '.xlsx':
-                df.to_excel(file_name, index=False)
-            else:
-                file_name = file_name + '.xlsx'
-                df.to_excel(file_name, index=False)
-        except:
-            print('ERROR - Error in exporting')
-            pass
+    def output_df(self):
+        file_name, _ = QtWidgets.QFileDialog.getSaveFileName()
+        if not file_name:
+            return None
+
+        def job(report):
+            return self.session.output(file_name, report)
+        self.start_task('Output', job, lambda written: self.statusbar.showMessage(f'Result written to {written}'))
 
     def main_output(self):
-        if allocate_success:
-            df = self.form_result_df()
-            self.output_df(df)
+        if self.session.allocated:
+            self.output_df()
         else:
             self.allocateFirstLabel.setGeometry(QtCore.QRect(90, 715, 315, 30))
 
 
+    '''
+    Background tasks
+    '''
+    def start_task(self, phase, job, on_success):
+        # Run job(report) on a worker thread. on_success(result) runs on the GUI thread once it is done.
+        # phase is 'Import', 'Allocation' or 'Output'.
+        self.set_buttons_enabled(False)
+        self.cancelButton.show()
+        self.task = EngineTask(job)
+        self.task.progress.connect(self.statusbar.showMessage)
+        self.task.succeeded.connect(on_success)
+        self.task.failed.connect(lambda error: self.task_stopped(phase, f'failed: {error}', True))
+        self.task.cancelled.connect(lambda: self.task_stopped(phase, 'cancelled', False))
+        self.task.finished.connect(self.end_task)
+        self.task.start()
+
+    def end_task(self):
+        self.cancelButton.hide()
+        self.set_buttons_enabled(True)
+        self.task = None
+        if self.live_pending:
+            self.live_pending = False
+            self.live_update()  # With the capacities changed while the task ran
+
+    def end_bounds_task(self):
+        self.bounds_task = None
+        if self.bounds_pending:
+            self.bounds_pending = False
+            self.check_bounds()  # With the capacities changed while the bounds were computed
+
+    def task_stopped(self, phase, message, failed):
+        # A cancelled or failed import or allocation is left unfinished, so it has to be run again.
+        # The session already knows: it is only imported or allocated once the job is done.
+        # A cancelled import only shows the status bar message, the spreadsheet may well be fine.
+        self.live_pending = False
+        if phase == 'Import' and failed:
+            self.importUnsuccLabel.setGeometry(QtCore.QRect(370, 80, 600, 30))
+        elif phase == 'Allocation':
+            self.hide_result_labels()
+        print(f'NOTE: {phase} {message}')
+        self.statusbar.showMessage(f'{phase} {message}')
+
+    def set_buttons_enabled(self, enabled):
+        self.importButton.setEnabled(enabled)
+        self.allocateButton.setEnabled(enabled)
+        self.outputButton.setEnabled(enabled)
+        self.configurationTable.setEnabled(enabled)
+        self.cohortComboBox.setEnabled(enabled)
+
+    def stop_task(self):
+        # Called when the app quits, so the worker thread is never destroyed while running
+        if self.task is not None:
+            self.task.cancel()
+            self.task.wait()
+        if self.preload_task is not None:
+            self.preload_task.wait()
+        if self.bounds_task is not None:
+            self.bounds_task.wait()
+
+
     '''
     Interactions
     '''
@@ -872,17 +927,47 @@ class Ui_MainWindow(object):
         self.importButton.clicked.connect(self.main_process_data)
         self.allocateButton.clicked.connect(self.main_allocate)
         self.outputButton.clicked.connect(self.main_output)
+        self.detailsButton.toggled.connect(self.toggle_details)
+        self.capacityModel.dataChanged.connect(self.capacity_changed)
+        self.liveTimer.timeout.connect(self.live_update)
+        self.boundsTimer.timeout.connect(self.check_bounds)
+        self.cohortComboBox.activated.connect(self.switch_cohort)
+        self.configurationTable.cellDoubleClicked.connect(lambda row, column: self.restore_configuration(row))
+        self.cancelButton.clicked.connect(lambda: self.task.cancel() if self.task is not None else None)
+        QtWidgets.QApplication.instance().aboutToQuit.connect(self.stop_task)
+
+    '''
+    Startup
+    '''
+    def window_shown(self):
+        # Called by the event loop once the window is on screen
+        startup_timer.mark('first_window')
+        self.preload_task = EngineTask(lambda report: preload())
+        self.preload_task.succeeded.connect(self.finish_preload)
+        self.preload_task.failed.connect(lambda error: print(f'NOTE: Preloading failed, modules are loaded on first import ({error})'))
+        self.preload_task.start()
+
+    def finish_preload(self, times):
+        startup_timer.preload_times = times
+        if '--startup-report' in sys.argv:  # Measure the startup, print it and quit
+            print(json.dumps(startup_timer.report(), indent=2))
+            QtWidgets.QApplication.instance().quit()
+
 
+startup_timer.mark('imports')
 
 if __name__ == "__main__":
     try:
         app = QtWidgets.QApplication(sys.argv)
+        startup_timer.mark('qt_application')
         MainWindow = QtWidgets.QMainWindow()
         ui = Ui_MainWindow()
         ui.setupUi(MainWindow)
+        startup_timer.mark('setup_ui')
         MainWindow.show()
+        QtCore.QTimer.singleShot(0, ui.window_shown)
         sys.exit(app.exec_())
-    except:
+    except Exception:  # Not SystemExit, which sys.exit raises on every normal exit
         print('ERROR - Master error')
 
 
@@ -912,225 +997,3 @@ Alternative code:
 pyinstaller --onefile -w scriptname.py
 pyinstaller --onefile -w V3.0.py
 '''
-
-"""
-Optimization algorithms:
-
-Algo rankings:
-A (good optimization): 1, 2
-B (round 1): 3 (110 --> 122, no 3rd choice resulted)
-C (round 2): 5 (120 --> 123), 6 (10 --> 13), 7 (20 --> 23)
-D (round 3): 4 (110 --> 123), 8 (110 --> 123)
-E (round 4): 10 (120 --> 133)
-F (round 5): 9 (110 --> 133)
-
-1.
-Conditions:
-Student A: got 1st choice
-Student B: no 1st choice, no 2nd choice
-A and B have the same 1st choice
-A's 2nd choice is available
-Result:
-A drops 1st choice, gets 2nd choice
-B gets 1st choice
-Good optimization (13 or 10 --> 12)
-
-2.
-Conditions:
-Student A: got 1st choice
-Student B: got 2nd choice
-Student C: no 1st choice, no 2nd choice
-B and C have the same 2nd choice
-A and B have the same 1st choice
-A's 2nd choice is available
-Result:
-A drops 1st choice, gets 2nd choice
-B drops 2nd choice, gets 1st choice
-C gets 2nd choice
-Good optimization (123 or 120 --> 122)
-
-3.
-Conditions: 
-Student A: got 1st choice
-Student B: got 1st choice
-Student C: no 1st choice, no 2nd choice, no 3rd choice
-B and C have the same 1st choice
-B's 2nd choice = A's 1st choice
-A's 2nd choice is available
-Result:
-A drops 1st choice, gets 2nd choice
-B drops 1st choice, gets 2nd choice
-C gets 1st choice
-110 --> 122 (round 1)
-
-4. 
-Conditions: 
-Student A: got 1st choice
-Student B: got 1st choice
-Student C: no 1st choice, no 2nd choice, no 3rd choice
-A and C have the same 1st choice
-A's 2nd choice = B's 1st choice
-B's 3rd choice is available (2nd choice not available)
-Result:
-B drops 1st choice, gets 3rd choice
-A drops 1st choice, gets 2nd choice
-C gets 1st choice
-110 --> 123 (round 3)
-
-5.
-Conditions: 
-Student A: got 1st choice
-Student B: got 2nd choice
-Student C: no 1st choice, no 2nd choice, no 3rd choice
-A and C have the same 1st choice
-A and B have the same 2nd choice
-B's 3rd choice is available
-Result:
-B drops 2nd choice, gets 3rd choice
-A drops 1st choice, gets 2nd choice
-C gets 1st choice
-120 --> 123 (round 2)
-
-6.
-Conditions: 
-Student A: got 1st choice
-Student B: no 1st choice, no 2nd choice, no 3rd choice
-A and B have the same 1st choice
-A's 3rd choice is available
-Result:
-A drops 1st choice, gets 3rd choice
-B gets 1st choice
-10 --> 13 (round 2)
-
-7.
-Conditions: 
-Student A: got 2nd choice
-Student B: no 1st choice, no 2nd choice, no 3rd choice
-A and B have the same 2nd choice
-A's 3rd choice is available
-Result:
-A drops end choice, gets 3rd choice
-B gets 2nd choice
-20 --> 23 (round 2)
-
-8.
-Conditions: 
-Student A: got 1st choice
-Student B: got 1st choice
-Student C: no 1st choice, no 2nd choice, no 3rd choice
-A and C have the same 1st choice
-B's 1st choice = A's 3rd choice
-B's 2nd choice is available
-Result:
-B drops 1st choice, gets 2nd choice
-A drops 1st choice, gets 3rd choice
-C gets 1st choice
-110 --> 123 (round 3)
-
-9.
-Conditions:
-Student A: got 1st choice
-Student B: got 1st choice
-Student C: no 1st choice, no 2nd choice, no 3rd choice
-B and C have the same 1st choice
-A's 1st choice = B's 3rd choice
-A's 3rd choice is available (2nd choice not available)
-Result:
-B drops 1st choice, gets 3rd choice
-A drops 1st choice, gets 3rd choice
-C gets 1st choice
-110 --> 133 (round 5)
-
-10.
-Conditions: 
-Student A: got 2nd choice
-Student B: got 1st choice
-Student C: no 1st choice, no 2nd choice, no 3rd choice
-B and C have the same 1st choice
-A's 2nd choice = B's 3rd choice
-A's 3rd choice is available
-Result:
-A drops 2nd choice, gets 3rd choice
-B drops 1st choice, gets 3rd choice
-C gets 1st choice
-120 --> 133 (round 4)
-
-11
-Conditions:
-Student A: got 1st choice
-Student B: no 1st choice, no 2nd choice, no 3rd choice
-A's 1st choice = B's 2nd choice
-A's 2nd choice is available
-Result:
-A gets 2nd choice
-B gets 2nd choice
-10 --> 22 (round 1)
-
-12
-Conditions:
-Student A: got 1st choice
-Student B: no 1st choice, no 2nd choice, no 3rd choice
-A's 1st choice = B's 2nd choice
-A's 3rd choice is available (2nd choice not available)
-Result:
-A gets 3rd choice
-B gets 2nd choice
-10 --> 23 (round 3)
-
-13
-Conditions:
-Student A: got 1st choice
-Student B: no 1st choice, no 2nd choice, no 3rd choice
-A's 1st choice = B's 3rd choice
-A's 2nd choice available
-Result:
-A gets 2nd choice
-B gets 3rd choice
-10 --> 23 (round 3)
-
-14 
-Conditions:
-Student A: got 1st choice
-Student B: no 1st choice, no 2nd choice, no 3rd choice
-A's 1st choice = B's 3rd choice
-A's 3rd choice is available (2nd choice not available)
-Result: 
-A gets 3rd choice
-B gets 3rd choice
-10 --> 33 (round 5)
-
-15: 
-Conditions: 
-Student A: got 2nd choice
-Student B: no 1st choice, no 2nd choice, no 3rd choice
-A's 3rd choice is available
-A's 2nd choice = B's 3rd choice
-Result: 
-A gets 3rd
-B gets 3rd
-20 --> 33 (round 4)
-"""
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
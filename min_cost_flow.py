@@ -0,0 +1,120 @@
+"""
+Min-cost max-flow, used by the optimal allocation mode.
+
+Primal-dual method: Dijkstra with potentials finds the current shortest distance to the sink,
+then a blocking flow is pushed along every shortest path at once (Dinic on the zero reduced cost edges).
+The number of Dijkstra rounds is bounded by the largest shortest-path cost, not by the amount of flow,
+which keeps it fast when the costs are small integers such as choice ranks.
+"""
+
+import heapq
+from collections import deque
+
+
+class MinCostFlow(object):
+    def __init__(self, node_num):
+        self.node_num = node_num
+        self.graph = [[] for _ in range(node_num)]  # graph[u] = list of edge ids leaving u
+        self.to, self.cap, self.cost = [], [], []  # Edge e and its reverse edge e ^ 1 are stored next to each other
+
+    def add_edge(self, u, v, cap, cost):
+        # Returns the edge id, which can be passed to flow() after solving
+        edge = len(self.to)
+        self.graph[u].append(edge)
+        self.to.append(v)
+        self.cap.append(cap)
+        self.cost.append(cost)
+        self.graph[v].append(edge + 1)
+        self.to.append(u)
+        self.cap.append(0)
+        self.cost.append(-cost)
+        return edge
+
+    def flow(self, edge):
+        return self.cap[edge ^ 1]
+
+    def solve(self, source, sink):
+        # Returns (total flow, total cost). Costs must be non-negative.
+        graph, to, cap, cost = self.graph, self.to, self.cap, self.cost
+        potential = [0] * self.node_num
+        total_flow, total_cost = 0, 0
+        while True:
+            # Dijkstra on reduced costs
+            dist = [None] * self.node_num
+            dist[source] = 0
+            heap = [(0, source)]
+            while heap:
+                d, u = heapq.heappop(heap)
+                if d > dist[u]:
+                    continue
+                for edge in graph[u]:
+                    if cap[edge] > 0:
+                        v = to[edge]
+                        nd = d + cost[edge] + potential[u] - potential[v]
+                        if dist[v] is None or nd < dist[v]:
+                            dist[v] = nd
+                            heapq.heappush(heap, (nd, v))
+            if dist[sink] is None:
+                return total_flow, total_cost
+            for v in range(self.node_num):
+                if dist[v] is not None:
+                    potential[v] += dist[v]
+
+            # Blocking flow along the edges that are on a shortest path (reduced cost 0)
+            while True:
+                level = self._admissible_levels(source, sink, potential)
+                if level is None:
+                    break
+                pushed = self._push_blocking_flow(source, sink, potential, level)
+                total_flow += pushed
+                total_cost += pushed * (potential[sink] - potential[source])
+
+    def _admissible_levels(self, source, sink, potential):
+        # BFS levels over the admissible edges: residual capacity left and reduced cost 0
+        graph, to, cap, cost = self.graph, self.to, self.cap, self.cost
+        level = [-1] * self.node_num
+        level[source] = 0
+        queue = deque([source])
+        while queue:
+            u = queue.popleft()
+            next_level, pu = level[u] + 1, potential[u]
+            for edge in graph[u]:
+                v = to[edge]
+                if level[v] < 0 and cap[edge] > 0 and cost[edge] + pu == potential[v]:
+                    level[v] = next_level
+                    queue.append(v)
+        return level if level[sink] >= 0 else None
+
+    def _push_blocking_flow(self, source, sink, potential, level):
+        graph, to, cap, cost = self.graph, self.to, self.cap, self.cost
+        current = [0] * self.node_num  # Next edge to try for every node, so dead ends are never scanned twice
+        pushed = 0
+        while True:
+            # Find one path from source to sink in the level graph (iterative DFS)
+            path = []
+            u = source
+            while u != sink:
+                edges, i, next_level, pu = graph[u], current[u], level[u] + 1, potential[u]
+                while i < len(edges):
+                    edge = edges[i]
+                    v = to[edge]
+                    if level[v] == next_level and cap[edge] > 0 and cost[edge] + pu == potential[v]:
+                        break
+                    i += 1
+                current[u] = i
+                if i == len(edges):  # Dead end, retreat
+                    if u == source:
+                        return pushed
+                    level[u] = -1
+                    edge = path.pop()
+                    u = to[edge ^ 1]
+                    current[u] += 1
+                    continue
+                path.append(edge)
+                u = to[edge]
+
+            bottleneck = min(cap[edge] for edge in path)
+            for edge in path:
+                cap[edge] -= bottleneck
+                cap[edge ^ 1] += bottleneck
+            pushed += bottleneck
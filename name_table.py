@@ -0,0 +1,70 @@
+"""
+Compact table of student names.
+
+A list of str costs about 50 bytes of object header per name besides its characters, and a pointer in the list.
+A NameTable keeps every name in one str and the end offset of every name in an array, so a name costs its characters
+plus 8 bytes, and the table pickles as a handful of objects when it is sent to worker processes.
+It is the layout the import cache stores on disk (import_cache.pack_strings), so a cached import loads without
+splitting the names.
+
+A table is filled while importing and only read after that, so an engine can hand its table to others.
+"""
+
+import sys
+from array import array
+from itertools import accumulate, islice
+
+
+class NameTable(object):
+    __slots__ = ('text', 'ends', 'parts')
+
+    def __init__(self, names=()):
+        self.text = ''  # Every name, one after the other
+        self.ends = array('q')  # Position -> end of the name in text, in characters
+        self.parts = []  # Text of the names added since the last read, joined on the next one
+        self.extend(names)
+
+    @classmethod
+    def from_packed(cls, text, ends):
+        # Table over text and the end offset of every name (anything array('q') takes)
+        table = cls()
+        table.text = text
+        table.ends = array('q', ends)
+        return table
+
+    def extend(self, names):
+        names = list(names)
+        start = self.ends[-1] if self.ends else 0
+        self.ends.extend(islice(accumulate(map(len, names), initial=start), 1, None))
+        self.parts.append(''.join(names))
+
+    def joined(self):
+        # All the names as one str
+        if self.parts:
+            self.text = ''.join([self.text] + self.parts)
+            self.parts = []
+        return self.text
+
+    def __len__(self):
+        return len(self.ends)
+
+    def __getitem__(self, position):
+        text, ends = self.joined(), self.ends
+        if position < 0:
+            position += len(ends)
+            if position < 0:
+                raise IndexError('name position out of range')
+        return text[ends[position - 1] if position > 0 else 0:ends[position]]
+
+    def __iter__(self):
+        text, start = self.joined(), 0
+        for end in self.ends:
+            yield text[start:end]
+            start = end
+
+    def select(self, positions):
+        # Table of the names at positions, in that order
+        return NameTable(self[position] for position in positions)
+
+    def nbytes(self):
+        return sys.getsizeof(self.joined()) + len(self.ends) * self.ends.itemsize
@@ -0,0 +1,65 @@
+"""
+In-memory cache of allocation results.
+
+Planning means trying many capacity vectors, and often going back to one tried before. An entry is keyed by
+(input fingerprint, capacity of every subject, mode) and holds everything allocate leaves behind: the rank of every student,
+the allocated count of every subject, the unallocated students and the stats of the run that produced it.
+Restoring an entry is a copy of two arrays, whatever the cohort size.
+
+The input fingerprint (AllocationEngine.fingerprint) is a hash of the imported choices and subjects, so entries outlive
+a re-import of the same spreadsheet and never hit for a different one.
+When more than max_entries results are cached, the least recently used one is dropped.
+"""
+
+from collections import OrderedDict
+
+DEFAULT_MAX_ENTRIES = 32
+
+
+class CachedAllocation(object):
+    def __init__(self, number, mode, capacity, rank, allocated, unlucky_students, stats, result):
+        self.number = number  # Configurations are numbered in the order they were first allocated
+        self.mode = mode
+        self.capacity = capacity  # Subject id -> capacity, as a tuple
+        self.rank = rank
+        self.allocated = allocated
+        self.unlucky_students = unlucky_students
+        self.stats = stats
+        self.result = result  # {'1st': ..., '2nd': ..., ... for every choice, 'unallocated': ...}
+
+
+class ResultCache(object):
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()  # Key -> CachedAllocation, least recently used first
+        self.count = 0  # Allocations stored so far, for numbering
+
+    @staticmethod
+    def key(fingerprint, capacity, mode):
+        return fingerprint, tuple(capacity), mode
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.entries.move_to_end(key)
+        return entry
+
+    def store(self, key, engine):
+        # Copy the allocation engine just ran. Returns the CachedAllocation.
+        self.count += 1
+        result = engine.summarize_results()
+        result['unallocated'] = len(engine.unlucky_students)
+        entry = CachedAllocation(self.count, key[2], key[1], engine.rank[:], engine.allocated[:],
+                                 engine.unlucky_students[:], engine.stats, result)
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        return entry
+
+    def configurations(self, fingerprint):
+        # Cached allocations of one input, in the order they were first allocated
+        return sorted((entry for key, entry in self.entries.items() if key[0] == fingerprint), key=lambda entry: entry.number)
+
+    def __len__(self):
+        return len(self.entries)
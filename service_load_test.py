@@ -0,0 +1,145 @@
+"""
+Load test of the allocation service (allocation_service.py).
+
+Sends -n requests for one spreadsheet over -c keep-alive connections at once, and prints the throughput and the latency
+percentiles. The requests cycle through --distinct capacity vectors (the given capacities, then one more seat for a
+different subject each time), so about n - distinct of them are answered from the service's cache. --distinct n
+makes every request a new allocation.
+Without --spawn the service must already run at --port. With --spawn the test starts one on a free port and stops it after.
+
+Usage:
+python service_load_test.py students.csv capacities.csv -n 200 -c 8 --spawn --workers 4
+python service_load_test.py students.csv capacities.csv -n 200 --distinct 200 --port 8765
+"""
+
+import argparse
+import asyncio
+import base64
+import json
+import os
+import subprocess
+import sys
+import time
+
+from allocation_engine import read_capacities
+from allocation_service import DEFAULT_HOST, DEFAULT_PORT
+
+
+def capacity_vectors(capacities, distinct):
+    # distinct capacity dicts: the given one, then one more seat for the subjects in turn
+    subjects = list(capacities)
+    vectors = [dict(capacities)]
+    for i in range(1, distinct):
+        vector = dict(capacities)
+        subject = subjects[(i - 1) % len(subjects)]
+        vector[subject] += 1 + (i - 1) // len(subjects)
+        vectors.append(vector)
+    return vectors
+
+
+def percentile(values, share):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(share * len(values)))]
+
+
+async def post(reader, writer, host, port, path, body):
+    # One request on a keep-alive connection. Returns (status, answer).
+    writer.write(f'POST {path} HTTP/1.1\r\nHost: {host}:{port}\r\nContent-Type: application/json\r\n'
+                 f'Content-Length: {len(body)}\r\n\r\n'.encode('latin-1') + body)
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+    return status, json.loads(await reader.readexactly(int(headers['content-length'])))
+
+
+async def run_connection(host, port, bodies, queue, latencies, outcomes):
+    reader, writer = await asyncio.open_connection(host, port, limit=2 ** 26)
+    try:
+        while not queue.empty():
+            i = queue.get_nowait()
+            start = time.perf_counter()
+            status, answer = await post(reader, writer, host, port, '/allocate', bodies[i % len(bodies)])
+            latencies.append(time.perf_counter() - start)
+            outcomes.append('error' if status != 200 else 'cached' if answer['cached'] else 'allocated')
+    finally:
+        writer.close()
+
+
+async def load_test(host, port, bodies, requests, connections):
+    queue = asyncio.Queue()
+    for i in range(requests):
+        queue.put_nowait(i)
+    latencies, outcomes = [], []
+    start = time.perf_counter()
+    await asyncio.gather(*[run_connection(host, port, bodies, queue, latencies, outcomes) for _ in range(connections)])
+    return time.perf_counter() - start, latencies, outcomes
+
+
+async def wait_until_up(host, port, timeout):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            _, writer = await asyncio.open_connection(host, port)
+            writer.close()
+            return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            await asyncio.sleep(0.1)
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description='Measure the throughput and latency of the allocation service.')
+    parser.add_argument('students', help='Student choices exported from Google Forms (xlsx or csv)')
+    parser.add_argument('capacities', help='Subject capacities (xlsx, csv or json)')
+    parser.add_argument('-n', '--requests', type=int, default=100, help='Requests to send (default 100)')
+    parser.add_argument('-c', '--connections', type=int, default=8, help='Connections sending at once (default 8)')
+    parser.add_argument('--distinct', type=int, default=10, help='Different capacity vectors (default 10)')
+    parser.add_argument('--mode', default='heuristic')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--spawn', action='store_true', help='Start a service for the test and stop it after')
+    parser.add_argument('--workers', type=int, help='Worker processes of a spawned service (default: one per core)')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    with open(args.students, 'rb') as f:
+        students = base64.b64encode(f.read()).decode('ascii')
+    bodies = [json.dumps({'filename': os.path.basename(args.students), 'students': students, 'capacities': vector,
+                          'mode': args.mode}).encode('utf-8')
+              for vector in capacity_vectors(read_capacities(args.capacities), max(1, args.distinct))]
+
+    service = None
+    port = args.port
+    if args.spawn:
+        command = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'allocation_service.py'),
+                   '--port', '0']
+        if args.workers:
+            command += ['--workers', str(args.workers)]
+        service = subprocess.Popen(command, stdout=subprocess.PIPE, text=True)
+        port = int(service.stdout.readline().rsplit(':', 1)[1])  # Serving allocations on http://127.0.0.1:PORT
+    try:
+        asyncio.run(wait_until_up(DEFAULT_HOST, port, 10))
+        seconds, latencies, outcomes = asyncio.run(load_test(DEFAULT_HOST, port, bodies, args.requests, args.connections))
+    finally:
+        if service is not None:
+            service.terminate()  # The service shuts its worker pool down on SIGTERM, see allocation_service.main
+            service.wait()
+
+    print(f'{len(latencies)} requests over {args.connections} connections in {seconds:.2f} s: '
+          f'{len(latencies) / seconds:.1f} requests/s')
+    print(f'Latency: p50 {percentile(latencies, 0.5) * 1000:.0f} ms, p95 {percentile(latencies, 0.95) * 1000:.0f} ms, '
+          f'max {max(latencies) * 1000:.0f} ms')
+    print(', '.join(f'{outcome} {outcomes.count(outcome)}' for outcome in ['allocated', 'cached', 'error']))
+    return 1 if 'error' in outcomes else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,52 @@
+"""
+Startup timing and deferred heavy imports for the desktop app.
+
+main.py only imports Qt and small modules before the window is shown. numpy, pandas and openpyxl (Excel support)
+are imported afterwards by preload, on a background thread, together with allocation_engine which needs them.
+They are usually ready before the first spreadsheet is picked. If not, the import job imports them itself,
+which just waits for the preload to get there.
+
+StartupTimer records how long every startup step took. python main.py --startup-report prints the report as JSON and exits.
+For a per-module breakdown of the imports themselves, use python -X importtime main.py.
+"""
+
+import importlib
+import time
+
+HEAVY_MODULES = ['numpy', 'pandas', 'openpyxl', 'allocation_engine']  # In this order, so each time excludes the ones before
+STARTUP_BUDGET = 1.0  # Seconds from the start of main.py to the first window
+
+
+class StartupTimer(object):
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.last = self.started
+        self.steps = {}  # Step -> seconds since the previous step
+        self.preload_times = {}  # Module -> seconds to import it in the background
+
+    def mark(self, step):
+        now = time.perf_counter()
+        self.steps[step] = now - self.last
+        self.last = now
+
+    def report(self, budget=STARTUP_BUDGET):
+        time_to_window = sum(self.steps.values()) if 'first_window' in self.steps else None
+        return {
+            'steps': {step: round(seconds, 4) for step, seconds in self.steps.items()},
+            'time_to_window': round(time_to_window, 4) if time_to_window is not None else None,
+            'budget': budget,
+            'within_budget': time_to_window is not None and time_to_window <= budget,
+            'preload': {module: round(seconds, 4) for module, seconds in self.preload_times.items()}
+        }
+
+
+def preload(modules=HEAVY_MODULES, report=None):
+    # Import modules one after the other. Returns module -> seconds. Modules that are already imported take no time.
+    times = {}
+    for module in modules:
+        if report is not None:
+            report(f'Loading {module}...')
+        start = time.perf_counter()
+        importlib.import_module(module)
+        times[module] = time.perf_counter() - start
+    return times
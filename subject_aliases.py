@@ -0,0 +1,79 @@
+"""
+Subject canonicalization.
+
+Every spelling of a subject in the student choices is mapped to one canonical subject:
+first through the alias table, then by its normalized name (lower case, single spaces), so that
+"Physics", "physics " and "PHYSICS" end up as the same subject.
+
+Alias files are a spreadsheet (xlsx or csv) whose first two columns are alias and subject, or a JSON object {alias: subject}.
+An alias written as *word* matches every spelling that contains word. Any other alias must match the whole spelling.
+"""
+
+import json
+import os
+
+DEFAULT_KEYWORDS = {
+    'business': 'Business',
+    'environment': 'ESS',
+    'computer': 'ComSci',
+    'self': 'SSSTL'
+}  # English is complex
+
+
+def normalize(subject):
+    return ' '.join(str(subject).lower().split())
+
+
+def read_two_columns(filename):
+    # Key -> value from a JSON object, or from the first two columns of a spreadsheet (xlsx or csv) with a header row
+    import pandas as pd  # Only needed here. Importing it at the top would slow down the app's startup.
+    if filename[-5:] == '.json':
+        with open(filename) as f:
+            return {str(key): value for key, value in json.load(f).items()}
+    elif filename[-5:] == '.xlsx':
+        df = pd.read_excel(filename)
+    elif filename[-4:] == '.csv':
+        df = pd.read_csv(filename)
+    else:
+        raise ValueError(f'File must be xlsx, csv or json: {filename}')
+    return {str(row[0]): row[1] for row in df.iloc[:, :2].itertuples(index=False)}
+
+
+def load_aliases(filename):
+    # Aliases in filename, or only DEFAULT_KEYWORDS if there is no such file
+    if os.path.exists(filename):
+        return SubjectAliases.from_file(filename)
+    return SubjectAliases()
+
+
+class SubjectAliases(object):
+    def __init__(self, aliases=None):
+        # aliases: Key = alias. Value = canonical subject. User aliases are tried before DEFAULT_KEYWORDS.
+        self.exact = {}  # Normalized alias -> subject
+        self.keywords = {}  # Keyword -> subject, tried in order
+        for alias, subject in (aliases or {}).items():
+            alias = normalize(alias)
+            if len(alias) > 2 and alias[0] == '*' and alias[-1] == '*':
+                self.keywords[alias[1:-1]] = str(subject).strip()
+            else:
+                self.exact[alias] = str(subject).strip()
+        for keyword, subject in DEFAULT_KEYWORDS.items():
+            self.keywords.setdefault(keyword, subject)
+
+    @classmethod
+    def from_file(cls, filename):
+        return cls(read_two_columns(filename))
+
+    def fingerprint(self):
+        # Text that only changes when the mapping changes, for the import cache key
+        return json.dumps([sorted(self.exact.items()), list(self.keywords.items())])
+
+    def canonical(self, spelling):
+        # Subject a spelling stands for. Only called once per distinct spelling, so the keyword loop stays cheap.
+        key = normalize(spelling)
+        if key in self.exact:
+            return self.exact[key]
+        for keyword, subject in self.keywords.items():
+            if keyword in key:
+                return subject
+        return str(spelling).strip()
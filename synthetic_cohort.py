@@ -0,0 +1,160 @@
+"""
+Synthetic cohorts for benchmarking.
+
+Writes spreadsheets shaped like the Google Forms export the app imports (Timestamp, Email address, Name, 1st, 2nd, 3rd choice),
+with N students, S subjects and 3 choices per student, or any other number of choices. Subject popularity follows a Zipf law: the k-th most popular subject is chosen
+in proportion to 1 / k ** zipf. Some rows can be made messy on purpose:
+duplicate_rate repeats a choice, invalid_rate leaves a choice blank, variant_rate changes case and spacing of a subject name,
+and name_duplicate_rate reuses the name of an earlier student.
+With several schools, every school has its own subjects, so the cohort splits into independent groups of students.
+
+Usage:
+python synthetic_cohort.py cohort.csv -n 5000 -s 40 --capacities capacities.csv
+python synthetic_cohort.py cohort.csv -n 5000 -s 40 --schools 8
+python synthetic_cohort.py cohort.csv -n 5000 -s 40 --choices 5
+"""
+
+import argparse
+import sys
+
+import numpy as np
+import pandas as pd
+
+from allocation_engine import rank_labels
+
+IB_SUBJECTS = [
+    'Biology', 'Chemistry', 'Physics', 'Computer Science', 'Business Management', 'Economics', 'History', 'Geography',
+    'Psychology', 'Philosophy', 'Global Politics', 'Mathematics', 'English A Literature', 'English A Language and Literature',
+    'Chinese A Literature', 'Spanish B', 'French B', 'German B', 'Visual Arts', 'Music', 'Theatre', 'Film',
+    'Environmental Systems and Societies', 'Sports Exercise and Health Science', 'Design Technology', 'World Studies',
+    'Social and Cultural Anthropology', 'Self-taught Literature', 'Classical Languages', 'Dance'
+]
+
+
+def subject_list(subject_num):
+    return [IB_SUBJECTS[i] if i < len(IB_SUBJECTS) else f'Subject {i + 1}' for i in range(subject_num)]
+
+
+def school_subject_list(subject_num, school):
+    # Names no keyword alias matches, so the subjects of different schools never merge
+    return [f'School {school + 1} subject {i + 1}' for i in range(subject_num)]
+
+
+def popularity(subject_num, zipf):
+    weights = 1 / np.arange(1, subject_num + 1) ** zipf
+    return weights / weights.sum()
+
+
+def generate_cohort(student_num, subject_num, zipf=1.0, duplicate_rate=0.02, invalid_rate=0.01, variant_rate=0.02,
+                    name_duplicate_rate=0.005, seed=0, subject_names=None, choice_num=3):
+    # Returns the cohort as a dataframe in the Google Forms layout. The same arguments always give the same cohort.
+    # subject_names: the subject_num subject names, by default subject_list(subject_num)
+    if subject_num < choice_num:
+        raise ValueError(f'At least {choice_num} subjects are needed for {choice_num} different choices')
+    rng = np.random.default_rng(seed)
+    subjects = np.array(subject_names if subject_names is not None else subject_list(subject_num), dtype=object)
+
+    # choice_num different choices per student, weighted by popularity: the top choice_num of log(weight) + Gumbel noise
+    keys = np.log(popularity(subject_num, zipf)) + rng.gumbel(size=(student_num, subject_num))
+    picks = np.argsort(-keys, axis=1)[:, :choice_num]
+
+    # Repeat a choice: a choice after the 1st becomes a copy of the one before
+    repeated = np.flatnonzero(rng.random(student_num) < duplicate_rate) if choice_num > 1 else np.array([], dtype=int)
+    column = rng.integers(1, choice_num, size=len(repeated))
+    picks[repeated, column] = picks[repeated, column - 1]
+
+    choices = subjects[picks]
+    # Name variations: lower or upper case, stray spaces
+    variants = rng.random(choices.shape) < variant_rate
+    for row, col in zip(*np.nonzero(variants)):
+        subject = choices[row, col]
+        choices[row, col] = [subject.lower(), subject.upper(), f' {subject} ', subject.replace(' ', '  ')][rng.integers(4)]
+    # Blank choices
+    choices[rng.random(choices.shape) < invalid_rate] = None
+
+    names = np.array([f'Student {i + 1}' for i in range(student_num)], dtype=object)
+    reused = np.flatnonzero(rng.random(student_num) < name_duplicate_rate)
+    reused = reused[reused > 0]
+    names[reused] = names[rng.integers(0, reused)]  # Each reuses the name of a random earlier student
+
+    start = pd.Timestamp('2023-05-01 08:00:00')
+    timestamps = start + pd.to_timedelta(np.sort(rng.integers(0, 14 * 24 * 3600, size=student_num)), unit='s')
+    df = pd.DataFrame({
+        'Timestamp': timestamps.strftime('%Y/%m/%d %I:%M:%S %p'),
+        'Email address': [f'student{i + 1}@school.edu' for i in range(student_num)],
+        'Name': names
+    })
+    for rank, label in enumerate(rank_labels(choice_num)):
+        df[f'{label} Choice'] = choices[:, rank]
+    return df
+
+
+def generate_schools(school_num, student_num, subject_num, zipf=1.0, seed=0, choice_num=3):
+    # school_num cohorts of student_num students each, one after the other. Every school has its own subject_num subjects.
+    schools = [generate_cohort(student_num, subject_num, zipf, seed=seed + school, choice_num=choice_num,
+                               subject_names=school_subject_list(subject_num, school)) for school in range(school_num)]
+    return pd.concat(schools, ignore_index=True)
+
+
+def generate_capacities(student_num, subject_num, zipf=1.0, slack=1.05, subject_names=None):
+    # Capacities that add up to about slack * student_num. They follow the square root of the popularity,
+    # so popular subjects run out and the swap algorithms have work to do.
+    share = np.sqrt(popularity(subject_num, zipf))
+    capacity = np.ceil(share / share.sum() * student_num * slack).astype(int)
+    return dict(zip(subject_names if subject_names is not None else subject_list(subject_num), capacity.tolist()))
+
+
+def generate_school_capacities(school_num, student_num, subject_num, zipf=1.0):
+    capacities = {}
+    for school in range(school_num):
+        capacities.update(generate_capacities(student_num, subject_num, zipf,
+                                              subject_names=school_subject_list(subject_num, school)))
+    return capacities
+
+
+def write_df(df, filename):
+    if filename[-5:] == '.xlsx':
+        df.to_excel(filename, index=False)
+    elif filename[-4:] == '.csv':
+        df.to_csv(filename, index=False)
+    else:
+        raise ValueError(f'File must be xlsx or csv: {filename}')
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description='Write a synthetic cohort in the Google Forms layout.')
+    parser.add_argument('output', help='Cohort file (xlsx or csv)')
+    parser.add_argument('-n', '--students', type=int, default=1000, help='Number of students (default 1000)')
+    parser.add_argument('-s', '--subjects', type=int, default=30, help='Number of subjects (default 30)')
+    parser.add_argument('-k', '--choices', type=int, default=3, help='Ranked choices per student (default 3)')
+    parser.add_argument('--zipf', type=float, default=1.0, help='Zipf exponent of subject popularity (default 1.0)')
+    parser.add_argument('--duplicate-rate', type=float, default=0.02, help='Share of students repeating a choice')
+    parser.add_argument('--invalid-rate', type=float, default=0.01, help='Share of choices left blank')
+    parser.add_argument('--variant-rate', type=float, default=0.02, help='Share of choices with odd case or spacing')
+    parser.add_argument('--name-duplicate-rate', type=float, default=0.005, help='Share of students reusing an earlier name')
+    parser.add_argument('--schools', type=int, default=1,
+                        help='Number of schools with their own subjects, each with --students students (default 1)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--capacities', metavar='FILE', help='Also write matching capacities (xlsx or csv)')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.schools > 1:
+        df = generate_schools(args.schools, args.students, args.subjects, args.zipf, args.seed, args.choices)
+    else:
+        df = generate_cohort(args.students, args.subjects, args.zipf, args.duplicate_rate, args.invalid_rate,
+                             args.variant_rate, args.name_duplicate_rate, args.seed, choice_num=args.choices)
+    write_df(df, args.output)
+    if args.capacities:
+        if args.schools > 1:
+            capacities = generate_school_capacities(args.schools, args.students, args.subjects, args.zipf)
+        else:
+            capacities = generate_capacities(args.students, args.subjects, args.zipf)
+        write_df(pd.DataFrame({'Subject': list(capacities), 'Capacity': list(capacities.values())}), args.capacities)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
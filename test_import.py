@@ -0,0 +1,59 @@
+"""
+Regression cases for importing spreadsheets. Run with python -m pytest.
+"""
+
+from openpyxl import Workbook
+from openpyxl.styles import Font
+
+from allocation_engine import AllocationEngine
+
+HEADER = ['Timestamp', 'Name', '1st', '2nd', '3rd']
+STUDENTS = [['2024-01-01', 'Ann', 'Biology', 'Physics', 'Chemistry'],
+            ['2024-01-02', 'Ben', 'Physics', 'Biology', 'History'],
+            ['2024-01-03', 'Cleo', 'History', 'Chemistry', 'Biology']]
+
+
+def write_xlsx(filename, rows, formatted=()):
+    # formatted: cells given a bold font without a value, which widens the used range of the sheet
+    workbook = Workbook()
+    sheet = workbook.active
+    for row in rows:
+        sheet.append(row)
+    for cell in formatted:
+        sheet[cell].font = Font(bold=True)
+    workbook.save(filename)
+    return str(filename)
+
+
+def test_xlsx_used_range_wider_than_data(tmp_path):
+    filename = write_xlsx(tmp_path / 'wide.xlsx', [HEADER] + STUDENTS, formatted=['H1', 'G3', 'J8'])
+    for chunk_size in (1, 2, 10):
+        engine = AllocationEngine()
+        assert engine.import_file(filename, chunk_size)
+        assert engine.choice_num == 3
+        assert list(engine.names) == ['Ann', 'Ben', 'Cleo']
+        assert engine.choice_labels() == ['1st', '2nd', '3rd']
+
+
+def write_csv(filename, lines):
+    with open(filename, 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+    return str(filename)
+
+
+def test_csv_trailing_commas_are_not_choices(tmp_path):
+    lines = [','.join(HEADER) + ',,'] + [','.join(row) + ',,' for row in STUDENTS]
+    filename = write_csv(tmp_path / 'commas.csv', lines)
+    for chunk_size in (1, 10):
+        engine = AllocationEngine()
+        assert engine.import_file(filename, chunk_size)
+        assert engine.choice_num == 3
+        engine.allocate({'Biology': 1, 'Physics': 1, 'History': 1})
+        assert list(engine.form_result_df().columns) == ['Name', 'Allocated Choice', '1st Choice', '2nd Choice', '3rd Choice']
+
+
+def test_csv_answers_without_header_are_refused(tmp_path, capsys):
+    lines = [','.join(HEADER) + ','] + [','.join(row) + ',' for row in STUDENTS[:2]] + [','.join(STUDENTS[2]) + ',Music']
+    filename = write_csv(tmp_path / 'unnamed.csv', lines)
+    assert not AllocationEngine().import_file(filename, 1)
+    assert 'Column 6 has answers but no header' in capsys.readouterr().out
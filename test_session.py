@@ -0,0 +1,35 @@
+"""
+Regression cases for AllocationSession. Run with python -m pytest.
+"""
+
+import threading
+
+from allocation_session import AllocationSession
+from test_import import HEADER, STUDENTS, write_csv
+
+CAPACITIES = {'Biology': 1, 'Physics': 1, 'History': 1}
+
+
+def test_check_returns_while_an_allocation_runs(tmp_path):
+    session = AllocationSession()
+    assert session.import_file(write_csv(tmp_path / 'cohort.csv', [','.join(row) for row in [HEADER] + STUDENTS]))
+    running, finish = threading.Event(), threading.Event()
+
+    def progress(message):
+        # Holds the allocation, and so the session lock, until the check is done
+        running.set()
+        finish.wait(10)
+    allocation = threading.Thread(target=session.allocate, args=(CAPACITIES, 'heuristic', progress))
+    allocation.start()
+    try:
+        assert running.wait(10)
+        checked = []
+        check = threading.Thread(target=lambda: checked.append(session.check_capacities(CAPACITIES)))
+        check.start()
+        check.join(5)
+        assert checked and checked[0]['placed'] == 3
+        assert not session.allocated
+    finally:
+        finish.set()
+        allocation.join()
+    assert session.allocated